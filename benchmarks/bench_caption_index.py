@@ -0,0 +1,164 @@
+"""
+Frame throughput of caption lookup + blitting for growing cue counts.
+
+Compares the interval-indexed CaptionRenderer against a linear scan over all
+cues (what CompositeVideoClip effectively does per frame) and, optionally,
+MoviePy's CompositeVideoClip itself. Uses synthetic sprites, so no fonts or
+video files are needed.
+
+    python benchmarks/bench_caption_index.py
+    python benchmarks/bench_caption_index.py --cues 100 1000 10000 --composite --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np  # noqa: E402
+
+from caption_render import CaptionRenderer, Sprite  # noqa: E402
+
+CUE_SECONDS = 0.4  # roughly one word-highlight cue
+FPS = 30
+
+
+class StaticSpriteCache:
+    """Stands in for SpriteCache: every text run gets the same synthetic sprite."""
+
+    def __init__(self, width, height):
+        self.rgb = np.full((height, width, 3), 240, dtype=np.uint8)
+        self.alpha = np.zeros((height, width))
+        self.alpha[height // 4 : 3 * height // 4, width // 8 : 7 * width // 8] = 1.0
+        self.sprite = Sprite(self.rgb, self.alpha, 0, 0)
+
+    def get(self, text, params):
+        return self.sprite
+
+
+class LinearScanRenderer(CaptionRenderer):
+    """Baseline: check every cue's start/end on every frame."""
+
+    def layers_at(self, t):
+        layers = []
+        for start, end, cue_layers in self.cues:
+            if start <= t < end:
+                layers.extend(cue_layers)
+        return layers
+
+
+def synthetic_captions(count):
+    return [
+        {
+            "start": i * CUE_SECONDS,
+            "end": (i + 1) * CUE_SECONDS,
+            "text": f"line {i // 4}",
+            "highlighted_word_line": f"word {i}",
+        }
+        for i in range(count)
+    ]
+
+
+def synthetic_style(width, height):
+    params = {"size": (width, int(height * 0.26))}
+    return {"defaults": {}, "caption": params, "highlight": params, "top": int(height * 0.365)}
+
+
+def sample_times(count, frames):
+    """frames consecutive frame times from 10 windows spread over the timeline."""
+    duration = count * CUE_SECONDS
+    windows = 10
+    per_window = max(1, frames // windows)
+    times = []
+    for w in range(windows):
+        t0 = duration * w / windows
+        times.extend(t0 + i / FPS for i in range(per_window))
+    return times
+
+
+def measure(renderer, times, frame):
+    get_frame = lambda t: frame  # noqa: E731
+    start = time.perf_counter()
+    for t in times:
+        renderer(get_frame, t)
+    elapsed = time.perf_counter() - start
+    return len(times) / elapsed if elapsed else float("inf")
+
+
+def measure_composite(captions, cache, style, size, times):
+    from moviepy import ColorClip, CompositeVideoClip, ImageClip
+
+    rgb, alpha = cache.rgb, cache.alpha
+    layers = []
+    for caption in captions:
+        for _ in range(2):
+            clip = (
+                ImageClip(rgb)
+                .with_mask(ImageClip(alpha, is_mask=True))
+                .with_start(caption["start"])
+                .with_duration(caption["end"] - caption["start"])
+                .with_position(("center", style["top"]))
+            )
+            layers.append(clip)
+    background = ColorClip(size, color=(20, 20, 20)).with_duration(captions[-1]["end"])
+    composite = CompositeVideoClip([background, *layers])
+    start = time.perf_counter()
+    for t in times:
+        composite.get_frame(t)
+    elapsed = time.perf_counter() - start
+    return len(times) / elapsed if elapsed else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cues", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--frames", type=int, default=600, help="Frames timed per run")
+    parser.add_argument("--width", type=int, default=540)
+    parser.add_argument("--height", type=int, default=960)
+    parser.add_argument(
+        "--composite",
+        action="store_true",
+        help="Also time MoviePy's CompositeVideoClip (slow for large cue counts)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    size = (args.width, args.height)
+    style = synthetic_style(*size)
+    cache = StaticSpriteCache(args.width, style["caption"]["size"][1] // 2)
+    frame = np.full((args.height, args.width, 3), 20, dtype=np.uint8)
+
+    results = []
+    for count in args.cues:
+        captions = synthetic_captions(count)
+        times = sample_times(count, args.frames)
+        row = {
+            "cues": count,
+            "frames": len(times),
+            "indexed_fps": measure(CaptionRenderer(captions, style, size, cache), times, frame),
+            "linear_fps": measure(LinearScanRenderer(captions, style, size, cache), times, frame),
+        }
+        if args.composite:
+            composite_times = times[: max(10, len(times) // 10)]
+            row["composite_fps"] = measure_composite(captions, cache, style, size, composite_times)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    header = f"{'cues':>8} {'indexed fps':>12} {'linear fps':>12}"
+    if args.composite:
+        header += f" {'composite fps':>14}"
+    print(header)
+    for row in results:
+        line = f"{row['cues']:>8} {row['indexed_fps']:>12.1f} {row['linear_fps']:>12.1f}"
+        if args.composite:
+            line += f" {row['composite_fps']:>14.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Frames/sec of caption compositing: the integer compositor in CaptionRenderer
+against the float32 blend it replaced and MoviePy's CompositeVideoClip.
+
+Each frame draws one caption line plus its word highlight onto a read-only
+frame (like the ones the decoder returns), with synthetic glyph-like sprites
+(anti-aliased edges, partly transparent), so no fonts or video files are
+needed. Also prints the largest per-pixel difference from the float blend.
+
+    python benchmarks/bench_compositor.py
+    python benchmarks/bench_compositor.py --sizes 720x1280 1080x1920 --frames 300 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np  # noqa: E402
+
+from caption_render import CaptionRenderer, Sprite  # noqa: E402
+
+CUE_SECONDS = 0.4
+FPS = 30
+
+
+def glyph_alpha(height, width, seed=0):
+    """Rows of letter-sized boxes with soft edges, about half the box covered."""
+    rng = np.random.default_rng(seed)
+    alpha = np.zeros((height, width), dtype=np.float32)
+    glyph_width = max(4, height // 2)
+    for x in range(0, width - glyph_width, int(glyph_width * 1.2)):
+        top = int(rng.integers(0, max(1, height // 4)))
+        alpha[top : height - 2, x : x + glyph_width] = 1.0
+    # Two passes of a box blur for anti-aliased edges
+    for _ in range(2):
+        alpha[1:-1, 1:-1] = (
+            alpha[:-2, 1:-1] + alpha[2:, 1:-1] + alpha[1:-1, :-2] + alpha[1:-1, 2:] + alpha[1:-1, 1:-1]
+        ) / 5
+    return alpha
+
+
+class SyntheticSpriteCache:
+    """Stands in for SpriteCache: the caption line and the highlight get fixed sprites."""
+
+    def __init__(self, width, height):
+        alpha = glyph_alpha(height, width)
+        self.alpha = alpha
+        self.colors = {"caption": (248, 239, 186), "highlight": (249, 127, 81)}
+        self.sprites = {
+            name: Sprite(np.full((height, width, 3), color, dtype=np.uint8), alpha, 0, 0)
+            for name, color in self.colors.items()
+        }
+
+    def get(self, text, params):
+        return self.sprites[params["layer"]]
+
+
+class FloatBlendRenderer(CaptionRenderer):
+    """The previous blend: float32 premultiplied color and 1 - alpha, new arrays per frame."""
+
+    def __init__(self, captions, style, video_size, cache):
+        super().__init__(captions, style, video_size, cache)
+        alpha = cache.alpha.astype(np.float32)[..., None]
+        self.float_layers = {
+            id(sprite): (
+                np.full(alpha.shape[:2] + (3,), cache.colors[name], dtype=np.float32) * alpha,
+                1.0 - alpha,
+            )
+            for name, sprite in cache.sprites.items()
+        }
+
+    def draw(self, frame, layers):
+        frame = frame.copy()
+        for sprite, x, y in layers:
+            premultiplied, inverse_alpha = self.float_layers[id(sprite)]
+            region = frame[y : y + sprite.height, x : x + sprite.width]
+            blended = premultiplied + region * inverse_alpha
+            region[...] = np.clip(blended, 0, 255).astype(np.uint8)
+        return frame
+
+
+def synthetic_captions(count):
+    return [
+        {
+            "start": i * CUE_SECONDS,
+            "end": (i + 1) * CUE_SECONDS,
+            "text": f"line {i // 4}",
+            "highlighted_word_line": f"word {i}",
+        }
+        for i in range(count)
+    ]
+
+
+def synthetic_style(width, height):
+    size = (width, int(height * 0.26))
+    return {
+        "defaults": {},
+        "caption": {"size": size, "layer": "caption"},
+        "highlight": {"size": size, "layer": "highlight"},
+        "top": int(height * 0.365),
+    }
+
+
+def measure(renderer, frame, frames):
+    get_frame = lambda t: frame  # noqa: E731
+    times = [i / FPS for i in range(frames)]
+    renderer(get_frame, 0.0)  # warm-up
+    start = time.perf_counter()
+    for t in times:
+        renderer(get_frame, t)
+    elapsed = time.perf_counter() - start
+    return len(times) / elapsed if elapsed else float("inf")
+
+
+def measure_composite(captions, cache, style, size, frame, frames):
+    from moviepy import CompositeVideoClip, ImageClip
+
+    layers = []
+    for caption in captions:
+        for name in ("caption", "highlight"):
+            sprite = cache.sprites[name]
+            clip = (
+                ImageClip(np.full(sprite.premultiplied.shape, cache.colors[name], dtype=np.uint8))
+                .with_mask(ImageClip(cache.alpha, is_mask=True))
+                .with_start(caption["start"])
+                .with_duration(caption["end"] - caption["start"])
+                .with_position(("center", style["top"]))
+            )
+            layers.append(clip)
+    background = ImageClip(frame).with_duration(captions[-1]["end"])
+    composite = CompositeVideoClip([background, *layers], size=size)
+    times = [i / FPS for i in range(frames)]
+    start = time.perf_counter()
+    for t in times:
+        composite.get_frame(t)
+    elapsed = time.perf_counter() - start
+    return len(times) / elapsed if elapsed else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["540x960", "1080x1920"], help="WIDTHxHEIGHT")
+    parser.add_argument("--frames", type=int, default=300, help="Frames timed per run")
+    parser.add_argument(
+        "--composite",
+        action="store_true",
+        help="Also time MoviePy's CompositeVideoClip (slow)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    captions = synthetic_captions(max(1, int(args.frames / FPS / CUE_SECONDS) + 1))
+    for size_text in args.sizes:
+        width, height = (int(v) for v in size_text.lower().split("x"))
+        style = synthetic_style(width, height)
+        cache = SyntheticSpriteCache(width, style["caption"]["size"][1] // 2)
+        rng = np.random.default_rng(1)
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        frame.flags.writeable = False
+
+        uint8_renderer = CaptionRenderer(captions, style, (width, height), cache)
+        float_renderer = FloatBlendRenderer(captions, style, (width, height), cache)
+        layers = uint8_renderer.layers_at(0.0)
+        difference = np.abs(
+            uint8_renderer.draw(frame, layers).astype(np.int16)
+            - float_renderer.draw(frame, layers).astype(np.int16)
+        ).max()
+        row = {
+            "size": size_text,
+            "frames": args.frames,
+            "uint8_fps": measure(uint8_renderer, frame, args.frames),
+            "float_fps": measure(float_renderer, frame, args.frames),
+            "max_difference": int(difference),
+        }
+        if args.composite:
+            composite_frames = max(10, args.frames // 10)
+            row["composite_fps"] = measure_composite(
+                captions, cache, style, (width, height), frame, composite_frames
+            )
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    header = f"{'size':>10} {'uint8 fps':>10} {'float fps':>10} {'max diff':>9}"
+    if args.composite:
+        header += f" {'composite fps':>14}"
+    print(header)
+    for row in results:
+        line = (
+            f"{row['size']:>10} {row['uint8_fps']:>10.1f} {row['float_fps']:>10.1f}"
+            f" {row['max_difference']:>9}"
+        )
+        if args.composite:
+            line += f" {row['composite_fps']:>14.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
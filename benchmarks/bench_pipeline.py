@@ -0,0 +1,430 @@
+"""
+Wall time, realtime factor, frames/sec and peak RSS per caption pipeline stage.
+
+Everything runs offline on synthetic inputs: colour-bar videos with a
+speech-like tone track (syllable-rate bursts and pauses) made with ffmpeg's
+lavfi sources, and generated VTT / edit transcript files with a given number
+of cues. Each measurement runs in a fresh process with empty caches, so peak
+RSS is per stage and nothing is reused between runs. Whisper is only timed
+with --whisper (the tiny model by default).
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --durations 10 60 --resolutions 720x1280 --output bench.json
+    python benchmarks/bench_pipeline.py --whisper --output new.json --baseline old.json
+    python benchmarks/bench_pipeline.py --stages overlay_captions --backends moviepy ffmpeg
+    python benchmarks/bench_pipeline.py --stages overlay_captions --rotated --durations 5
+
+Render stages fail when the output size isn't the source's display size
+under the profile (e.g. a rotated phone clip rendered sideways or stretched).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from ffmpeg_tools import ffmpeg_exe, run_ffmpeg  # noqa: E402
+
+FPS = 30
+CUE_SECONDS = 0.4  # roughly one word-highlight cue
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel"]
+# Pitch glide carried by syllable-rate (4 Hz) bursts, silent for 0.4 s every 2.5 s
+SPEECH_EXPR = (
+    "0.4*sin(2*PI*(150+50*sin(2*PI*0.5*t))*t)"
+    "*pow(sin(PI*4*t),2)*gt(mod(t,2.5),0.4)"
+)
+STAGES = ("parse_vtt", "compute_cut_ranges", "overlay_captions", "render_video_with_cuts")
+
+
+def make_video(path, duration, width, height, rotated=False):
+    """
+    Colour bars (with per-frame noise, so frames differ) plus speech-like
+    audio. rotated stores the frames as height x width with a 90 degree
+    display rotation, as phones record portrait video.
+    """
+    if rotated:
+        stored = make_video(f"{path}.stored.mp4", duration, height, width)
+        run_ffmpeg(["-display_rotation:v:0", "90", "-i", stored, "-c", "copy", path])
+        os.remove(stored)
+        return path
+    run_ffmpeg(
+        [
+            "-f", "lavfi",
+            "-i", f"smptebars=size={width}x{height}:rate={FPS}:duration={duration}",
+            "-f", "lavfi",
+            "-i", f"aevalsrc='{SPEECH_EXPR}':s=44100:d={duration}",
+            "-vf", "noise=alls=12:allf=t",
+            "-c:v", "libx264",
+            "-preset", "ultrafast",
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-shortest",
+            path,
+        ]
+    )
+    return path
+
+
+def vtt_timestamp(seconds):
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}"
+
+
+def write_vtt(path, cues):
+    """Whisper-style highlight VTT: four-word lines, one word underlined per cue."""
+    lines = ["WEBVTT", ""]
+    for i in range(cues):
+        words = [WORDS[(i // 4 * 4 + j) % len(WORDS)] for j in range(4)]
+        words[i % 4] = f"<u>{words[i % 4]}</u>"
+        start = i * CUE_SECONDS
+        lines += [
+            f"{vtt_timestamp(start)} --> {vtt_timestamp(start + CUE_SECONDS)}",
+            " ".join(words),
+            "",
+        ]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    return path
+
+
+def write_transcript(path, segments):
+    """Edit transcript of alternating words and short silences."""
+    from transcript_store import write_transcript as write_columnar
+
+    items, t = [], 0.0
+    for i in range(segments):
+        is_word = i % 4 != 3
+        length = CUE_SECONDS if is_word else 0.15
+        items.append(
+            {
+                "id": i,
+                "type": "word" if is_word else "silence",
+                "text": WORDS[i % len(WORDS)] if is_word else "...",
+                "start": round(t, 3),
+                "end": round(t + length, 3),
+            }
+        )
+        t += length
+    return write_columnar(path, items, round(t, 3))
+
+
+def deleted_ids(segments):
+    """Every silence plus every fifth word: many small, partly adjacent cuts."""
+    return [s["id"] for s in segments if s["type"] == "silence" or s["id"] % 5 == 0]
+
+
+def _time_calls(fn, min_seconds=0.2):
+    """Seconds per call of fn, repeating until min_seconds have passed."""
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def stage_parse_vtt(vtt_path, cues):
+    from vtt import iter_cues
+
+    # Uncached parse; load_captions reuses the result until the file changes
+    seconds = _time_calls(lambda: tuple(iter_cues(vtt_path)))
+    return {"wall_seconds": seconds, "cues_per_second": cues / seconds}
+
+
+def stage_compute_cut_ranges(transcript_path, segments):
+    from transcript_edit import compute_cut_ranges
+    from transcript_store import load_transcript
+
+    transcript = load_transcript(transcript_path)
+    ids = deleted_ids(transcript.segments())
+    seconds = _time_calls(lambda: compute_cut_ranges(transcript, ids))
+    return {"wall_seconds": seconds, "segments_per_second": segments / seconds}
+
+
+def _render_metrics(seconds, media_seconds, video_path, profile, output_path):
+    from media_cache import probe_file
+    from render_profiles import scaled_size
+
+    source, output = probe_file(video_path), probe_file(output_path)
+    expected = scaled_size(source["width"], source["height"], profile)
+    if (output["width"], output["height"]) != expected:
+        raise RuntimeError(
+            f"output is {output['width']}x{output['height']}, expected {expected[0]}x{expected[1]}"
+        )
+    frames = round(output["duration"] * (output["fps"] or FPS))
+    return {
+        "wall_seconds": seconds,
+        "realtime_factor": seconds / media_seconds,
+        "fps": frames / seconds,
+        "output_width": output["width"],
+        "output_height": output["height"],
+    }
+
+
+def stage_overlay_captions(video_path, duration, profile, backend, output_path):
+    from overlay_captions import overlay_captions
+
+    start = time.perf_counter()
+    overlay_captions(video_path, output_path, logger=None, profile=profile, backend=backend)
+    return _render_metrics(time.perf_counter() - start, duration, video_path, profile, output_path)
+
+
+def stage_render_video_with_cuts(
+    video_path, transcript_path, duration, profile, backend, output_path
+):
+    from transcript_edit import compute_cut_ranges, render_video_with_cuts
+    from transcript_store import load_transcript
+
+    transcript = load_transcript(transcript_path)
+    cut_ranges = compute_cut_ranges(transcript, deleted_ids(transcript.segments()))
+    start = time.perf_counter()
+    render_video_with_cuts(
+        video_path, output_path, cut_ranges, logger=None, profile=profile, backend=backend
+    )
+    metrics = _render_metrics(
+        time.perf_counter() - start, duration, video_path, profile, output_path
+    )
+    metrics["cut_ranges"] = len(cut_ranges)
+    return metrics
+
+
+def stage_generate_captions(video_path, duration, model, output_dir):
+    from generate_captions import generate_captions
+    from model_cache import get_model
+
+    start = time.perf_counter()
+    get_model(model)
+    loaded = time.perf_counter()
+    generate_captions(
+        video_path, model_name=model, chunked=False, output_dir=output_dir, use_proxy=False
+    )
+    seconds = time.perf_counter() - loaded
+    return {
+        "wall_seconds": seconds,
+        "realtime_factor": seconds / duration,
+        "model_load_seconds": loaded - start,
+    }
+
+
+STAGE_FUNCTIONS = {
+    "parse_vtt": stage_parse_vtt,
+    "compute_cut_ranges": stage_compute_cut_ranges,
+    "overlay_captions": stage_overlay_captions,
+    "render_video_with_cuts": stage_render_video_with_cuts,
+    "generate_captions": stage_generate_captions,
+}
+
+
+def _run_stage(stage, params, cache_dir):
+    """Runs in a fresh process: empty caches under cache_dir, peak RSS of this stage only."""
+    import artifact_store
+    import media_cache
+
+    artifact_store.ARTIFACT_FOLDER = os.path.join(cache_dir, "artifacts")
+    media_cache.MEDIA_CACHE_FOLDER = os.path.join(cache_dir, "media")
+    media_cache.HASH_INDEX_FOLDER = os.path.join(cache_dir, "hashes")
+
+    metrics = STAGE_FUNCTIONS[stage](**params)
+    # ru_maxrss is in KiB on Linux; children are ffmpeg processes
+    metrics["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    metrics["peak_child_rss_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return metrics
+
+
+def measure(stage, params, workdir):
+    cache_dir = tempfile.mkdtemp(prefix="cache-", dir=workdir)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            return pool.submit(_run_stage, stage, params, cache_dir).result()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SRC_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    ffmpeg_version = subprocess.run(
+        [ffmpeg_exe(), "-version"], capture_output=True, text=True
+    ).stdout.split("\n", 1)[0]
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+    }
+
+
+def plan_runs(args, workdir):
+    """(stage, params shown in the report, stage kwargs) for every measurement."""
+    runs = []
+    for cues in args.cues:
+        if "parse_vtt" in args.stages:
+            path = write_vtt(os.path.join(workdir, f"cues_{cues}.vtt"), cues)
+            runs.append(("parse_vtt", {"cues": cues}, {"vtt_path": path, "cues": cues}))
+        if "compute_cut_ranges" in args.stages:
+            path = write_transcript(os.path.join(workdir, f"segments_{cues}.bin"), cues)
+            params = {"transcript_path": path, "segments": cues}
+            runs.append(("compute_cut_ranges", {"segments": cues}, params))
+
+    renders = [s for s in ("overlay_captions", "render_video_with_cuts") if s in args.stages]
+    for duration in args.durations:
+        sources = [(r, rotated) for r in args.resolutions for rotated in (False, args.rotated)]
+        for (width, height), rotated in dict.fromkeys(sources) if renders else ():
+            name = f"bars_{duration}s_{width}x{height}" + ("_rotated" if rotated else "")
+            video = make_video(
+                os.path.join(workdir, f"{name}.mp4"), duration, width, height, rotated
+            )
+            cues = int(duration / CUE_SECONDS)
+            write_vtt(os.path.join(workdir, f"{name}.vtt"), cues)
+            transcript = write_transcript(os.path.join(workdir, f"{name}_transcript.bin"), cues)
+            for backend in args.backends:
+                shown = {
+                    "duration": duration,
+                    "resolution": f"{width}x{height}",
+                    **({"rotated": True} if rotated else {}),
+                    "profile": args.profile,
+                    "backend": backend,
+                }
+                common = {
+                    "video_path": video,
+                    "duration": duration,
+                    "profile": args.profile,
+                    "backend": backend,
+                }
+                if "overlay_captions" in renders:
+                    out = os.path.join(workdir, f"{name}_{backend}_captioned.mp4")
+                    runs.append(("overlay_captions", shown, {**common, "output_path": out}))
+                if "render_video_with_cuts" in renders:
+                    out = os.path.join(workdir, f"{name}_{backend}_cut.mp4")
+                    params = {**common, "transcript_path": transcript, "output_path": out}
+                    runs.append(("render_video_with_cuts", shown, params))
+        if args.whisper:
+            video = make_video(os.path.join(workdir, f"speech_{duration}s.mp4"), duration, 320, 180)
+            shown = {"duration": duration, "model": args.whisper_model}
+            params = {**shown, "video_path": video, "output_dir": workdir}
+            runs.append(("generate_captions", shown, params))
+    return runs
+
+
+def print_table(results, baseline=None):
+    previous = {}
+    for row in (baseline or {}).get("results", []):
+        previous[(row["stage"], json.dumps(row["params"], sort_keys=True))] = row
+
+    header = f"{'stage':<24} {'params':<64} {'wall s':>12} {'rtf':>7} {'fps':>8} {'rss MB':>8}"
+    print(header + (f" {'vs base':>8}" if baseline else ""))
+    for row in results:
+        params = ", ".join(f"{k}={v}" for k, v in row["params"].items())
+        if "error" in row:
+            print(f"{row['stage']:<24} {params:<64} ERROR {row['error']}")
+            continue
+        rtf = f"{row['realtime_factor']:.3f}" if "realtime_factor" in row else "-"
+        fps = f"{row['fps']:.1f}" if "fps" in row else "-"
+        line = (
+            f"{row['stage']:<24} {params:<64} {row['wall_seconds']:>12.6f} "
+            f"{rtf:>7} {fps:>8} {row['peak_rss_mb']:>8.0f}"
+        )
+        old = previous.get((row["stage"], json.dumps(row["params"], sort_keys=True)))
+        if old and old.get("wall_seconds"):
+            change = (row["wall_seconds"] / old["wall_seconds"] - 1) * 100
+            line += f" {change:>+7.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--durations", type=float, nargs="+", default=[10, 30], help="Video lengths (seconds)"
+    )
+    parser.add_argument(
+        "--resolutions", type=parse_resolution, nargs="+",
+        default=[(360, 640), (720, 1280)], help="WIDTHxHEIGHT of the rendered videos",
+    )
+    parser.add_argument(
+        "--cues", type=int, nargs="+", default=[100, 1000, 10000],
+        help="Cue / segment counts for the parsing and cut-range stages",
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--profile", default="final", help="Render profile for the render stages")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=["moviepy", "ffmpeg"],
+        default=["moviepy"],
+        help="Render backends to time the render stages with",
+    )
+    parser.add_argument(
+        "--rotated",
+        action="store_true",
+        help="Also render each resolution stored sideways with a 90 degree display rotation",
+    )
+    parser.add_argument("--whisper", action="store_true", help="Also time generate_captions")
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Runs per measurement (fastest is kept)"
+    )
+    parser.add_argument(
+        "--workdir", help="Where synthetic media goes (default: a temporary directory)"
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --output file to compare wall times against")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="autocaption-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = []
+        for stage, shown, params in plan_runs(args, workdir):
+            row = {"stage": stage, "params": shown}
+            try:
+                runs = [measure(stage, params, workdir) for _ in range(max(1, args.repeat))]
+                row.update(min(runs, key=lambda r: r["wall_seconds"]))
+            except Exception as e:
+                row["error"] = str(e)
+            results.append(row)
+            outcome = row.get("wall_seconds", row.get("error"))
+            print(f"  {stage} {shown}: {outcome}", file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"environment": environment(), "repeat": args.repeat, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
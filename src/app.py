@@ -1,16 +1,53 @@
+import cProfile
+import json
 import os
 import socket
-from flask import Flask, request, jsonify, render_template, send_file
+import threading
+import time
+from flask import Flask, Response, g, request, jsonify, render_template, send_file
 from werkzeug.utils import secure_filename
-from generate_captions import generate_captions
+import jobs
+import metrics
+from generate_captions import generate_captions, generate_captions_batch
+from model_cache import cache_stats, preload_models
+from streaming_transcribe import whisper_options
 from overlay_captions import overlay_captions
-from transcript_edit import (
+from transcript_edit import compute_cut_ranges, suggest_cuts
+from transcript_store import (
+    find_transcript,
     load_transcript,
-    get_transcript_path,
-    compute_cut_ranges,
-    render_video_with_cuts,
+    read_cut_ranges,
+    read_deleted_ids,
+    update_deleted_ids,
+    write_cut_ranges,
+)
+from incremental_render import render_incremental
+from parallel_render import render_parallel
+from trim_video import TRIM_MODES, get_video_duration, trim_video
+from media_cache import file_hash, probe_media, save_upload
+from timeline_assets import (
+    thumbnail_layout,
+    thumbnail_strip,
+    waveform_layout,
+    waveform_peaks,
+)
+from artifact_store import enforce_disk_budgets
+from render_profiles import (
+    EDIT_PROFILE,
+    get_backend,
+    get_profile,
+    output_filename as profile_output_name,
+)
+from proxy import start_proxy
+from file_serving import serve_file
+from chunked_upload import (
+    OffsetMismatch,
+    abort_upload,
+    append_chunk,
+    complete_upload,
+    init_upload,
+    upload_status,
 )
-from trim_video import get_video_duration, trim_video
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
@@ -22,6 +59,95 @@ os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 app = Flask(__name__)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["PROCESSED_FOLDER"] = PROCESSED_FOLDER
+# Whisper models to load at startup so the first request doesn't pay for it
+app.config["WHISPER_PRELOAD_MODELS"] = [
+    name.strip()
+    for name in os.environ.get("AUTOCAPTION_PRELOAD_MODELS", "base").split(",")
+    if name.strip()
+]
+# Timeline asset URLs carry a content version, so clients may cache them long
+TIMELINE_MAX_AGE = int(os.environ.get("AUTOCAPTION_TIMELINE_MAX_AGE", "86400"))
+# Request header that asks for a cProfile dump (needs AUTOCAPTION_PROFILING=1)
+PROFILE_HEADER = "X-Autocaption-Profile"
+# How often /jobs/<id>/events checks its job, and sends a keep-alive when idle
+JOB_EVENTS_POLL_SECONDS = 0.25
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+# How long a finished job's stream waits for a worker that never reported back
+JOB_EVENTS_DRAIN_SECONDS = 2
+
+
+def wants_async():
+    """True when the client asked for a background job (?async=1) instead of waiting."""
+    return request.args.get("async", "").lower() in ("1", "true", "yes")
+
+
+def _requested_option(field):
+    """Value of field from the query string, the JSON body or the form."""
+    payload = request.get_json(silent=True) or {}
+    return (
+        request.args.get(field)
+        or (payload.get(field) if isinstance(payload, dict) else None)
+        or request.form.get(field)
+    )
+
+
+def requested_profile(default=None):
+    """
+    Render profile named by ?profile=, the JSON body or the form, else
+    default (DEFAULT_PROFILE if None). Raises ValueError for an unknown name.
+    """
+    return get_profile(_requested_option("profile") or default)["name"]
+
+
+def requested_backend():
+    """
+    Render backend named by ?backend=, the JSON body or the form, else
+    DEFAULT_BACKEND. Raises ValueError for an unknown name.
+    """
+    return get_backend(_requested_option("backend"))
+
+
+def requested_transcription():
+    """
+    Whisper language and task from ?language=/?task=, the JSON body or the
+    form, as generate_captions keyword arguments. Raises ValueError for
+    unknown values.
+    """
+    language, task = _requested_option("language"), _requested_option("task")
+    whisper_options(language, task)
+    return {"language": language, "task": task}
+
+
+def wants_profile():
+    return metrics.PROFILING_ENABLED and request.headers.get(PROFILE_HEADER, "") not in ("", "0")
+
+
+def job_accepted(job_type, task_name, **kwargs):
+    cprofile_path = metrics.profile_path(task_name) if wants_profile() else None
+    try:
+        job_id = jobs.submit(job_type, task_name, cprofile_path=cprofile_path, **kwargs)
+    except Exception as e:
+        return jsonify({"error": f"Could not start job: {e}"}), 503
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+
+@app.before_request
+def start_request_profile():
+    # Background jobs are profiled in their worker instead (see job_accepted)
+    if wants_profile() and not wants_async():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finish_request_profile(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        path = metrics.profile_path(request.endpoint or "request")
+        profiler.dump_stats(path)
+        response.headers[PROFILE_HEADER] = os.path.basename(path)
+    return response
 
 
 @app.route("/")
@@ -39,41 +165,192 @@ def upload_video():
         return jsonify({"error": "No selected file"}), 400
     filename = secure_filename(video.filename)
     video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    video.save(video_path)
+    save_upload(video, video_path)
+    enforce_disk_budgets()
+    start_proxy(video_path)
     return jsonify({"filename": filename})
 
 
+@app.route("/uploads", methods=["POST"])
+def create_upload():
+    """
+    Start a resumable upload. JSON body: {"filename", "size"}. Send the file
+    with PUT /uploads/<upload_id>?offset=N, then POST .../complete.
+    """
+    payload = request.get_json() or {}
+    filename = secure_filename(payload.get("filename", ""))
+    if not filename:
+        return jsonify({"error": "No filename provided"}), 400
+    try:
+        return jsonify(init_upload(filename, int(payload.get("size", -1)))), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/uploads/<upload_id>")
+def get_upload(upload_id):
+    """Status of a resumable upload; "received" is the offset to resume from."""
+    try:
+        return jsonify(upload_status(upload_id))
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+
+
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+def append_upload(upload_id):
+    """Append the raw request body at ?offset=N (must equal "received")."""
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        return jsonify({"error": "offset is required"}), 400
+    try:
+        # request.stream is read in bounded pieces; the body is never buffered whole
+        return jsonify(append_chunk(upload_id, offset, request.stream))
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+    except OffsetMismatch as e:
+        return jsonify({"error": str(e), "received": e.received}), 409
+
+
+@app.route("/uploads/<upload_id>/complete", methods=["POST"])
+def finish_upload(upload_id):
+    """Move a fully received upload into uploads/. Optional JSON {"sha256"} is verified."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        status = upload_status(upload_id)
+        filename = status["filename"]
+        video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+        digest = complete_upload(upload_id, video_path, payload.get("sha256"))
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    enforce_disk_budgets()
+    start_proxy(video_path)
+    return jsonify({"filename": filename, "sha256": digest})
+
+
+@app.route("/uploads/<upload_id>", methods=["DELETE"])
+def cancel_upload(upload_id):
+    try:
+        upload_status(upload_id)
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+    abort_upload(upload_id)
+    return jsonify({"success": True})
+
+
 @app.route("/preview/<filename>")
 def preview_video(filename):
     """Serve uploaded video for preview (Trim stage)."""
     path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
     if not os.path.exists(path):
         return jsonify({"error": "File not found"}), 404
-    return send_file(path, mimetype="video/mp4")
+    return serve_file(path, mimetype="video/mp4")
 
 
 @app.route("/video_info/<filename>")
 def video_info(filename):
-    """Return duration (seconds) for an uploaded video."""
+    """Return duration (seconds), fps, resolution and codecs for an uploaded video."""
     path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
     if not os.path.exists(path):
         return jsonify({"error": "File not found"}), 404
     try:
-        duration = get_video_duration(path)
-        return jsonify({"duration": duration})
+        return jsonify(probe_media(path))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def send_timeline_asset(path, asset_path, mimetype, name):
+    """Serve a per-upload timeline asset with a content-derived ETag."""
+    response = send_file(
+        asset_path,
+        mimetype=mimetype,
+        etag=f"{file_hash(path)[:32]}-{name}",
+        max_age=TIMELINE_MAX_AGE,
+        conditional=True,
+    )
+    response.cache_control.public = True
+    return response
+
+
+@app.route("/timeline/<filename>")
+def timeline(filename):
+    """
+    Thumbnail strip and waveform for the trim timeline. Builds both (once per
+    upload) and returns their layout and versioned URLs.
+    """
+    path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    if not os.path.exists(path):
+        return jsonify({"error": "File not found"}), 404
+    try:
+        thumbnail_strip(path)
+        peaks_path = waveform_peaks(path)
+        version = file_hash(path)[:16]
+        return jsonify(
+            {
+                "duration": get_video_duration(path),
+                "thumbnails": {
+                    **thumbnail_layout(path),
+                    "url": f"/timeline/{filename}/thumbnails.jpg?v={version}",
+                },
+                "waveform": {
+                    **waveform_layout(path, peaks_path),
+                    "url": f"/timeline/{filename}/waveform.bin?v={version}",
+                },
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/timeline/<filename>/thumbnails.jpg")
+def timeline_thumbnails(filename):
+    """JPEG sprite sheet: THUMB_COUNT tiles side by side."""
+    path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    if not os.path.exists(path):
+        return jsonify({"error": "File not found"}), 404
+    try:
+        sheet_path = thumbnail_strip(path)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return send_timeline_asset(path, sheet_path, "image/jpeg", "thumbnails")
+
+
+@app.route("/timeline/<filename>/waveform.bin")
+def timeline_waveform(filename):
+    """Waveform peaks as raw bytes, one uint8 (0-255) per bin."""
+    path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    if not os.path.exists(path):
+        return jsonify({"error": "File not found"}), 404
+    try:
+        peaks_path = waveform_peaks(path)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return send_timeline_asset(path, peaks_path, "application/octet-stream", "waveform")
+
+
 @app.route("/trim/<filename>", methods=["POST"])
 def trim_video_route(filename):
-    """Trim video to [start_seconds, end_seconds]. Writes to uploads/{base}_trimmed.mp4."""
+    """
+    Trim video to [start_seconds, end_seconds]. Writes to uploads/{base}_trimmed.mp4.
+    Optional "mode": "exact" (default), "keyframe" (start snapped to the previous
+    keyframe, no re-encode) or "reencode".
+    """
     path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
     if not os.path.exists(path):
         return jsonify({"error": "File not found"}), 404
     payload = request.get_json() or {}
     start_s = float(payload.get("start_seconds", 0))
     end_s = float(payload.get("end_seconds", 0))
+    mode = payload.get("mode", "exact")
+    if mode not in TRIM_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(TRIM_MODES)}"}), 400
+    try:
+        profile = requested_profile()
+        backend = requested_backend()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     try:
         duration = get_video_duration(path)
     except Exception as e:
@@ -83,9 +360,29 @@ def trim_video_route(filename):
     base, ext = os.path.splitext(filename)
     trimmed_name = f"{base}_trimmed{ext}"
     out_path = os.path.join(app.config["UPLOAD_FOLDER"], trimmed_name)
+    if wants_async():
+        return job_accepted(
+            "trim",
+            "trim",
+            video_path=path,
+            output_path=out_path,
+            start_seconds=start_s,
+            end_seconds=end_s,
+            mode=mode,
+            profile=profile,
+            backend=backend,
+        )
     try:
-        trim_video(path, out_path, start_s, end_s)
-        return jsonify({"trimmed_filename": trimmed_name})
+        trim_video(
+            path, out_path, start_s, end_s, mode=mode, profile=profile, backend=backend
+        )
+        start_proxy(out_path)
+        return jsonify(
+            {
+                "trimmed_filename": trimmed_name,
+                "duration": get_video_duration(out_path),
+            }
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -96,11 +393,27 @@ def process_existing_video(filename):
     video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
     if not os.path.exists(video_path):
         return jsonify({"error": "File not found"}), 404
-    output_filename = f"processed_{filename}"
+    try:
+        profile = requested_profile(EDIT_PROFILE)
+        backend = requested_backend()
+        transcription = requested_transcription()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    output_filename = profile_output_name(f"processed_{filename}", profile)
     output_path = os.path.join(app.config["PROCESSED_FOLDER"], output_filename)
+    if wants_async():
+        return job_accepted(
+            "process",
+            "process",
+            video_path=video_path,
+            output_path=output_path,
+            profile=profile,
+            backend=backend,
+            **transcription,
+        )
     try:
-        generate_captions(video_path)
-        overlay_captions(video_path, output_path)
+        generate_captions(video_path, **transcription)
+        overlay_captions(video_path, output_path, profile=profile, backend=backend)
         return jsonify(
             {"message": "Video processed successfully", "output_file": output_filename}
         )
@@ -117,16 +430,36 @@ def process_video():
     if video.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
+    try:
+        profile = requested_profile(EDIT_PROFILE)
+        backend = requested_backend()
+        transcription = requested_transcription()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     filename = secure_filename(video.filename)
     video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    video.save(video_path)
+    save_upload(video, video_path)
+    enforce_disk_budgets()
+    start_proxy(video_path)
 
-    output_filename = f"processed_{filename}"
+    output_filename = profile_output_name(f"processed_{filename}", profile)
     output_path = os.path.join(app.config["PROCESSED_FOLDER"], output_filename)
 
+    if wants_async():
+        return job_accepted(
+            "process",
+            "process",
+            video_path=video_path,
+            output_path=output_path,
+            profile=profile,
+            backend=backend,
+            **transcription,
+        )
+
     try:
-        generate_captions(video_path)
-        overlay_captions(video_path, output_path)
+        generate_captions(video_path, **transcription)
+        overlay_captions(video_path, output_path, profile=profile, backend=backend)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -135,12 +468,52 @@ def process_video():
     )
 
 
+@app.route("/transcribe_batch", methods=["POST"])
+def transcribe_batch():
+    """
+    Caption several uploaded (short) videos in one batch, without rendering.
+    JSON body: {"filenames": [...], "language": ..., "task": ...}. Accepts
+    ?async=1; the job's /jobs/<id>/events stream has each file's segments.
+    """
+    payload = request.get_json(silent=True) or {}
+    filenames = payload.get("filenames")
+    if not isinstance(filenames, list) or not filenames:
+        return jsonify({"error": "filenames must be a non-empty list"}), 400
+    video_paths = []
+    for filename in filenames:
+        video_path = os.path.join(app.config["UPLOAD_FOLDER"], secure_filename(str(filename)))
+        if not os.path.exists(video_path):
+            return jsonify({"error": f"File not found: {filename}"}), 404
+        video_paths.append(video_path)
+    try:
+        transcription = requested_transcription()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_async():
+        return job_accepted(
+            "process", "transcribe_batch", video_paths=video_paths, **transcription
+        )
+    try:
+        errors = generate_captions_batch(video_paths, **transcription)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(
+        {
+            "files": [
+                {"file": os.path.basename(path), "error": error}
+                for path, error in errors.items()
+            ]
+        }
+    )
+
+
 @app.route("/download/<filename>")
 def download_file(filename):
     path = os.path.join(app.config["PROCESSED_FOLDER"], filename)
     if not os.path.exists(path):
         return jsonify({"error": "File not found"}), 404
-    return send_file(path, as_attachment=True)
+    return serve_file(path, as_attachment=True)
 
 
 @app.route("/download_vtt/<filename>")
@@ -183,11 +556,26 @@ def save_vtt(filename):
 @app.route("/reprocess/<filename>", methods=["POST"])
 def reprocess_video(filename):
     video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    output_filename = f"processed_{filename}"
+    try:
+        profile = requested_profile(EDIT_PROFILE)
+        backend = requested_backend()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    output_filename = profile_output_name(f"processed_{filename}", profile)
     output_path = os.path.join(app.config["PROCESSED_FOLDER"], output_filename)
 
+    if wants_async():
+        return job_accepted(
+            "render",
+            "reprocess",
+            video_path=video_path,
+            output_path=output_path,
+            profile=profile,
+            backend=backend,
+        )
+
     try:
-        overlay_captions(video_path, output_path)
+        overlay_captions(video_path, output_path, profile=profile, backend=backend)
         return jsonify(
             {
                 "message": "Video re-processed successfully",
@@ -198,43 +586,219 @@ def reprocess_video(filename):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/model_cache_stats")
+def model_cache_stats():
+    """Loaded Whisper models plus cache hit/miss and load timings."""
+    return jsonify(cache_stats())
+
+
+def _query_number(name, convert, default=None):
+    """?name= converted with convert (default if absent); ValueError if malformed."""
+    value = request.args.get(name, "")
+    return convert(value) if value != "" else default
+
+
+def _id_list(value):
+    return isinstance(value, list) and all(
+        isinstance(i, int) and not isinstance(i, bool) for i in value
+    )
+
+
+def request_deleted_ids(payload, video_path):
+    """
+    deleted_ids from the JSON body, or the set stored through
+    PATCH /deleted_ids when the body has none. Raises ValueError if invalid.
+    """
+    if "deleted_ids" not in payload:
+        return read_deleted_ids(video_path)
+    deleted_ids = payload["deleted_ids"]
+    if not _id_list(deleted_ids):
+        raise ValueError("deleted_ids must be a list")
+    return deleted_ids
+
+
+def _range_list(value):
+    return isinstance(value, list) and all(
+        isinstance(r, list)
+        and len(r) == 2
+        and all(isinstance(t, (int, float)) and not isinstance(t, bool) for t in r)
+        and 0 <= r[0] < r[1]
+        for r in value
+    )
+
+
+def request_cut_ranges(payload, video_path):
+    """
+    Extra cut_ranges ([start, end] pairs) from the JSON body, or the ones
+    stored through PUT /cut_ranges when the body has none. Raises ValueError
+    if invalid.
+    """
+    if "cut_ranges" not in payload:
+        return read_cut_ranges(video_path)
+    cut_ranges = payload["cut_ranges"]
+    if not _range_list(cut_ranges):
+        raise ValueError("cut_ranges must be a list of [start, end] pairs")
+    return cut_ranges
+
+
 @app.route("/get_transcript/<filename>")
 def get_transcript(filename):
+    """
+    Edit transcript segments. Optional ?start=&end= (seconds) keep the
+    segments overlapping that window, and ?offset=&limit= page through them;
+    next_offset is null on the last page. deleted_ids lists the returned
+    segments currently marked for removal, cut_ranges the stored extra cuts.
+    """
+    video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    transcript_path = find_transcript(video_path)
+    if transcript_path is None:
+        return jsonify({"error": "Transcript not found. Process the video first."}), 404
+    try:
+        start = _query_number("start", float)
+        end = _query_number("end", float)
+        offset = _query_number("offset", int, 0)
+        limit = _query_number("limit", int)
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "start/end must be numbers, offset/limit non-negative integers"}), 400
+
+    try:
+        transcript = load_transcript(transcript_path)
+        lo, hi = transcript.window(start, end)
+        page_lo = min(lo + offset, hi)
+        page_hi = hi if limit is None else min(page_lo + limit, hi)
+        segments = transcript.segments(page_lo, page_hi)
+        deleted = set(read_deleted_ids(video_path))
+        return jsonify(
+            {
+                "segments": segments,
+                "duration": transcript.duration,
+                "total": hi - lo,
+                "offset": page_lo - lo,
+                "next_offset": page_hi - lo if page_hi < hi else None,
+                "deleted_ids": [seg["id"] for seg in segments if seg["id"] in deleted],
+                "cut_ranges": read_cut_ranges(video_path),
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/deleted_ids/<filename>", methods=["PATCH"])
+def patch_deleted_ids(filename):
+    """
+    Change the stored set of segments marked for removal. JSON body:
+    {"add": [...], "remove": [...]}, or {"deleted_ids": [...]} to replace it.
+    """
     video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    transcript_path = get_transcript_path(video_path)
-    if not os.path.exists(transcript_path):
+    if find_transcript(video_path) is None:
         return jsonify({"error": "Transcript not found. Process the video first."}), 404
+    payload = request.get_json(silent=True) or {}
+    add = payload.get("add", [])
+    remove = payload.get("remove", [])
+    replace = payload.get("deleted_ids")
+    if not (_id_list(add) and _id_list(remove) and (replace is None or _id_list(replace))):
+        return jsonify({"error": "add, remove and deleted_ids must be lists of ids"}), 400
+
+    deleted = update_deleted_ids(video_path, add, remove, replace)
+    return jsonify({"deleted_count": len(deleted)})
+
+
+@app.route("/cut_suggestions/<filename>")
+def cut_suggestions(filename):
+    """
+    Cuts that shorten every pause longer than ?max_pause= (default 0.6 s) to
+    ?keep_pause= (0.2 s), keeping at least ?padding= (0.05 s) next to speech.
+    Pauses come from the audio energy and the transcript's words. Nothing is
+    applied: store the cuts with PUT /cut_ranges or send them as cut_ranges.
+    """
+    video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    if not os.path.exists(video_path):
+        return jsonify({"error": "File not found"}), 404
+    try:
+        options = {
+            "max_pause_seconds": _query_number("max_pause", float, 0.6),
+            "keep_pause_seconds": _query_number("keep_pause", float, 0.2),
+            "padding_seconds": _query_number("padding", float, 0.05),
+        }
+        if min(options.values()) < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "max_pause, keep_pause and padding must be non-negative numbers"}), 400
+
     try:
-        data = load_transcript(transcript_path)
-        return jsonify(data)
+        cuts, pauses = suggest_cuts(video_path, **options)
+        return jsonify(
+            {
+                "cut_ranges": cuts,
+                "pauses": pauses,
+                "removed_seconds": round(sum(end - start for start, end in cuts), 3),
+            }
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/cut_ranges/<filename>", methods=["PUT"])
+def put_cut_ranges(filename):
+    """
+    Replace the stored cuts that aren't whole transcript segments (such as
+    shortened pauses). JSON body: {"cut_ranges": [[start, end], ...]}.
+    """
+    video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    if not os.path.exists(video_path):
+        return jsonify({"error": "File not found"}), 404
+    payload = request.get_json(silent=True) or {}
+    cut_ranges = payload.get("cut_ranges")
+    if not _range_list(cut_ranges):
+        return jsonify({"error": "cut_ranges must be a list of [start, end] pairs"}), 400
+
+    stored = write_cut_ranges(video_path, cut_ranges)
+    return jsonify({"cut_count": len(stored)})
+
+
 @app.route("/reprocess_edited/<filename>", methods=["POST"])
 def reprocess_edited(filename):
     video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    transcript_path = get_transcript_path(video_path)
-    if not os.path.exists(transcript_path):
+    transcript_path = find_transcript(video_path)
+    if transcript_path is None:
         return jsonify({"error": "Transcript not found. Process the video first."}), 404
 
-    payload = request.get_json() or {}
-    deleted_ids = payload.get("deleted_ids", [])
-    if not isinstance(deleted_ids, list):
-        return jsonify({"error": "deleted_ids must be a list"}), 400
+    payload = request.get_json(silent=True) or {}
+    try:
+        deleted_ids = request_deleted_ids(payload, video_path)
+        extra_ranges = request_cut_ranges(payload, video_path)
+        profile = requested_profile(EDIT_PROFILE)
+        backend = requested_backend()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
-        data = load_transcript(transcript_path)
-        segments = data.get("segments", [])
-        cut_ranges = compute_cut_ranges(segments, deleted_ids)
-        output_filename = f"edited_{filename}"
+        cut_ranges = compute_cut_ranges(
+            load_transcript(transcript_path), deleted_ids, extra_ranges
+        )
+        output_filename = profile_output_name(f"edited_{filename}", profile)
         final_output_path = os.path.join(
             app.config["PROCESSED_FOLDER"], output_filename
         )
 
+        if wants_async():
+            return job_accepted(
+                "render",
+                "reprocess_edited",
+                video_path=video_path,
+                output_path=final_output_path,
+                cut_ranges=cut_ranges,
+                profile=profile,
+                backend=backend,
+            )
+
+        render_incremental(
+            video_path, final_output_path, cut_ranges, profile=profile, backend=backend
+        )
+
         if not cut_ranges:
-            # No deletions: output full captioned video (same as reprocess)
-            overlay_captions(video_path, final_output_path)
             return jsonify(
                 {
                     "message": "Video re-rendered (full video with captions)",
@@ -243,26 +807,68 @@ def reprocess_edited(filename):
                 }
             )
 
-        base, _ = os.path.splitext(filename)
-        captioned_temp_filename = f"edited_{base}_captioned.mp4"
-        captioned_temp_path = os.path.join(
-            app.config["PROCESSED_FOLDER"], captioned_temp_filename
+        return jsonify(
+            {
+                "message": "Video re-rendered with captions and cuts applied",
+                "output_file": output_filename,
+                "cut_ranges": cut_ranges,
+            }
         )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # 1) Apply captions (with highlights) to the original video — same as reprocess
-        overlay_captions(video_path, captioned_temp_path)
 
-        # 2) Cut the captioned video by removing deleted segments (last step)
-        render_video_with_cuts(captioned_temp_path, final_output_path, cut_ranges)
+@app.route("/export/<filename>", methods=["POST"])
+def export_video(filename):
+    """
+    Render the edited video once at full resolution from the original upload
+    (the "final" profile), in chunks across the CPU cores (parallel_render).
+    JSON body: {"deleted_ids": [...], "cut_ranges": [...]} as for
+    /reprocess_edited (the stored ones if omitted); without a transcript only
+    cut_ranges are cut.
+    """
+    video_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    if not os.path.exists(video_path):
+        return jsonify({"error": "File not found"}), 404
+    payload = request.get_json(silent=True) or {}
+    try:
+        deleted_ids = request_deleted_ids(payload, video_path)
+        extra_ranges = request_cut_ranges(payload, video_path)
+        backend = requested_backend()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        try:
-            os.remove(captioned_temp_path)
-        except OSError:
-            pass
+    try:
+        transcript_path = find_transcript(video_path)
+        segments = []
+        if deleted_ids and transcript_path is not None:
+            segments = load_transcript(transcript_path)
+        cut_ranges = compute_cut_ranges(segments, deleted_ids, extra_ranges)
+        output_filename = f"export_{filename}"
+        output_path = os.path.join(app.config["PROCESSED_FOLDER"], output_filename)
+
+        if wants_async():
+            return job_accepted(
+                "render",
+                "export",
+                video_path=video_path,
+                output_path=output_path,
+                cut_ranges=cut_ranges,
+                profile="final",
+                backend=backend,
+            )
 
+        render_parallel(
+            video_path,
+            output_path,
+            cut_ranges,
+            profile="final",
+            backend=backend,
+            workers=jobs.EXPORT_WORKERS,
+        )
         return jsonify(
             {
-                "message": "Video re-rendered with captions and cuts applied",
+                "message": "Video exported",
                 "output_file": output_filename,
                 "cut_ranges": cut_ranges,
             }
@@ -271,6 +877,111 @@ def reprocess_edited(filename):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Stage timings, job counts, cache hits and bytes moved, in Prometheus format."""
+    gauges = [
+        ("autocaption_jobs_in_flight", {"type": job_type, "status": status}, count)
+        for (job_type, status), count in sorted(jobs.in_flight_counts().items())
+    ]
+    return Response(
+        metrics.render_prometheus(gauges), mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.route("/profiles/<name>")
+def download_profile(name):
+    """A cProfile dump named in a response header or a job's "cprofile" field."""
+    path = os.path.join(metrics.PROFILE_FOLDER, secure_filename(name))
+    if not metrics.PROFILING_ENABLED or not os.path.exists(path):
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True, mimetype="application/octet-stream")
+
+
+@app.route("/jobs")
+def list_jobs():
+    return jsonify({"jobs": [jobs.job_to_dict(j) for j in jobs.list_jobs()]})
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Status, stage, progress (0..1) and result of a background job."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(jobs.job_to_dict(job))
+
+
+@app.route("/jobs/<job_id>/events")
+def job_event_stream(job_id):
+    """
+    Server-Sent Events for a background job: "progress" (the job, as from
+    /jobs/<id>) when its stage or progress changes, "segments" ({"file",
+    "segments"}, edit-transcript segments as a transcription decodes them)
+    and finally "done" or "failed".
+    """
+    if jobs.get_job(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    def stream():
+        sent = 0
+        state = None
+        last_send = time.monotonic()
+        while True:
+            job, segment_events, sent = jobs.job_events(job_id, sent)
+            if job is None:
+                return
+            chunks = [event("segments", data) for data in segment_events]
+            if (job["status"], job["stage"], job["progress"]) != state:
+                state = (job["status"], job["stage"], job["progress"])
+                chunks.append(event("progress", jobs.job_to_dict(job)))
+            # The worker's last segments can arrive just after the job finished
+            if job["status"] in ("done", "failed") and (
+                job["reported"] or time.time() - job["finished_at"] > JOB_EVENTS_DRAIN_SECONDS
+            ):
+                chunks.append(event(job["status"], jobs.job_to_dict(job)))
+                yield "".join(chunks)
+                return
+            if chunks:
+                last_send = time.monotonic()
+                yield "".join(chunks)
+            elif time.monotonic() - last_send >= JOB_EVENTS_KEEPALIVE_SECONDS:
+                last_send = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(JOB_EVENTS_POLL_SECONDS)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        # Not buffered by a fronting nginx
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    """Download the output file of a finished job."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}"}), 409
+    path = job["result"].get("output_path")
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "Result file not found"}), 404
+    return serve_file(path, as_attachment=True)
+
+
+def warm_model_cache():
+    """Load the configured Whisper models in the background."""
+    names = app.config["WHISPER_PRELOAD_MODELS"]
+    if names:
+        threading.Thread(target=preload_models, args=(names,), daemon=True).start()
+
+
 def find_free_port(start=5000, end=5010):
     """Return the first port in [start, end) that is not in use."""
     for port in range(start, end):
@@ -287,4 +998,10 @@ if __name__ == "__main__":
     port = int(os.environ.get("PORT", 0)) or find_free_port()
     url = f"http://localhost:{port}"
     print(f" * Running at {url}")
+    # With the debug reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warm_model_cache()
     app.run(debug=True, host="0.0.0.0", port=port)
+elif __name__ != "__mp_main__":
+    # Imported by a WSGI server
+    warm_model_cache()
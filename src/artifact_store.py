@@ -0,0 +1,275 @@
+"""
+Content-addressed store for transcripts and rendered videos.
+
+Artifacts are keyed by a hash of everything that determines them (media
+content hash, model and options for transcripts; media hash, VTT hash, cuts
+and render settings for renders), so retrying the same upload reuses earlier
+results instead of re-running Whisper or re-encoding. The store, the media
+cache and the upload/output folders are kept under size budgets by evicting
+least recently used entries. In uploads/ an entry is a video together with
+its captions, transcript and edits, which are only ever evicted as a whole.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from metrics import count_cache
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+ARTIFACT_FOLDER = os.path.join(BASE_DIR, "cache", "artifacts")
+
+# Size budgets (MB) per folder; 0 disables eviction for that folder
+DISK_BUDGETS_MB = {
+    ARTIFACT_FOLDER: int(os.environ.get("AUTOCAPTION_ARTIFACT_CACHE_MB", "20480")),
+    os.path.join(BASE_DIR, "cache", "media"): int(
+        os.environ.get("AUTOCAPTION_MEDIA_CACHE_MB", "10240")
+    ),
+    os.path.join(BASE_DIR, "uploads"): int(os.environ.get("AUTOCAPTION_UPLOADS_MB", "51200")),
+    # Abandoned chunked uploads; one directory per upload
+    os.path.join(BASE_DIR, "cache", "partial_uploads"): int(
+        os.environ.get("AUTOCAPTION_PARTIAL_UPLOADS_MB", "51200")
+    ),
+    os.path.join(BASE_DIR, "processed"): int(
+        os.environ.get("AUTOCAPTION_PROCESSED_MB", "20480")
+    ),
+}
+# Entries used more recently than this are never evicted (they may be in use)
+EVICTION_MIN_AGE_SECONDS = 3600
+# Files written next to an upload (overlay_captions.get_vtt_path, transcript_store)
+UPLOAD_SIDECARS = (".vtt", "_transcript.bin", "_transcript.json", "_edits.json")
+
+# put() checks the budgets at most this often, unless this much was stored since
+BUDGET_CHECK_SECONDS = 60
+BUDGET_CHECK_BYTES = 512 * 1024 * 1024
+
+_evict_lock = threading.Lock()
+_budget_check = {"at": 0.0, "bytes": 0}
+_budget_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def upload_entry(name):
+    """Name of the upload a file in uploads/ belongs to (its video's base name)."""
+    for suffix in UPLOAD_SIDECARS:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+# Folders whose entries span several files: folder -> file name to entry name
+ENTRY_GROUPS = {os.path.join(BASE_DIR, "uploads"): upload_entry}
+
+
+def artifact_key(**parts):
+    """Stable hash of the JSON-serializable parts that identify an artifact."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=list)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def text_hash(path):
+    """sha256 of a small file (e.g. a VTT), or None if it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _entry_path(kind, key):
+    return os.path.join(ARTIFACT_FOLDER, f"{kind}-{key}")
+
+
+def _count(kind, hit):
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+    count_cache(kind, hit)
+
+
+def fetch(kind, key, outputs):
+    """
+    Copy a stored artifact's files to their destinations. outputs maps the
+    stored name to the destination path. Returns True on a hit.
+    """
+    entry = _entry_path(kind, key)
+    if not all(os.path.exists(os.path.join(entry, name)) for name in outputs):
+        _count(kind, False)
+        return False
+    for name, dest in outputs.items():
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        # Copy rather than link: outputs are later overwritten in place. The
+        # copy is swapped in, so readers with dest memory-mapped (transcripts)
+        # keep the old file instead of seeing it truncated.
+        tmp_path = f"{dest}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(os.path.join(entry, name), tmp_path)
+            os.replace(tmp_path, dest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    now = time.time()
+    os.utime(entry, (now, now))
+    _count(kind, True)
+    return True
+
+
+def contains(kind, key, names):
+    """Whether (kind, key) has all of names stored; not counted as a hit or miss."""
+    entry = _entry_path(kind, key)
+    return all(os.path.exists(os.path.join(entry, name)) for name in names)
+
+
+def stored_path(kind, key, name):
+    """
+    Path of a stored file for direct use (e.g. as a concat input), or None.
+    Marks the entry as recently used.
+    """
+    entry = _entry_path(kind, key)
+    path = os.path.join(entry, name)
+    if not os.path.exists(path):
+        _count(kind, False)
+        return None
+    now = time.time()
+    os.utime(entry, (now, now))
+    _count(kind, True)
+    return path
+
+
+def put(kind, key, files):
+    """Store files ({stored name: source path}) under (kind, key)."""
+    entry = _entry_path(kind, key)
+    tmp = f"{entry}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp)
+    stored = 0
+    try:
+        for name, src in files.items():
+            shutil.copyfile(src, os.path.join(tmp, name))
+            stored += os.path.getsize(src)
+        if os.path.exists(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _maybe_enforce_budgets(stored)
+
+
+def _maybe_enforce_budgets(stored):
+    """
+    enforce_disk_budgets walks every managed folder, so after a put it only
+    runs once BUDGET_CHECK_SECONDS have passed or BUDGET_CHECK_BYTES were
+    stored since the last check (an incremental render puts every segment).
+    """
+    with _budget_lock:
+        _budget_check["bytes"] += stored
+        due = (
+            _budget_check["bytes"] >= BUDGET_CHECK_BYTES
+            or time.monotonic() - _budget_check["at"] >= BUDGET_CHECK_SECONDS
+        )
+    if due:
+        enforce_disk_budgets()
+
+
+def cached_output(kind, key, output_path, produce):
+    """
+    Write output_path via produce() unless an artifact for (kind, key)
+    already exists, in which case it is copied into place instead.
+    """
+    name = "output" + os.path.splitext(output_path)[1]
+    if fetch(kind, key, {name: output_path}):
+        print(f"Reused cached {kind} for {output_path}")
+        return output_path
+    produce()
+    try:
+        put(kind, key, {name: output_path})
+    except OSError as e:
+        print(f"Could not cache {kind} for {output_path}: {e}")
+    return output_path
+
+
+def store_stats():
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def _entry_usage(path):
+    """(bytes, last used) for a file or directory entry."""
+    st = os.stat(path)
+    if not os.path.isdir(path):
+        return st.st_size, max(st.st_mtime, st.st_atime)
+    total, last_used = 0, st.st_mtime
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                fst = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += fst.st_size
+            last_used = max(last_used, fst.st_mtime)
+    return total, last_used
+
+
+def evict_lru(folder, max_bytes, min_age_seconds=EVICTION_MIN_AGE_SECONDS, group=None):
+    """
+    Delete the least recently used top-level entries of folder until it
+    fits in max_bytes. group maps a file name to the entry it belongs to;
+    an entry's files are evicted together, when none of them has been used
+    recently. Returns the number of bytes freed.
+    """
+    if max_bytes <= 0 or not os.path.isdir(folder):
+        return 0
+    entries = {}  # entry name -> [last used, bytes, paths]
+    for item in os.scandir(folder):
+        if item.name.endswith(".tmp"):
+            continue
+        try:
+            size, last_used = _entry_usage(item.path)
+        except OSError:
+            continue
+        entry = entries.setdefault(group(item.name) if group else item.name, [0.0, 0, []])
+        entry[0] = max(entry[0], last_used)
+        entry[1] += size
+        entry[2].append(item.path)
+
+    total = sum(size for _, size, _ in entries.values())
+    freed = 0
+    cutoff = time.time() - min_age_seconds
+    for last_used, size, paths in sorted(entries.values()):
+        if total - freed <= max_bytes:
+            break
+        if last_used > cutoff:
+            break
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        freed += size
+        print(f"Evicted {', '.join(paths)} ({size / (1024 * 1024):.1f} MB)")
+    return freed
+
+
+def enforce_disk_budgets():
+    """Apply DISK_BUDGETS_MB to every managed folder."""
+    if not _evict_lock.acquire(blocking=False):
+        return  # another thread is already evicting
+    with _budget_lock:
+        _budget_check["at"] = time.monotonic()
+        _budget_check["bytes"] = 0
+    try:
+        for folder, budget_mb in DISK_BUDGETS_MB.items():
+            evict_lru(folder, budget_mb * 1024 * 1024, group=ENTRY_GROUPS.get(folder))
+    finally:
+        _evict_lock.release()
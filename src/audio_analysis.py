@@ -0,0 +1,123 @@
+"""
+Audio energy analysis on decoded (16 kHz mono float32) audio: short-time RMS,
+silence detection and pause-shortening cut suggestions, vectorized with NumPy.
+"""
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def frame_rms(audio, sample_rate=SAMPLE_RATE, frame_seconds=0.02):
+    """RMS energy of consecutive non-overlapping frames of frame_seconds each."""
+    hop = max(1, int(sample_rate * frame_seconds))
+    count = len(audio) // hop
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(audio[: count * hop], dtype=np.float32).reshape(count, hop)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / hop)
+
+
+def to_db(rms):
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def silence_threshold_db(db):
+    """
+    Adaptive threshold: 10 dB above the noise floor (10th percentile of
+    frame energy), capped so a quiet recording doesn't count speech as silence.
+    """
+    if db.size == 0:
+        return -60.0
+    return float(min(np.percentile(db, 10) + 10.0, -30.0))
+
+
+def _runs(mask):
+    """(starts, ends) frame indices of the runs of True in mask, ends exclusive."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[0::2], edges[1::2]
+
+
+def find_silences(
+    audio,
+    sample_rate=SAMPLE_RATE,
+    frame_seconds=0.02,
+    min_silence_seconds=0.3,
+    threshold_db=None,
+):
+    """
+    Return [(start, end), ...] in seconds for runs of frames quieter than
+    threshold_db (adaptive when None) lasting at least min_silence_seconds.
+    """
+    db = to_db(frame_rms(audio, sample_rate, frame_seconds))
+    if db.size == 0:
+        return []
+    if threshold_db is None:
+        threshold_db = silence_threshold_db(db)
+
+    starts, ends = _runs(db < threshold_db)
+    min_frames = int(round(min_silence_seconds / frame_seconds))
+    keep = (ends - starts) >= max(1, min_frames)
+    return [
+        (float(s * frame_seconds), float(e * frame_seconds))
+        for s, e in zip(starts[keep], ends[keep])
+    ]
+
+
+def find_pauses(
+    audio,
+    word_starts=(),
+    word_ends=(),
+    sample_rate=SAMPLE_RATE,
+    frame_seconds=0.01,
+    threshold_db=None,
+):
+    """
+    (starts, ends) arrays in seconds of the pauses in audio: runs of frames
+    below threshold_db (adaptive when None) that no word overlaps. Words
+    (e.g. from the edit transcript) keep quiet speech from counting as a
+    pause, and the energy trims a word gap down to the actual silence.
+    """
+    db = to_db(frame_rms(audio, sample_rate, frame_seconds))
+    if db.size == 0:
+        return np.zeros(0), np.zeros(0)
+    if threshold_db is None:
+        threshold_db = silence_threshold_db(db)
+
+    quiet = db < threshold_db
+    if len(word_starts):
+        count = db.size
+        first = np.clip(np.floor(np.asarray(word_starts) / frame_seconds), 0, count)
+        last = np.clip(np.ceil(np.asarray(word_ends) / frame_seconds), 0, count)
+        # +1 where a word starts, -1 where it ends: the running sum counts the
+        # words covering each frame
+        covered = np.bincount(first.astype(np.int64), minlength=count + 1)
+        covered -= np.bincount(last.astype(np.int64), minlength=count + 1)
+        quiet &= np.cumsum(covered[:count]) <= 0
+
+    starts, ends = _runs(quiet)
+    return starts * frame_seconds, ends * frame_seconds
+
+
+def pause_cuts(
+    pause_starts,
+    pause_ends,
+    max_pause_seconds=0.6,
+    keep_pause_seconds=0.2,
+    padding_seconds=0.05,
+):
+    """
+    Cut ranges that shorten every pause longer than max_pause_seconds to
+    keep_pause_seconds, taking the cut from its middle. At least
+    padding_seconds of silence stays next to the speech on either side.
+    """
+    pause_starts = np.asarray(pause_starts, dtype=np.float64)
+    pause_ends = np.asarray(pause_ends, dtype=np.float64)
+    margin = max(padding_seconds, keep_pause_seconds / 2)
+    long_pauses = (pause_ends - pause_starts) > max_pause_seconds
+    cut_starts = pause_starts[long_pauses] + margin
+    cut_ends = pause_ends[long_pauses] - margin
+    valid = cut_ends - cut_starts > 0.001
+    return [
+        (round(start, 3), round(end, 3))
+        for start, end in zip(cut_starts[valid].tolist(), cut_ends[valid].tolist())
+    ]
@@ -0,0 +1,259 @@
+"""
+Batch captioning for directories, globs and manifest files.
+
+Transcription runs in this process, one file after another, so the Whisper
+model is loaded once. As soon as a file is transcribed its caption render is
+handed to a pool of encoder processes, so the next file's audio decode and
+transcription overlap the previous files' encodes. Captions (VTT and edit
+transcript) are written next to each input. With an output directory,
+inputs keep their folders relative to the directory or glob they were found
+under, so same-named files don't collide. Files whose output is
+newer than the input are skipped, and a JSON report with per-file timings
+is written at the end.
+"""
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from generate_captions import generate_captions
+from media_cache import get_duration
+from overlay_captions import get_vtt_path, overlay_captions
+from render_profiles import get_backend
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".mkv", ".webm", ".avi")
+# libx264 is multi-threaded on its own, so don't start one encoder per core
+DEFAULT_ENCODERS = max(1, (os.cpu_count() or 2) // 4)
+
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def source_root(source):
+    """Folder that inputs found by expand_source(source) are relative to."""
+    if os.path.isdir(source):
+        return source
+    if glob.has_magic(source):
+        # Everything before the first wildcard component
+        parts = []
+        for part in os.path.normpath(source).split(os.sep):
+            if glob.has_magic(part):
+                break
+            parts.append(part)
+        return os.sep.join(parts) or os.curdir
+    return os.path.dirname(source) or os.curdir
+
+
+def expand_source(source):
+    """Video files under a directory (recursively), matching a glob, or the file itself."""
+    if os.path.isdir(source):
+        found = []
+        for root, _, names in os.walk(source):
+            found.extend(os.path.join(root, n) for n in names if is_video(n))
+        return sorted(found)
+    if glob.has_magic(source):
+        return sorted(p for p in glob.glob(source, recursive=True) if is_video(p))
+    return [source]
+
+
+def read_manifest(manifest_path):
+    """
+    Items from a manifest: JSON (a list of {"input", "output"?, "title"?})
+    or CSV/text with one "input[,output[,title]]" per line. Relative paths
+    are resolved against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path):
+        return path if not path or os.path.isabs(path) else os.path.join(base, path)
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".json"):
+            rows = [
+                (row["input"], row.get("output", ""), row.get("title", ""))
+                for row in json.load(f)
+            ]
+        else:
+            rows = [
+                (row + ["", ""])[:3]
+                for row in csv.reader(f)
+                if row and row[0].strip() and not row[0].startswith("#")
+            ]
+    return [
+        {"input": resolve(i.strip()), "output": resolve(o.strip()), "title": t.strip()}
+        for i, o, t in rows
+    ]
+
+
+def default_output_path(input_path, output_dir=None, root=None):
+    """
+    <name>_captioned.mp4 next to the input, or in output_dir under the
+    input's folder relative to root.
+    """
+    base, _ = os.path.splitext(os.path.basename(input_path))
+    folder = os.path.dirname(os.path.abspath(input_path))
+    if output_dir:
+        relative = os.path.relpath(folder, os.path.abspath(root)) if root else os.curdir
+        if relative.startswith(os.pardir):
+            relative = os.curdir
+        folder = os.path.normpath(os.path.join(output_dir, relative))
+    return os.path.join(folder, f"{base}_captioned.mp4")
+
+
+def collect_items(sources=(), manifest=None, output_dir=None, title=""):
+    """
+    Batch items ({"input", "output", "title"}) with duplicates removed.
+    Raises ValueError when two inputs would be written to the same output.
+    """
+    items = []
+    for source in sources:
+        root = source_root(source)
+        items.extend(
+            {"input": p, "output": "", "title": title, "root": root}
+            for p in expand_source(source)
+        )
+    if manifest:
+        items.extend(read_manifest(manifest))
+
+    seen = set()
+    outputs = {}
+    unique = []
+    for item in items:
+        key = os.path.abspath(item["input"])
+        if key in seen:
+            continue
+        seen.add(key)
+        root = item.pop("root", None)
+        item["output"] = item["output"] or default_output_path(item["input"], output_dir, root)
+        output = os.path.abspath(item["output"])
+        if output in outputs:
+            raise ValueError(
+                f"{outputs[output]} and {item['input']} would both be written to {item['output']}"
+            )
+        outputs[output] = item["input"]
+        unique.append(item)
+    return unique
+
+
+def is_up_to_date(input_path, output_path):
+    return (
+        os.path.exists(output_path)
+        and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    )
+
+
+def _render(input_path, output_path, title, profile, backend=None):
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    overlay_captions(
+        input_path, output_path, title, logger=None, profile=profile, backend=backend
+    )
+    return time.perf_counter() - start
+
+
+def _record_render(entry, future):
+    try:
+        entry["render_seconds"] = round(future.result(), 3)
+        entry["status"] = "done"
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = f"render: {e}"
+    total = entry["transcribe_seconds"] + entry.get("render_seconds", 0.0)
+    entry["total_seconds"] = round(total, 3)
+    if entry.get("media_seconds"):
+        # Processing time per second of media (below 1 is faster than realtime)
+        entry["realtime_factor"] = round(total / entry["media_seconds"], 3)
+
+
+def run_batch(
+    items,
+    encoders=DEFAULT_ENCODERS,
+    force=False,
+    report_path=None,
+    transcribe_options=None,
+    profile=None,
+    backend=None,
+):
+    """Caption every item; returns the report dict (also written to report_path)."""
+    started = time.perf_counter()
+    entries = []
+    # Captions are written next to each input as <name>.vtt, so an input must
+    # not be transcribed while one sharing that VTT is still rendering
+    rendering = {}
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, encoders), mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        for index, item in enumerate(items, start=1):
+            input_path, output_path = item["input"], item["output"]
+            entry = {"input": input_path, "output": output_path, "transcribe_seconds": 0.0}
+            entries.append(entry)
+            print(f"[{index}/{len(items)}] {input_path}")
+
+            if not os.path.exists(input_path):
+                entry.update(status="failed", error="input not found")
+                continue
+            if not force and is_up_to_date(input_path, output_path):
+                entry["status"] = "skipped"
+                continue
+
+            vtt_path = get_vtt_path(os.path.abspath(input_path))
+            if vtt_path in rendering:
+                wait([rendering.pop(vtt_path)])
+
+            try:
+                entry["media_seconds"] = round(get_duration(input_path), 3)
+                start = time.perf_counter()
+                generate_captions(
+                    input_path,
+                    output_dir=os.path.dirname(vtt_path),
+                    **{"use_proxy": False, **(transcribe_options or {})},
+                )
+                entry["transcribe_seconds"] = round(time.perf_counter() - start, 3)
+            except Exception as e:
+                entry.update(status="failed", error=f"transcribe: {e}")
+                continue
+
+            entry["status"] = "rendering"
+            future = pool.submit(
+                _render, input_path, output_path, item["title"], profile, backend
+            )
+            future.add_done_callback(lambda f, entry=entry: _record_render(entry, f))
+            rendering[vtt_path] = future
+
+    counts = {}
+    for entry in entries:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    media = sum(e.get("media_seconds", 0.0) for e in entries if e["status"] == "done")
+    elapsed = time.perf_counter() - started
+    report = {
+        "files": len(entries),
+        "counts": counts,
+        "wall_seconds": round(elapsed, 3),
+        "media_seconds": round(media, 3),
+        "realtime_factor": round(elapsed / media, 3) if media else None,
+        "encoders": encoders,
+        "profile": profile,
+        "backend": get_backend(backend),
+        "entries": entries,
+    }
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print_summary(report, report_path)
+    return report
+
+
+def print_summary(report, report_path=None):
+    counts = ", ".join(f"{n} {status}" for status, n in sorted(report["counts"].items()))
+    print(f"\nBatch finished: {report['files']} files ({counts or 'nothing to do'})")
+    print(f"Wall time {report['wall_seconds']:.1f}s for {report['media_seconds']:.1f}s of media")
+    for entry in report["entries"]:
+        if entry["status"] == "failed":
+            print(f"  FAILED {entry['input']}: {entry['error']}")
+    if report_path:
+        print(f"Report written to {report_path}")
@@ -0,0 +1,173 @@
+"""
+Batched decoding of short clips.
+
+Whisper's transcribe() decodes one 30-second window at a time, one input at
+a time. Clips that fit in a single window are decoded together instead: their
+mel spectrograms are stacked and run through one whisper.decode call per
+language, and each clip's tokens are then split into segments and given
+word timestamps the way transcribe() treats its first window. Where
+transcribe() would do more than that single greedy pass (retry at a higher
+temperature, or decode another window because speech runs on), the clip
+gets no result and is left to transcribe(), so the transcripts are the same
+either way and share their cache entries.
+"""
+import torch
+import whisper
+from whisper.audio import FRAMES_PER_SECOND, HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE
+from whisper.timing import add_word_timestamps
+from whisper.tokenizer import get_tokenizer
+from whisper.utils import exact_div, get_end
+
+from model_cache import is_fp16
+
+# transcribe()'s defaults for retrying a window or treating it as silence
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+def fits_one_window(audio):
+    """Whether 16 kHz audio is short enough to be decoded in one batch row."""
+    return len(audio) // HOP_LENGTH <= N_FRAMES
+
+
+def transcribe_batch(model, audios, language, task=None):
+    """
+    Transcribe 16 kHz clips spoken in language with one batched decode.
+    Returns a result per clip, as model.transcribe(clip, language=language,
+    task=task, word_timestamps=True) would return it, or None for clips to
+    transcribe on their own.
+    """
+    fp16 = is_fp16(model)
+    task = task or "transcribe"
+    tokenizer = get_tokenizer(
+        model.is_multilingual,
+        num_languages=model.num_languages,
+        language=language,
+        task=task,
+    )
+    results = [None] * len(audios)
+    rows, mels = [], []
+    for i, audio in enumerate(audios):
+        # Padded with 30 s of silence and cut back, as transcribe() slices it
+        mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+        content_frames = mel.shape[-1] - N_FRAMES
+        if content_frames > N_FRAMES:
+            continue
+        if content_frames == 0:
+            results[i] = {"text": "", "segments": [], "language": language}
+            continue
+        rows.append((i, content_frames))
+        mels.append(whisper.pad_or_trim(mel[:, :content_frames], N_FRAMES))
+    if not mels:
+        return results
+
+    batch = torch.stack(mels).to(model.device).to(torch.float16 if fp16 else torch.float32)
+    options = whisper.DecodingOptions(
+        task=task, language=language, temperature=0.0, fp16=fp16, prompt=[]
+    )
+    decoded = model.decode(batch, options)
+    for (i, content_frames), mel, result in zip(rows, batch, decoded):
+        results[i] = _window_result(model, tokenizer, mel, content_frames, result, language)
+    return results
+
+
+def _segment(tokenizer, result, start, end, tokens):
+    tokens = tokens.tolist()
+    return {
+        "seek": 0,
+        "start": start,
+        "end": end,
+        "text": tokenizer.decode([token for token in tokens if token < tokenizer.eot]),
+        "tokens": tokens,
+        "temperature": result.temperature,
+        "avg_logprob": result.avg_logprob,
+        "compression_ratio": result.compression_ratio,
+        "no_speech_prob": result.no_speech_prob,
+    }
+
+
+def needs_fallback(result):
+    """
+    Whether transcribe() would decode the window again at a higher
+    temperature, as decode_with_fallback decides it. Whisper releases up to
+    20240930 also accept a window with a high no-speech probability that
+    this retries; the clip then goes to transcribe(), which decides either way.
+    """
+    needs_fallback = False
+    if result.compression_ratio > COMPRESSION_RATIO_THRESHOLD:
+        needs_fallback = True  # too repetitive
+    if result.avg_logprob < LOGPROB_THRESHOLD:
+        needs_fallback = True  # average log probability is too low
+    if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+        needs_fallback = False  # silence
+    return needs_fallback
+
+
+def _window_result(model, tokenizer, mel, content_frames, result, language):
+    """transcribe()'s handling of a clip's only window, or None if it would do more."""
+    if needs_fallback(result):
+        return None
+    # transcribe()'s should_skip: the window is silence
+    should_skip = result.no_speech_prob > NO_SPEECH_THRESHOLD
+    if result.avg_logprob > LOGPROB_THRESHOLD:
+        should_skip = False  # don't skip if the logprob is high enough, despite no_speech_prob
+    if should_skip:
+        return {"text": "", "segments": [], "language": language}
+
+    tokens = torch.tensor(result.tokens)
+    input_stride = exact_div(N_FRAMES, model.dims.n_audio_ctx)
+    time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE
+    timestamp_begin = tokenizer.timestamp_begin
+    timestamp_tokens = tokens.ge(timestamp_begin)
+    single_timestamp_ending = timestamp_tokens[-2:].tolist() == [False, True]
+    consecutive = (torch.where(timestamp_tokens[:-1] & timestamp_tokens[1:])[0] + 1).tolist()
+
+    segments = []
+    seek = content_frames
+    if consecutive:
+        if single_timestamp_ending:
+            consecutive.append(len(tokens))
+        last_slice = 0
+        for current_slice in consecutive:
+            sliced = tokens[last_slice:current_slice]
+            start = (sliced[0].item() - timestamp_begin) * time_precision
+            end = (sliced[-1].item() - timestamp_begin) * time_precision
+            segments.append(_segment(tokenizer, result, start, end, sliced))
+            last_slice = current_slice
+        if not single_timestamp_ending:
+            # The unfinished last segment is decoded again from its start
+            seek = (tokens[last_slice - 1].item() - timestamp_begin) * input_stride
+    else:
+        duration = content_frames * HOP_LENGTH / SAMPLE_RATE
+        timestamps = tokens[timestamp_tokens.nonzero().flatten()]
+        if len(timestamps) > 0 and timestamps[-1].item() != timestamp_begin:
+            duration = (timestamps[-1].item() - timestamp_begin) * time_precision
+        segments.append(_segment(tokenizer, result, 0.0, duration, tokens))
+
+    add_word_timestamps(
+        segments=segments,
+        model=model,
+        tokenizer=tokenizer,
+        mel=mel,
+        num_frames=content_frames,
+        last_speech_timestamp=0.0,
+    )
+    if not single_timestamp_ending:
+        last_word_end = get_end(segments)
+        if last_word_end is not None and last_word_end > 0:
+            seek = round(last_word_end * FRAMES_PER_SECOND)
+    if seek < content_frames:
+        return None  # transcribe() would decode another window from seek
+
+    for segment in segments:
+        if segment["start"] == segment["end"] or segment["text"].strip() == "":
+            segment["text"] = ""
+            segment["tokens"] = []
+            segment["words"] = []
+    all_tokens = [token for segment in segments for token in segment["tokens"]]
+    return {
+        "text": tokenizer.decode(all_tokens),
+        "segments": [{"id": i, **segment} for i, segment in enumerate(segments)],
+        "language": language,
+    }
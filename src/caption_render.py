@@ -0,0 +1,292 @@
+"""
+Caption rendering from pre-rasterized sprites.
+
+Every unique (text, style) run is rasterized once into a cropped,
+premultiplied-alpha uint8 sprite and kept in a bounded cache, so the base
+line shared by all the word-highlight cues of a caption is drawn once.
+Frames are produced by blending only the cues active at time t, found
+through an interval index, into a copy of the source frame, instead of
+compositing two TextClip layers per cue (and checking every cue) on every
+frame. Blending is integer NumPy arithmetic restricted to each sprite's
+box, in buffers allocated once per render rather than once per frame.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from moviepy import TextClip
+
+from metrics import count_cache, observe, span
+
+SPRITE_CACHE_MB = int(os.environ.get("AUTOCAPTION_SPRITE_CACHE_MB", "256"))
+
+
+class Sprite:
+    """
+    A rasterized text run, cropped to its visible pixels, ready for integer
+    blending: color times alpha (uint8), and the weight of the frame below
+    as (255 - alpha) scaled to 0..256 (uint16, so that "* weight >> 8" stands
+    in for "* (255 - alpha) / 255"). Both are stored per channel: NumPy is
+    several times slower broadcasting a single alpha plane over RGB.
+    """
+
+    __slots__ = ("premultiplied", "background_weight", "x", "y", "width", "height")
+
+    def __init__(self, rgb, alpha, x, y):
+        alpha = np.rint(np.clip(alpha, 0.0, 1.0) * 255).astype(np.uint16)[..., None]
+        premultiplied = (rgb.astype(np.uint16) * alpha + 127) // 255
+        inverse = 255 - alpha
+        weight = np.broadcast_to(inverse + (inverse >> 7), premultiplied.shape)
+        self.premultiplied = np.ascontiguousarray(premultiplied, dtype=np.uint8)
+        self.background_weight = np.ascontiguousarray(weight, dtype=np.uint16)
+        self.x = x
+        self.y = y
+        self.height, self.width = alpha.shape[:2]
+
+    @property
+    def nbytes(self):
+        return self.premultiplied.nbytes + self.background_weight.nbytes
+
+
+class SpriteCache:
+    """LRU cache of rasterized text runs, bounded by total sprite bytes."""
+
+    def __init__(self, max_megabytes=SPRITE_CACHE_MB):
+        self.max_bytes = max_megabytes * 1024 * 1024
+        self._sprites = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text, params):
+        return (text, tuple(sorted(params.items())))
+
+    def get(self, text, params):
+        """Sprite for text rendered with TextClip params (None if nothing visible)."""
+        key = self.key(text, params)
+        with self._lock:
+            if key in self._sprites:
+                self._sprites.move_to_end(key)
+                self.hits += 1
+                count_cache("sprite", True)
+                return self._sprites[key]
+
+        count_cache("sprite", False)
+        with span("caption_rasterize"):
+            sprite = rasterize(text, params)
+
+        with self._lock:
+            self.misses += 1
+            self._sprites[key] = sprite
+            self._bytes += sprite.nbytes if sprite else 0
+            while self._bytes > self.max_bytes and len(self._sprites) > 1:
+                _, evicted = self._sprites.popitem(last=False)
+                self._bytes -= evicted.nbytes if evicted else 0
+        return sprite
+
+
+_default_cache = SpriteCache()
+
+
+def rasterize(text, params):
+    """
+    Render text once with TextClip and crop the result to the pixels that
+    have any alpha. Returns None for runs with nothing visible (e.g. blanks).
+    """
+    if not text.strip():
+        return None
+    clip = TextClip(text=text, **params)
+    try:
+        rgb = clip.get_frame(0)
+        alpha = clip.mask.get_frame(0) if clip.mask is not None else np.ones(rgb.shape[:2])
+    finally:
+        clip.close()
+
+    rows = np.flatnonzero(alpha.any(axis=1))
+    cols = np.flatnonzero(alpha.any(axis=0))
+    if rows.size == 0:
+        return None
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+    return Sprite(rgb[y0:y1, x0:x1], alpha[y0:y1, x0:x1], int(x0), int(y0))
+
+
+class CaptionIndex:
+    """
+    Sorted interval index answering "which cues are active at t?".
+
+    Cues are sorted by start, with a running max of end times, so a lookup
+    is a binary search for the last cue starting at or before t followed by
+    a short backwards scan that stops as soon as no earlier cue can still be
+    active. Frame times usually only move forward, so a sweep cursor makes
+    consecutive lookups amortized O(1); seeking backwards falls back to the
+    binary search.
+    """
+
+    def __init__(self, intervals):
+        """intervals: iterable of (start, end, payload)."""
+        ordered = sorted(intervals, key=lambda item: item[0])
+        self.starts = [start for start, _, _ in ordered]
+        self.ends = [end for _, end, _ in ordered]
+        self.payloads = [payload for _, _, payload in ordered]
+        self.max_end = []
+        running = float("-inf")
+        for end in self.ends:
+            running = max(running, end)
+            self.max_end.append(running)
+        self._cursor = 0  # number of cues with start <= last t
+        self._last_t = float("-inf")
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _upper(self, t):
+        """Number of cues with start <= t."""
+        starts = self.starts
+        if t >= self._last_t:
+            cursor = self._cursor
+            steps = 0
+            while cursor < len(starts) and starts[cursor] <= t:
+                cursor += 1
+                steps += 1
+                if steps == 8:
+                    # Big jump forward: finish with a binary search
+                    cursor = bisect.bisect_right(starts, t, lo=cursor)
+                    break
+        else:
+            cursor = bisect.bisect_right(starts, t)
+        self._cursor = cursor
+        self._last_t = t
+        return cursor
+
+    def active(self, t):
+        """Payloads of cues with start <= t < end, in start order."""
+        j = self._upper(t) - 1
+        found = []
+        while j >= 0 and self.max_end[j] > t:
+            if self.ends[j] > t:
+                found.append(self.payloads[j])
+            j -= 1
+        found.reverse()
+        return found
+
+
+class Compositor:
+    """
+    Blends sprites onto frames with integer arithmetic in preallocated
+    buffers. Decoded frames are read-only, so each frame is copied into an
+    output buffer owned by the compositor, which is reused for the next frame:
+    the caller must be done with a returned frame before asking for another
+    (true of write_videofile, which writes each frame out first).
+    """
+
+    def __init__(self, max_height, max_width):
+        self._product = np.empty((max_height, max_width, 3), dtype=np.uint16)
+        self._output = None
+
+    def _output_for(self, frame):
+        if self._output is None or self._output.shape != frame.shape:
+            self._output = np.empty(frame.shape, dtype=np.uint8)
+        return self._output
+
+    def draw(self, frame, layers):
+        """Alpha-blend layers ((sprite, x, y), ...) onto a copy of frame."""
+        output = self._output_for(frame)
+        np.copyto(output, frame)
+        frame_height, frame_width = output.shape[:2]
+        for sprite, x, y in layers:
+            # Clip the sprite to the frame
+            fx0, fy0 = max(x, 0), max(y, 0)
+            fx1 = min(x + sprite.width, frame_width)
+            fy1 = min(y + sprite.height, frame_height)
+            if fx0 >= fx1 or fy0 >= fy1:
+                continue
+            sx0, sy0 = fx0 - x, fy0 - y
+            sx1, sy1 = sx0 + (fx1 - fx0), sy0 + (fy1 - fy0)
+            region = output[fy0:fy1, fx0:fx1]
+            product = self._product[: fy1 - fy0, : fx1 - fx0]
+
+            # region = premultiplied + region * weight >> 8, never above 255
+            np.multiply(region, sprite.background_weight[sy0:sy1, sx0:sx1], out=product)
+            np.right_shift(product, 8, out=product)
+            np.add(product, sprite.premultiplied[sy0:sy1, sx0:sx1], out=region, casting="unsafe")
+        return output
+
+
+class CaptionRenderer:
+    """
+    Frame transform that draws captions onto a video clip:
+
+        captioned = video.transform(CaptionRenderer(captions, style, video.size))
+
+    captions are dicts with start/end (seconds), text and highlighted_word_line;
+    style comes from overlay_captions.caption_style.
+    """
+
+    def __init__(self, captions, style, video_size, cache=None):
+        cache = cache or _default_cache
+        self.video_width, self.video_height = video_size
+        self.cues = []
+
+        for caption in sorted(captions, key=lambda c: c["start"]):
+            layers = []
+            for text, params in (
+                (caption["text"], style["caption"]),
+                (caption["highlighted_word_line"], style["highlight"]),
+            ):
+                sprite = cache.get(text, {**style["defaults"], **params})
+                if sprite is None:
+                    continue
+                # Same placement as with_position(("center", top)) on the TextClip box
+                box_width = params["size"][0]
+                x = (self.video_width - box_width) // 2 + sprite.x
+                y = style["top"] + sprite.y
+                layers.append((sprite, x, y))
+            if layers:
+                self.cues.append((caption["start"], caption["end"], layers))
+
+        self.index = CaptionIndex(self.cues)
+        sprites = [sprite for _, _, layers in self.cues for sprite, _, _ in layers]
+        self.compositor = Compositor(
+            max((sprite.height for sprite in sprites), default=0),
+            max((sprite.width for sprite in sprites), default=0),
+        )
+        # Time spent pulling source frames vs. drawing onto them
+        self.decode_seconds = 0.0
+        self.composite_seconds = 0.0
+
+    def layers_at(self, t):
+        active = self.index.active(t)
+        if len(active) == 1:
+            return active[0]
+        return [layer for layers in active for layer in layers]
+
+    def draw(self, frame, layers):
+        return self.compositor.draw(frame, layers)
+
+    def __call__(self, get_frame, t):
+        start = time.perf_counter()
+        frame = get_frame(t)
+        decoded = time.perf_counter()
+        self.decode_seconds += decoded - start
+        layers = self.layers_at(t)
+        if layers:
+            frame = self.draw(frame, layers)
+        self.composite_seconds += time.perf_counter() - decoded
+        return frame
+
+    def record_timings(self, write_seconds):
+        """
+        Split a write_videofile call that pulled frames through this renderer
+        into decode, composite and encode (everything else: x264, audio, mux)
+        stage times.
+        """
+        observe("autocaption_stage_seconds", self.decode_seconds, stage="decode")
+        observe("autocaption_stage_seconds", self.composite_seconds, stage="composite")
+        encode = max(0.0, write_seconds - self.decode_seconds - self.composite_seconds)
+        observe("autocaption_stage_seconds", encode, stage="encode")
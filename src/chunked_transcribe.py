@@ -0,0 +1,242 @@
+"""
+Chunked, parallel transcription for long inputs.
+
+The audio is split at detected silences into chunks of roughly
+CHUNK_SECONDS, each chunk (plus a little overlap for context) is transcribed
+in a process pool where every worker keeps its own cached model (the pool
+lives as long as the process, so the models stay loaded), and the
+results are stitched back into a single Whisper-shaped result with absolute
+timestamps, so build_edit_transcript and the VTT writer work unchanged.
+"""
+import difflib
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import torch
+import whisper
+
+from audio_analysis import SAMPLE_RATE, find_silences
+from model_cache import DEFAULT_MODEL, get_model, is_fp16, model_lock
+
+CHUNK_SECONDS = float(os.environ.get("AUTOCAPTION_CHUNK_SECONDS", "60"))
+OVERLAP_SECONDS = float(os.environ.get("AUTOCAPTION_CHUNK_OVERLAP_SECONDS", "1.0"))
+WORKERS = int(
+    os.environ.get("AUTOCAPTION_TRANSCRIBE_WORKERS", str(max(1, (os.cpu_count() or 2) // 4)))
+)
+# Inputs at least this long are transcribed in chunks by default (0 = never)
+CHUNKED_MIN_SECONDS = float(os.environ.get("AUTOCAPTION_CHUNKED_MIN_SECONDS", "600"))
+
+# Worker pools by size, kept for the life of the process so the workers'
+# models stay loaded between transcriptions
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def plan_chunks(duration, silences, chunk_seconds=CHUNK_SECONDS):
+    """
+    Split [0, duration] into chunks of about chunk_seconds, cutting at the
+    middle of the silence closest to each target length. Chunks never exceed
+    1.5 * chunk_seconds; without a usable silence the cut is made at
+    chunk_seconds.
+    """
+    max_seconds = chunk_seconds * 1.5
+    cut_points = sorted((start + end) / 2 for start, end in silences)
+    bounds = [0.0]
+    position = 0.0
+    while duration - position > max_seconds:
+        target = position + chunk_seconds
+        candidates = [
+            t for t in cut_points if position + chunk_seconds * 0.5 <= t <= position + max_seconds
+        ]
+        cut = min(candidates, key=lambda t: abs(t - target)) if candidates else target
+        bounds.append(cut)
+        position = cut
+    bounds.append(duration)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _init_worker(threads):
+    # Split the cores between workers instead of every worker using all of them
+    torch.set_num_threads(threads)
+
+
+def _get_pool(workers):
+    """Pool of workers transcription processes, started on first use and then reused."""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(max(1, (os.cpu_count() or 1) // workers),),
+            )
+        return _pools[workers]
+
+
+def _drop_pool(workers, pool):
+    """Forget a pool whose worker died, so the next call starts a new one."""
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shift_segments(result, offset):
+    """Move the segments (and words) of a Whisper result offset seconds later."""
+    for seg in result.get("segments", []):
+        seg["start"] += offset
+        seg["end"] += offset
+        for w in seg.get("words") or []:
+            w["start"] += offset
+            w["end"] += offset
+    return result
+
+
+def detect_languages(model, audios):
+    """
+    Spoken language code of each 16 kHz clip, from its first 30 seconds (as
+    Whisper's transcribe() detects it), in one batched forward pass.
+    """
+    mel = torch.stack(
+        [
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels)
+            for audio in audios
+        ]
+    ).to(model.device)
+    _, probs = model.detect_language(mel)
+    return [max(p, key=p.get) for p in probs]
+
+
+def _transcribe_chunk(model_name, audio, offset, options):
+    model = get_model(model_name)
+    with model_lock(model):
+        result = model.transcribe(audio, fp16=is_fp16(model), **options)
+    return shift_segments(result, offset)
+
+
+def stitch_results(chunk_results, chunks):
+    """
+    Merge per-chunk results (already shifted to absolute time) into one
+    Whisper-shaped result. Each chunk owns [start, end) of the timeline;
+    words transcribed in another chunk's overlap are dropped by midpoint.
+    chunk_results may cover only the first chunks (the words owned so far).
+    """
+    segments = []
+    for i, (result, (own_start, own_end)) in enumerate(zip(chunk_results, chunks)):
+        if i == 0:
+            own_start = -math.inf
+        if i == len(chunks) - 1:
+            own_end = math.inf
+        for seg in result.get("segments", []):
+            words = seg.get("words")
+            if words:
+                kept = [
+                    w for w in words if own_start <= (w["start"] + w["end"]) / 2 < own_end
+                ]
+                if not kept:
+                    continue
+                merged = {
+                    **seg,
+                    "words": kept,
+                    "start": kept[0]["start"],
+                    "end": kept[-1]["end"],
+                    "text": "".join(w["word"] for w in kept),
+                }
+            else:
+                if not own_start <= (seg["start"] + seg["end"]) / 2 < own_end:
+                    continue
+                merged = dict(seg)
+            merged["id"] = len(segments)
+            segments.append(merged)
+
+    language = next((r.get("language") for r in chunk_results if r.get("language")), None)
+    return {
+        "text": "".join(seg["text"] for seg in segments),
+        "segments": segments,
+        "language": language,
+    }
+
+
+def transcribe_chunked(
+    audio,
+    model_name=DEFAULT_MODEL,
+    chunk_seconds=CHUNK_SECONDS,
+    overlap_seconds=OVERLAP_SECONDS,
+    workers=WORKERS,
+    progress_callback=None,
+    partial_callback=None,
+    **transcribe_options,
+):
+    """
+    Transcribe audio (a path or 16 kHz mono float32 array) in parallel
+    chunks and return a single Whisper-shaped result. partial_callback gets
+    (seconds covered, result so far) whenever the run of finished chunks
+    from the start grows.
+    """
+    if isinstance(audio, str):
+        audio = whisper.load_audio(audio)
+    duration = len(audio) / SAMPLE_RATE
+    chunks = plan_chunks(duration, find_silences(audio), chunk_seconds)
+    options = {"word_timestamps": True, **transcribe_options}
+    if len(chunks) > 1 and "language" not in options:
+        # Detect once so every chunk decodes in the same language
+        model = get_model(model_name)
+        with model_lock(model):
+            options["language"] = detect_languages(model, [audio])[0]
+
+    workers = max(1, workers)
+    pool = _get_pool(workers)
+    results = [None] * len(chunks)
+    try:
+        futures = {}
+        for i, (start, end) in enumerate(chunks):
+            padded_start = max(0.0, start - overlap_seconds)
+            padded_end = min(duration, end + overlap_seconds)
+            piece = audio[int(padded_start * SAMPLE_RATE) : int(padded_end * SAMPLE_RATE)]
+            future = pool.submit(_transcribe_chunk, model_name, piece, padded_start, options)
+            futures[future] = i
+        ready = 0
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(done / len(chunks))
+            if partial_callback and results[ready] is not None:
+                while ready < len(results) and results[ready] is not None:
+                    ready += 1
+                partial_callback(chunks[ready - 1][1], stitch_results(results[:ready], chunks))
+    except BrokenProcessPool:
+        _drop_pool(workers, pool)
+        raise
+
+    return stitch_results(results, chunks)
+
+
+def max_word_drift(reference, candidate):
+    """
+    Largest start-time difference (seconds) between words matched by text
+    across two Whisper results, e.g. single-pass vs. chunked.
+    """
+
+    def words(result):
+        return [
+            w
+            for seg in result.get("segments", [])
+            for w in seg.get("words") or []
+        ]
+
+    ref_words, cand_words = words(reference), words(candidate)
+    matcher = difflib.SequenceMatcher(
+        a=[w["word"].strip().lower() for w in ref_words],
+        b=[w["word"].strip().lower() for w in cand_words],
+        autojunk=False,
+    )
+    drift = 0.0
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            a, b = ref_words[block.a + k], cand_words[block.b + k]
+            drift = max(drift, abs(a["start"] - b["start"]))
+    return drift
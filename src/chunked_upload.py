@@ -0,0 +1,241 @@
+"""
+Resumable chunked uploads.
+
+A client creates an upload (init), sends the file in order as raw request
+bodies at the offset the server last acknowledged (append) and finishes it
+(complete). Chunks are streamed straight to their final offset in a partial
+file, so memory per upload is bounded by READ_CHUNK_BYTES, and the content
+hash is updated as bytes arrive. If a connection drops, the client asks for
+the received offset and carries on from there.
+
+For MP4/MOV files with the moov atom at the front, the media is probed in
+the background as soon as the atom has arrived, and the result is reused
+by probe_media once the upload completes.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import uuid
+
+from media_cache import probe_file, remember_hash, remember_probe
+from metrics import inc
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+PARTIAL_UPLOAD_FOLDER = os.path.join(BASE_DIR, "cache", "partial_uploads")
+
+READ_CHUNK_BYTES = 1024 * 1024
+# Chunk size suggested to clients
+CLIENT_CHUNK_BYTES = 8 * 1024 * 1024
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+_sessions = {}  # upload_id -> {"hasher", "lock", "probe_started"}
+_sessions_lock = threading.Lock()
+
+
+class OffsetMismatch(ValueError):
+    """Raised when a chunk doesn't start at the received offset."""
+
+    def __init__(self, received):
+        super().__init__(f"expected offset {received}")
+        self.received = received
+
+
+def _upload_dir(upload_id):
+    if not _UPLOAD_ID.match(upload_id or ""):
+        raise KeyError(upload_id)
+    return os.path.join(PARTIAL_UPLOAD_FOLDER, upload_id)
+
+
+def _data_path(upload_id):
+    return os.path.join(_upload_dir(upload_id), "data")
+
+
+def _read_state(upload_id):
+    path = os.path.join(_upload_dir(upload_id), "state.json")
+    if not os.path.exists(path):
+        raise KeyError(upload_id)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_state(upload_id, state):
+    path = os.path.join(_upload_dir(upload_id), "state.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _session(upload_id, state):
+    """In-memory hasher for an upload, rebuilt from disk after a restart."""
+    with _sessions_lock:
+        session = _sessions.get(upload_id)
+        if session is None:
+            session = {"hasher": None, "lock": threading.Lock(), "probe_started": False}
+            _sessions[upload_id] = session
+    if session["hasher"] is None:
+        hasher = hashlib.sha256()
+        with open(_data_path(upload_id), "rb") as f:
+            remaining = state["received"]
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+        session["hasher"] = hasher
+    return session
+
+
+def init_upload(filename, size):
+    """Start an upload of size bytes; returns its status."""
+    if size < 0:
+        raise ValueError("size must not be negative")
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_upload_dir(upload_id))
+    open(_data_path(upload_id), "wb").close()
+    state = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "size": size,
+        "received": 0,
+        "probe": None,
+    }
+    _write_state(upload_id, state)
+    with _sessions_lock:
+        _sessions[upload_id] = {
+            "hasher": hashlib.sha256(),
+            "lock": threading.Lock(),
+            "probe_started": False,
+        }
+    return upload_status(upload_id)
+
+
+def upload_status(upload_id):
+    state = _read_state(upload_id)
+    return {**state, "chunk_size": CLIENT_CHUNK_BYTES}
+
+
+def moov_end(path, received):
+    """
+    End offset of the top-level moov box if it has been fully received,
+    else None. Only box headers are read.
+    """
+    position = 0
+    with open(path, "rb") as f:
+        while position + 8 <= received:
+            f.seek(position)
+            header = f.read(8)
+            size, box_type = struct.unpack(">I4s", header)
+            header_size = 8
+            if size == 1:
+                if position + 16 > received:
+                    return None
+                size = struct.unpack(">Q", f.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                return None  # box runs to EOF; moov can't follow
+            if size < header_size:
+                return None  # not an MP4 box structure
+            if box_type == b"moov":
+                return position + size if position + size <= received else None
+            position += size
+    return None
+
+
+def _probe_early(upload_id):
+    try:
+        probe = probe_file(_data_path(upload_id))
+    except Exception as e:
+        print(f"Early probe failed for upload {upload_id}: {e}")
+        return
+    session = _sessions.get(upload_id)
+    if session is None:
+        return
+    with session["lock"]:
+        try:
+            state = _read_state(upload_id)
+        except KeyError:
+            return
+        state["probe"] = probe
+        _write_state(upload_id, state)
+
+
+def _maybe_start_probe(upload_id, state, session):
+    if session["probe_started"] or state["probe"] is not None:
+        return
+    if moov_end(_data_path(upload_id), state["received"]) is None:
+        return
+    session["probe_started"] = True
+    threading.Thread(target=_probe_early, args=(upload_id,), daemon=True).start()
+
+
+def append_chunk(upload_id, offset, stream):
+    """
+    Write the bytes of stream at offset, which must equal the received
+    count. Returns the new status; bytes written before a dropped connection
+    are kept and acknowledged.
+    """
+    state = _read_state(upload_id)
+    session = _session(upload_id, state)
+    if not session["lock"].acquire(blocking=False):
+        raise OffsetMismatch(state["received"])  # another append is in flight
+    try:
+        state = _read_state(upload_id)
+        if offset != state["received"]:
+            raise OffsetMismatch(state["received"])
+        hasher = session["hasher"]
+        try:
+            with open(_data_path(upload_id), "r+b") as f:
+                f.seek(offset)
+                while state["received"] < state["size"]:
+                    to_read = min(READ_CHUNK_BYTES, state["size"] - state["received"])
+                    chunk = stream.read(to_read)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    state["received"] += len(chunk)
+                    inc("autocaption_bytes_written_total", len(chunk), kind="upload")
+                f.truncate(state["received"])
+        finally:
+            _write_state(upload_id, state)
+    finally:
+        session["lock"].release()
+    _maybe_start_probe(upload_id, state, session)
+    return upload_status(upload_id)
+
+
+def complete_upload(upload_id, dest_path, expected_sha256=None):
+    """
+    Move a fully received upload to dest_path. Returns the content hash;
+    raises ValueError if bytes are missing or the hash doesn't match.
+    """
+    state = _read_state(upload_id)
+    session = _session(upload_id, state)
+    with session["lock"]:
+        state = _read_state(upload_id)
+        if state["received"] != state["size"]:
+            raise ValueError(
+                f"upload incomplete: {state['received']} of {state['size']} bytes received"
+            )
+        digest = session["hasher"].hexdigest()
+        if expected_sha256 and expected_sha256.lower() != digest:
+            raise ValueError("sha256 mismatch")
+        shutil.move(_data_path(upload_id), dest_path)
+    remember_hash(dest_path, digest)
+    if state["probe"] is not None:
+        remember_probe(dest_path, state["probe"])
+    abort_upload(upload_id)
+    return digest
+
+
+def abort_upload(upload_id):
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+    with _sessions_lock:
+        _sessions.pop(upload_id, None)
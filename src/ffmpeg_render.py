@@ -0,0 +1,272 @@
+"""
+Render backend that hands the whole render to one ffmpeg process.
+
+Captions are written as an ASS script styled like caption_style (font file,
+size, stroke, colours and position), and the highlighted word is a colour
+override inside the caption line. The script is burned in with libass,
+together with the profile's scaling and, for edits, select/aselect filters
+that keep only the kept ranges. Decoding, compositing and encoding then
+happen inside ffmpeg; Python only writes the script and the filter graph.
+
+The MoviePy backend (CaptionRenderer) stays the default; pass
+backend="ffmpeg" (or set AUTOCAPTION_RENDER_BACKEND) to use this one.
+"""
+import os
+import re
+import tempfile
+
+from PIL import ImageColor, ImageFont
+
+from ffmpeg_tools import run_ffmpeg
+from media_cache import probe_media
+from metrics import count_file, span
+from render_profiles import ENCODER_THREADS, get_profile
+
+# Title header settings of overlay_captions.create_title_header
+TITLE_SECONDS = 5
+TITLE_COLOR = "#F8EFBA"
+TITLE_BACKGROUND = "black"
+
+
+def ass_color(color):
+    """&HAABBGGRR for a PIL colour name or #RRGGBB string."""
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return f"&H00{b:02X}{g:02X}{r:02X}"
+
+
+def ass_time(seconds):
+    centiseconds = max(0, int(round(seconds * 100)))
+    h, rest = divmod(centiseconds, 360000)
+    m, rest = divmod(rest, 6000)
+    s, cs = divmod(rest, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+
+def ass_text(text):
+    """Escape text for a Dialogue line (no override blocks or \\N sequences)."""
+    return (
+        text.replace("\\", "\\\u200b")
+        .replace("{", "\\{")
+        .replace("}", "\\}")
+        .replace("\n", " ")
+    )
+
+
+def font_settings(font, font_size):
+    """
+    (font name, ASS font size) drawing font like PIL at font_size: libass
+    scales a font so that ascent + descent equals the ASS size.
+    """
+    # Metrics at a large size, so rounding to whole pixels doesn't skew the ratio
+    pil_font = ImageFont.truetype(font, 1000)
+    family, style = pil_font.getname()
+    name = family if style in ("Regular", "Book", "Normal") else f"{family} {style}"
+    ascent, descent = pil_font.getmetrics()
+    return name, round(font_size * (ascent + descent) / 1000, 2)
+
+
+def caption_line(caption, base_color, highlight_color):
+    """Caption text with the highlighted characters wrapped in colour overrides."""
+    text, highlight = caption["text"], caption["highlighted_word_line"]
+    parts = []
+    run_start = 0
+    run_highlighted = False
+    for i in range(len(text) + 1):
+        highlighted = i < len(text) and i < len(highlight) and highlight[i] != " "
+        if i == len(text) or highlighted != run_highlighted:
+            run = text[run_start:i]
+            if run:
+                if run_highlighted:
+                    parts.append(f"{{\\c{highlight_color}&}}{ass_text(run)}{{\\c{base_color}&}}")
+                else:
+                    parts.append(ass_text(run))
+            run_start, run_highlighted = i, highlighted
+    return "".join(parts)
+
+
+def build_ass(captions, style, size, title_text=""):
+    """
+    ASS script for captions (dicts as from load_captions) styled by
+    caption_style. size is the display size (as probe_media reports it):
+    libass draws on the frames after ffmpeg has autorotated them.
+    """
+    width, height = size
+    params = style["caption"]
+    name, font_size = font_settings(params["font"], params["font_size"])
+    color = ass_color(params["color"])
+    highlight = ass_color(style["highlight"]["color"])
+    stroke = ass_color(params["stroke_color"])
+    # TextClip centres the line's ascent/descent box in its (width, box)
+    # area, but counts the stroke twice in the width: the ink ends up
+    # stroke_width left of centre
+    x = width / 2 - params["stroke_width"]
+    y = style["top"] + params["size"][1] / 2
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, "
+        "BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
+        "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Caption,{name},{font_size},{color},{color},{stroke},&H00000000,"
+        f"0,0,0,0,100,100,0,0,1,{params['stroke_width']},0,5,0,0,0,1",
+    ]
+    if title_text:
+        title_font, title_size = font_settings(params["font"], int(width * 0.05925))
+        padding = int(width * 0.01851)
+        margin = int(width * 0.1)
+        background = ass_color(TITLE_BACKGROUND)
+        lines.append(
+            f"Style: Title,{title_font},{title_size},{ass_color(TITLE_COLOR)},"
+            f"{ass_color(TITLE_COLOR)},{background},{background},0,0,0,0,100,100,0,0,3,"
+            f"{padding},0,8,{margin},{margin},0,1"
+        )
+    lines += [
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    if title_text:
+        lines.append(
+            f"Dialogue: 1,{ass_time(0)},{ass_time(TITLE_SECONDS)},Title,,0,0,0,,"
+            f"{{\\q0\\an8\\pos({width // 2},{int(height * 0.156) + int(width * 0.01851)})}}"
+            f"{ass_text(title_text)}"
+        )
+    for caption in captions:
+        if not caption["text"].strip() or caption["end"] <= caption["start"]:
+            continue
+        lines.append(
+            f"Dialogue: 0,{ass_time(caption['start'])},{ass_time(caption['end'])},Caption,,"
+            f"0,0,0,,{{\\an5\\pos({x:.1f},{y:.1f})}}{caption_line(caption, color, highlight)}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _filter_path(path):
+    """
+    path escaped as a filter option value inside a filter graph: quoted for
+    the option parser, then backslash-escaped for the graph parser.
+    """
+    quoted = "'" + path.replace("\\", "/").replace("'", "'\\''") + "'"
+    return re.sub(r"([\\'\[\],;])", r"\\\1", quoted)
+
+
+def _between(ranges):
+    """select expression keeping start <= t < end of every range, like subclipped."""
+    return "+".join(f"gte(t,{start:.6f})*lt(t,{end:.6f})" for start, end in ranges)
+
+
+def _keep_args(keep, fps):
+    """
+    (input args, video filters, audio filters, output args) that keep only
+    the sorted source ranges in keep: the input is seeked to the first range
+    and read to the end of the last, and the gaps are dropped with
+    select/aselect.
+    """
+    if not keep:
+        return [], [], [], []
+    offset = keep[0][0]
+    input_args = ["-ss", f"{offset:.6f}", "-t", f"{keep[-1][1] - offset:.6f}"]
+    if len(keep) == 1:
+        return input_args, [], [], []
+    # Seeking makes t start at 0 at the offset
+    expression = _between([(start - offset, end - offset) for start, end in keep])
+    # select drops the stream's frame rate, so restamp and pin the source's.
+    # fps= first makes variable frame rate sources constant (duplicating or
+    # dropping frames by timestamp), so the restamped video stays in sync
+    # with the restamped audio.
+    rate = f"{fps:.6f}"
+    return (
+        input_args,
+        [f"fps={rate}", f"select='{expression}'", f"setpts=N/{rate}/TB"],
+        [f"aselect='{expression}'", "asetpts=N/SR/TB"],
+        ["-r", rate],
+    )
+
+
+def encoder_args(profile=None, threads=ENCODER_THREADS):
+    """libx264/aac arguments matching render_profiles.write_options."""
+    settings = get_profile(profile)
+    args = [
+        "-c:v", "libx264",
+        "-preset", settings["preset"],
+        "-crf", str(settings["crf"]),
+        "-pix_fmt", "yuv420p",
+        "-threads", str(threads),
+    ]
+    if settings["tune"]:
+        args += ["-tune", settings["tune"]]
+    return args + ["-c:a", "aac", "-b:a", settings["audio_bitrate"], "-movflags", "+faststart"]
+
+
+def ffmpeg_render(
+    video_path,
+    output_path,
+    source,
+    keep=None,
+    captions=None,
+    style=None,
+    title_text="",
+    profile=None,
+    audio_rate=None,
+    audio=True,
+    threads=ENCODER_THREADS,
+):
+    """
+    Render video_path to output_path in one ffmpeg run. source is the
+    render_source (file, size) to decode; keep is a sorted list of
+    (start, end) source ranges to keep (None keeps everything); captions
+    are on the output timeline. audio=False writes the video stream only.
+    """
+    source_path, size = source
+    probe = probe_media(video_path)
+    args, video_filters, audio_filters, output_args = _keep_args(keep, probe["fps"])
+    args += ["-i", source_path]
+    if tuple(size) != (probe["width"], probe["height"]) or source_path != video_path:
+        video_filters.append(f"scale={size[0]}:{size[1]}")
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp:
+        if captions or title_text:
+            ass_path = os.path.join(tmp, "captions.ass")
+            with open(ass_path, "w", encoding="utf-8") as f:
+                f.write(build_ass(captions or [], style, size, title_text))
+            fonts_dir = os.path.dirname(os.path.abspath(style["caption"]["font"]))
+            video_filters.append(
+                f"ass=filename={_filter_path(ass_path)}:fontsdir={_filter_path(fonts_dir)}"
+            )
+
+        args += ["-map", "0:v:0"]
+        if video_filters:
+            args += ["-filter:v", ",".join(video_filters)]
+        if audio and probe["has_audio"]:
+            args += ["-map", "0:a:0"]
+            if audio_filters:
+                args += ["-filter:a", ",".join(audio_filters)]
+            if audio_rate:
+                args += ["-ar", str(audio_rate)]
+        with span("ffmpeg_render"):
+            run_ffmpeg(args + output_args + encoder_args(profile, threads) + [output_path])
+    count_file("read", "proxy" if source_path != video_path else "original", source_path)
+    return output_path
+
+
+def render_audio(video_path, output_path, keep=None, profile=None):
+    """
+    Encode just the audio of the keep ranges of video_path (AAC at the
+    profile's bitrate, in one run so there are no gaps between ranges).
+    """
+    args, _, audio_filters, _ = _keep_args(keep, probe_media(video_path)["fps"])
+    args += ["-i", video_path, "-map", "0:a:0", "-vn"]
+    if audio_filters:
+        args += ["-filter:a", ",".join(audio_filters)]
+    args += ["-c:a", "aac", "-b:a", get_profile(profile)["audio_bitrate"], output_path]
+    with span("render_audio"):
+        run_ffmpeg(args)
+    count_file("read", "original", video_path)
+    return output_path
@@ -0,0 +1,127 @@
+"""
+Helpers for calling ffmpeg / ffprobe directly, for work that doesn't need
+MoviePy to pull every frame through Python (probing, stream copies, concat).
+"""
+import json
+import os
+import shutil
+import subprocess
+
+import imageio_ffmpeg
+
+
+def ffmpeg_exe():
+    """ffmpeg on PATH, else the binary bundled with imageio-ffmpeg (what MoviePy uses)."""
+    return shutil.which("ffmpeg") or imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def ffprobe_exe():
+    """ffprobe on PATH, else one sitting next to the ffmpeg binary."""
+    path = shutil.which("ffprobe")
+    if path:
+        return path
+    sibling = os.path.join(os.path.dirname(ffmpeg_exe()), "ffprobe")
+    for candidate in (sibling, sibling + ".exe"):
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError("ffprobe not found; install FFmpeg and add it to PATH")
+
+
+def run_ffmpeg(args):
+    """Run ffmpeg with args (overwriting outputs). Raises RuntimeError with stderr on failure."""
+    cmd = [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y", *args]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.strip()[-2000:]}")
+    return proc
+
+
+def run_ffprobe(args):
+    """Run ffprobe with JSON output and return the parsed result."""
+    cmd = [ffprobe_exe(), "-v", "error", "-of", "json", *args]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {proc.stderr.strip()[-2000:]}")
+    return json.loads(proc.stdout or "{}")
+
+
+def probe_streams(video_path):
+    """
+    Return {"format": ..., "video": stream dict or None, "audio": stream dict or None}
+    for the first video and audio streams.
+    """
+    data = run_ffprobe(["-show_format", "-show_streams", video_path])
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    return {"format": data.get("format", {}), "video": video, "audio": audio}
+
+
+def stream_rotation(stream):
+    """
+    Rotation (0, 90, 180 or 270 degrees) a video stream from probe_streams
+    is displayed with: its display matrix side data, else its rotate tag.
+    ffmpeg applies it while decoding, so frames come out rotated.
+    """
+    for side_data in stream.get("side_data_list") or []:
+        if "rotation" in side_data:
+            return int(round(float(side_data["rotation"]))) % 360
+    rotate = (stream.get("tags") or {}).get("rotate")
+    return int(round(float(rotate))) % 360 if rotate else 0
+
+
+def display_size(width, height, rotation):
+    """(width, height) of frames as displayed (and decoded) after rotation."""
+    return (height, width) if rotation % 180 == 90 else (width, height)
+
+
+def parse_rate(rate):
+    """Parse an ffprobe rate like "30000/1001" into a float (0.0 if unknown)."""
+    if not rate or rate == "0/0":
+        return 0.0
+    if "/" in rate:
+        num, den = rate.split("/", 1)
+        return float(num) / float(den) if float(den) else 0.0
+    return float(rate)
+
+
+def probe_keyframes(video_path, start=None, end=None):
+    """
+    Sorted keyframe timestamps (seconds) of the first video stream, read
+    from packet flags so nothing is decoded. With start/end only the
+    packets around that window are read.
+    """
+    args = ["-select_streams", "v:0", "-show_entries", "packet=pts_time,flags"]
+    if start is not None and end is not None:
+        # Back off far enough to find the keyframe before start
+        args += ["-read_intervals", f"{max(0.0, start - 30):.3f}%{end + 1:.3f}"]
+    data = run_ffprobe([*args, video_path])
+    keyframes = set()
+    for packet in data.get("packets", []):
+        if "K" in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A"):
+            keyframes.add(float(packet["pts_time"]))
+    return sorted(keyframes)
+
+
+def concat_copy(segment_paths, output_path, audio_path=None):
+    """
+    Losslessly join segments encoded with matching parameters (concat
+    demuxer, stream copy). With audio_path, the segments' video is muxed
+    with that file's audio track instead.
+    """
+    list_path = f"{output_path}.concat.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        args += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+    try:
+        run_ffmpeg(args + ["-c", "copy", "-movflags", "+faststart", output_path])
+    finally:
+        try:
+            os.remove(list_path)
+        except OSError:
+            pass
+    return output_path
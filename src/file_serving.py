@@ -0,0 +1,66 @@
+"""
+Serving large media files (uploads, rendered outputs) to the browser.
+
+Files are sent with Flask's send_file, which handles conditional requests
+(ETag / Last-Modified) and byte ranges, seeking the open file to a range's
+start; whole-file responses keep the server's wsgi.file_wrapper, so servers
+such as gunicorn can transmit them with sendfile().
+
+With AUTOCAPTION_SENDFILE_MODE set, the bytes are left to a fronting server:
+"x-accel" returns an X-Accel-Redirect (nginx) under AUTOCAPTION_X_ACCEL_PREFIX,
+"x-sendfile" an X-Sendfile header (Apache mod_xsendfile, lighttpd).
+"""
+import mimetypes
+import os
+
+from flask import send_file
+from werkzeug.wrappers import Response
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+SENDFILE_MODES = ("", "x-accel", "x-sendfile")
+SENDFILE_MODE = os.environ.get("AUTOCAPTION_SENDFILE_MODE", "").strip().lower()
+if SENDFILE_MODE not in SENDFILE_MODES:
+    raise ValueError(f"AUTOCAPTION_SENDFILE_MODE must be one of {SENDFILE_MODES[1:]}")
+# nginx "internal" location that maps onto BASE_DIR
+X_ACCEL_PREFIX = os.environ.get("AUTOCAPTION_X_ACCEL_PREFIX", "/_protected").rstrip("/")
+
+
+def _proxy_response(path, mimetype):
+    response = Response(mimetype=mimetype)
+    if SENDFILE_MODE == "x-sendfile":
+        response.headers["X-Sendfile"] = os.path.abspath(path)
+    else:
+        relative = os.path.relpath(os.path.abspath(path), BASE_DIR).replace(os.sep, "/")
+        if relative.startswith("../"):
+            raise ValueError(f"{path} is outside {BASE_DIR}; cannot X-Accel-Redirect")
+        response.headers["X-Accel-Redirect"] = f"{X_ACCEL_PREFIX}/{relative}"
+    return response
+
+
+def serve_file(path, mimetype=None, as_attachment=False, download_name=None):
+    """
+    Response for path with range and conditional request support, or a
+    redirect header for the fronting server when SENDFILE_MODE is set.
+    """
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if not SENDFILE_MODE:
+        # Werkzeug's ETag is built from mtime, size and path, so a 2 GB upload
+        # is never hashed here; outputs are overwritten in place under the same
+        # name, and without a max age (the app default) they always revalidate
+        return send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            conditional=True,
+        )
+
+    response = _proxy_response(path, mimetype)
+    if as_attachment:
+        response.headers.set(
+            "Content-Disposition",
+            "attachment",
+            filename=download_name or os.path.basename(path),
+        )
+    return response
@@ -1,13 +1,31 @@
-import json
 import os
-import whisper
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from whisper.utils import get_writer
-from moviepy import VideoFileClip
+from artifact_store import artifact_key, contains, fetch, put
+from batched_transcribe import fits_one_window, transcribe_batch
+from media_cache import file_hash, get_duration, load_audio
+from model_cache import DEFAULT_MODEL, get_model, is_fp16, model_lock
+from chunked_transcribe import CHUNKED_MIN_SECONDS, detect_languages, transcribe_chunked
+from streaming_transcribe import whisper_options, whisper_progress
+from proxy import proxy_path
+from metrics import span
+from transcript_store import (
+    clear_edits,
+    load_transcript,
+    transcript_path as edit_transcript_path,
+    write_transcript,
+)
+
+# Clips per batched forward pass (language detection, decoding) in generate_captions_batch
+BATCH_SIZE = 16
+WORD_OPTIONS = {"highlight_words": True, "max_line_count": 1, "max_line_width": 20}
+# Stored names of a transcript artifact
+TRANSCRIPT_FILES = ("captions.vtt", "transcript.bin")
 
 
 def get_video_duration(video_path):
-    with VideoFileClip(video_path) as clip:
-        return float(clip.duration)
+    return get_duration(video_path)
 
 
 def build_edit_transcript(result, video_duration):
@@ -84,28 +102,276 @@ def build_edit_transcript(result, video_duration):
     return segments
 
 
-def generate_captions(video_path="input_video.mp4"):
-    model = whisper.load_model("base")
-    result = model.transcribe(video_path, word_timestamps=True)
+def use_chunks(video_path, chunked=None):
+    """chunked as generate_captions applies it (None: by the video's length)."""
+    if chunked is None:
+        return 0 < CHUNKED_MIN_SECONDS <= get_video_duration(video_path)
+    return bool(chunked)
+
+
+def transcript_key(video_path, model_name, chunked, chunk_options, options):
+    """Artifact key of a transcript: same media + model + options reuse it."""
+    key_parts = {
+        "media": file_hash(video_path),
+        "model": model_name,
+        "word_options": WORD_OPTIONS,
+        "chunked": chunked,
+        "chunk_options": chunk_options or {},
+    }
+    if options:
+        key_parts["whisper_options"] = options
+    return artifact_key(**key_parts)
+
+
+def generate_captions(
+    video_path="input_video.mp4",
+    model_name=DEFAULT_MODEL,
+    progress_callback=None,
+    chunked=None,
+    chunk_options=None,
+    output_dir=None,
+    use_proxy=True,
+    language=None,
+    task=None,
+    segment_callback=None,
+    detected_language=None,
+    decoded=None,
+):
+    """
+    Transcribe video_path and write its VTT and edit transcript to output_dir
+    (default uploads/). chunked=None transcribes in parallel chunks when the video is at least
+    CHUNKED_MIN_SECONDS long; chunk_options is passed to transcribe_chunked
+    (chunk_seconds, overlap_seconds, workers). With use_proxy the audio is
+    read from the editing proxy when one is ready.
+
+    language and task are Whisper options (see whisper_options). With
+    segment_callback, after each of Whisper's 30-second windows (see
+    streaming_transcribe), or each chunk that extends the finished start of
+    a chunked run, both files are rewritten with the text so far and
+    segment_callback gets the new edit-transcript segments. Streaming
+    doesn't change the transcript.
+    detected_language is a language already detected for this video (see
+    generate_captions_batch). It is used like language but kept out of the
+    cache key, since Whisper would detect the same one. decoded is an
+    unchunked Whisper result for the video from a batched decode (see
+    batched_transcribe); it is written instead of transcribing again.
+    """
+    options = whisper_options(language, task)
+    video_duration = get_video_duration(video_path)
+    chunked = use_chunks(video_path, chunked)
 
     video_name = os.path.splitext(os.path.basename(video_path))[0]
-    uploads_folder = os.path.join(os.path.dirname(__file__), "uploads")
+    uploads_folder = output_dir or os.path.join(os.path.dirname(__file__), "uploads")
 
     os.makedirs(uploads_folder, exist_ok=True)
 
     vtt_file_path = os.path.join(uploads_folder, f"{video_name}.vtt")
+    transcript_path = edit_transcript_path(video_path, uploads_folder)
 
-    word_options = {"highlight_words": True, "max_line_count": 1, "max_line_width": 20}
+    key = transcript_key(video_path, model_name, chunked, chunk_options, options)
+    outputs = dict(zip(TRANSCRIPT_FILES, (vtt_file_path, transcript_path)))
+    # Deleted ids refer to the transcript being replaced
+    clear_edits(video_path, uploads_folder)
+    if fetch("transcript", key, outputs):
+        if progress_callback:
+            progress_callback(1.0)
+        if segment_callback:
+            segment_callback(load_transcript(transcript_path).segments())
+        print(f"Reused cached transcript for {video_path}")
+        return
 
-    vtt_writer = get_writer(output_format="vtt", output_dir=uploads_folder)
-    vtt_writer(result, vtt_file_path, word_options)
+    if detected_language and "language" not in options:
+        options["language"] = detected_language
+    audio = decode_audio(video_path, use_proxy) if decoded is None else None
+    sent = 0
 
-    # Build and save word-level edit transcript (words + silences)
-    video_duration = get_video_duration(video_path)
-    edit_transcript = build_edit_transcript(result, video_duration)
-    transcript_path = os.path.join(uploads_folder, f"{video_name}_transcript.json")
-    with open(transcript_path, "w", encoding="utf-8") as f:
-        json.dump({"segments": edit_transcript, "duration": video_duration}, f, indent=2)
+    def partial_result(covered, result):
+        nonlocal sent
+        write_outputs(result, vtt_file_path, transcript_path, covered, WORD_OPTIONS)
+        # Without the trailing silence, which the next part of the result extends
+        segments = build_edit_transcript(result, 0)
+        segment_callback(segments[sent:])
+        sent = len(segments)
+
+    if decoded is not None:
+        result = decoded
+        if progress_callback:
+            progress_callback(1.0)
+    elif chunked:
+        with span("transcribe"):
+            result = transcribe_chunked(
+                audio,
+                model_name=model_name,
+                progress_callback=progress_callback,
+                partial_callback=partial_result if segment_callback else None,
+                **(chunk_options or {}),
+                **options,
+            )
+    else:
+        with span("model_load"):
+            model = get_model(model_name)
+        streamed = []
+
+        def window_done(covered, segments):
+            for seg in segments:
+                streamed.append({"id": len(streamed), **seg})
+            text = "".join(seg["text"] for seg in streamed)
+            partial_result(
+                covered,
+                {"text": text, "segments": streamed, "language": options.get("language")},
+            )
+
+        with span("transcribe"), model_lock(model), whisper_progress(
+            progress_callback, window_done if segment_callback else None
+        ):
+            result = model.transcribe(
+                audio, word_timestamps=True, fp16=is_fp16(model), **options
+            )
+
+    edit_transcript = write_outputs(
+        result, vtt_file_path, transcript_path, video_duration, WORD_OPTIONS
+    )
+    if segment_callback:
+        segment_callback(edit_transcript[sent:])
+
+    put("transcript", key, outputs)
 
     print(f"VTT file saved as: {vtt_file_path}")
     print(f"Edit transcript saved as: {transcript_path}")
+
+
+def write_outputs(result, vtt_file_path, transcript_path, duration, word_options):
+    """Write the VTT and the word-level edit transcript of result; returns the latter."""
+    with span("write_captions"):
+        vtt_writer = get_writer(
+            output_format="vtt", output_dir=os.path.dirname(vtt_file_path)
+        )
+        vtt_writer(result, vtt_file_path, word_options)
+
+        # Build and save word-level edit transcript (words + silences)
+        edit_transcript = build_edit_transcript(result, duration)
+        write_transcript(transcript_path, edit_transcript, duration)
+    return edit_transcript
+
+
+def generate_captions_batch(
+    video_paths,
+    model_name=DEFAULT_MODEL,
+    language=None,
+    task=None,
+    progress_callback=None,
+    segment_callback=None,
+    **caption_options,
+):
+    """
+    Caption several (short) videos as one batch: their audio is decoded in
+    parallel threads while the model loads, and unless language is given
+    their languages are detected in batched forward passes (BATCH_SIZE clips
+    each) instead of one pass per video. Videos that fit in one 30-second
+    window and have no cached transcript are then decoded together, per
+    language (see batched_transcribe). Each video's captions are written as
+    in generate_captions (caption_options are passed on), which transcribes
+    the videos the batched decode left out on their own.
+    segment_callback(video_path, segments) gets each video's new segments.
+    Returns {video_path: error message or None}.
+    """
+    options = whisper_options(language, task)  # fail before any work on a bad option
+    use_proxy = caption_options.get("use_proxy", True)
+    with ThreadPoolExecutor(max_workers=min(len(video_paths), 4) or 1) as pool:
+        decoded = {
+            path: pool.submit(decode_audio, path, use_proxy) for path in video_paths
+        }
+        with span("model_load"):
+            model = get_model(model_name)
+        audios = {}
+        errors = {}
+        for path, future in decoded.items():
+            try:
+                audios[path] = future.result()
+            except Exception as e:
+                errors[path] = str(e)
+
+    languages = {}
+    if not language:
+        paths = list(audios)
+        if not model.is_multilingual:
+            # English-only models have no language tokens to detect with
+            languages = dict.fromkeys(paths, "en")
+        else:
+            for i in range(0, len(paths), BATCH_SIZE):
+                batch = paths[i : i + BATCH_SIZE]
+                with span("detect_language"), model_lock(model):
+                    detected = detect_languages(model, [audios[path] for path in batch])
+                languages.update(zip(batch, detected))
+
+    results = _decode_batched(model, model_name, audios, languages, options, caption_options)
+
+    for done, path in enumerate(video_paths, start=1):
+        if path not in errors:
+            try:
+                generate_captions(
+                    path,
+                    model_name=model_name,
+                    language=language,
+                    task=task,
+                    detected_language=languages.get(path),
+                    decoded=results.get(path),
+                    segment_callback=(
+                        partial(segment_callback, path) if segment_callback else None
+                    ),
+                    **caption_options,
+                )
+            except Exception as e:
+                errors[path] = str(e)
+        if progress_callback:
+            progress_callback(done / len(video_paths))
+    return {path: errors.get(path) for path in video_paths}
+
+
+def _decode_batched(model, model_name, audios, languages, options, caption_options):
+    """
+    {video_path: Whisper result} of the videos in audios (16 kHz) that
+    generate_captions would transcribe in one window and has no cached
+    transcript for, decoded BATCH_SIZE at a time per language.
+    """
+    chunk_options = caption_options.get("chunk_options")
+    by_language = {}
+    for path, audio in audios.items():
+        language = options.get("language") or languages.get(path)
+        if not language or use_chunks(path, caption_options.get("chunked")):
+            continue
+        key = transcript_key(path, model_name, False, chunk_options, options)
+        if fits_one_window(audio) and not contains("transcript", key, TRANSCRIPT_FILES):
+            by_language.setdefault(language, []).append(path)
+
+    results = {}
+    for language, paths in by_language.items():
+        for i in range(0, len(paths), BATCH_SIZE):
+            batch = paths[i : i + BATCH_SIZE]
+            try:
+                with span("transcribe"), model_lock(model):
+                    decoded = transcribe_batch(
+                        model, [audios[path] for path in batch], language, options.get("task")
+                    )
+            except Exception as e:
+                # Left to generate_captions, one video at a time
+                print(f"Batched decode failed, transcribing one by one: {e}")
+                continue
+            results.update(
+                (path, result) for path, result in zip(batch, decoded) if result is not None
+            )
+    return results
+
+
+def decode_audio(video_path, use_proxy=True):
+    """
+    16 kHz audio of video_path for transcription. With use_proxy the audio
+    is taken from the editing proxy when it is ready (its build may already
+    have cached the audio); otherwise only the original's audio stream is
+    decoded, rather than waiting for a proxy encode.
+    """
+    source = proxy_path(video_path) if use_proxy else None
+
+    # Decoded once and shared with later silence detection / re-runs
+    with span("audio_decode"):
+        return load_audio(video_path, source=source)
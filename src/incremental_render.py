@@ -0,0 +1,193 @@
+"""
+Incremental re-render for transcript edits.
+
+The output is encoded as independent segments: every keep range is split
+on a fixed grid of source time (SEGMENT_SECONDS), and each segment is keyed
+by its source range and the captions overlapping it. After an edit only the
+segments whose range or captions changed are encoded again; everything else
+comes from the artifact store and is joined with a stream-copy concat.
+With the ffmpeg backend each segment is one ffmpeg_render run instead.
+Segments are video only: the audio of all keep ranges is encoded once per
+render, in a single ffmpeg run, and muxed in during the concat (as in
+parallel_render), so there are no AAC priming gaps or drift at the joins.
+"""
+import math
+import os
+import tempfile
+import time
+
+from artifact_store import artifact_key, cached_output, put, stored_path
+from caption_render import CaptionRenderer
+from ffmpeg_render import ffmpeg_render, render_audio
+from ffmpeg_tools import concat_copy
+from media_cache import file_hash, probe_media
+from metrics import count_file, span
+from overlay_captions import caption_style, get_vtt_path, render_key
+from render_profiles import (
+    get_backend,
+    get_profile,
+    open_video,
+    render_source,
+    write_options,
+)
+from transcript_edit import ranges_to_keep, remap_captions
+from vtt import load_captions
+
+SEGMENT_SECONDS = float(os.environ.get("AUTOCAPTION_SEGMENT_SECONDS", "10"))
+
+
+def snap_to_frame(t, fps):
+    return round(t * fps) / fps
+
+
+def plan_segments(keep, fps, segment_seconds=SEGMENT_SECONDS):
+    """
+    Split keep ranges on a fixed grid of source time, with every boundary
+    snapped to a frame. A grid cell that an edit doesn't touch keeps the
+    same (start, end), so its cached segment stays valid.
+    """
+    half_frame = 0.5 / fps
+    segments = []
+    for start, end in keep:
+        start, end = snap_to_frame(start, fps), snap_to_frame(end, fps)
+        t = start
+        while t < end - half_frame:
+            next_grid = (math.floor(t / segment_seconds + 1e-9) + 1) * segment_seconds
+            seg_end = min(end, snap_to_frame(next_grid, fps))
+            if seg_end <= t + half_frame:
+                seg_end = end
+            segments.append((t, seg_end))
+            t = seg_end
+    return segments
+
+
+def segment_key(
+    media_hash,
+    start,
+    end,
+    captions,
+    style,
+    profile=None,
+    source="original",
+    backend=None,
+):
+    return artifact_key(
+        media=media_hash,
+        source=source,
+        range=[round(start, 4), round(end, 4)],
+        captions=[
+            [round(c["start"], 4), round(c["end"], 4), c["text"], c["highlighted_word_line"]]
+            for c in captions
+        ],
+        style=style,
+        profile=get_profile(profile),
+        audio=False,
+        backend=get_backend(backend),
+    )
+
+
+def render_incremental(
+    video_path, output_path, cut_ranges, logger="bar", profile=None, backend=None
+):
+    """
+    Render the captioned video with cut_ranges removed, re-encoding only
+    segments not already in the store.
+    """
+    source = render_source(video_path, profile)
+    backend = get_backend(backend)
+    return cached_output(
+        "render",
+        render_key(video_path, cut_ranges, profile=profile, source=source, backend=backend),
+        output_path,
+        lambda: _render_segments(
+            video_path, output_path, cut_ranges, logger, profile, source, backend
+        ),
+    )
+
+
+def _render_segments(video_path, output_path, cut_ranges, logger, profile, source, backend):
+    # The ffmpeg backend decodes each segment itself
+    full = open_video(video_path, profile, source) if backend == "moviepy" else None
+    source_kind = "original" if source[0] == video_path else "proxy"
+    try:
+        probe = probe_media(video_path)
+        if full is None:
+            fps, duration = probe["fps"], probe["duration"]
+        else:
+            fps, duration = full.fps, float(full.duration)
+        # On frames, so the audio covers exactly the frames the segments encode
+        keep = [
+            (snap_to_frame(start, fps), snap_to_frame(end, fps))
+            for start, end in ranges_to_keep(cut_ranges, duration)
+        ]
+        keep = [(start, end) for start, end in keep if end > start]
+        if not keep:
+            raise ValueError("All video would be cut; nothing to keep")
+
+        media_hash = file_hash(video_path)
+        style = caption_style(*source[1])
+        captions = load_captions(get_vtt_path(video_path))
+
+        segment_paths = []
+        encoded = 0
+        segments = plan_segments(keep, fps)
+        with tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(output_path))
+        ) as tmp:
+            for start, end in segments:
+                # Captions overlapping this segment, relative to its start
+                seg_captions = remap_captions(captions, [(start, end)])
+                key = segment_key(
+                    media_hash, start, end, seg_captions, style, profile, source_kind, backend
+                )
+                path = stored_path("segment", key, "segment.mp4")
+                if path is None and full is None:
+                    tmp_path = os.path.join(tmp, f"{key}.mp4")
+                    ffmpeg_render(
+                        video_path,
+                        tmp_path,
+                        source,
+                        keep=[(start, end)],
+                        captions=seg_captions,
+                        style=style,
+                        profile=profile,
+                        audio=False,
+                    )
+                    put("segment", key, {"segment.mp4": tmp_path})
+                    path = stored_path("segment", key, "segment.mp4") or tmp_path
+                    encoded += 1
+                elif path is None:
+                    tmp_path = os.path.join(tmp, f"{key}.mp4")
+                    # Not closed individually: subclips share full's readers
+                    renderer = CaptionRenderer(seg_captions, style, full.size)
+                    clip = full.subclipped(start, end).transform(renderer)
+                    write_start = time.perf_counter()
+                    clip.write_videofile(
+                        tmp_path,
+                        fps=fps,
+                        audio=False,
+                        logger=logger,
+                        **write_options(profile),
+                    )
+                    renderer.record_timings(time.perf_counter() - write_start)
+                    put("segment", key, {"segment.mp4": tmp_path})
+                    path = stored_path("segment", key, "segment.mp4") or tmp_path
+                    encoded += 1
+                segment_paths.append(path)
+
+            audio_path = None
+            if probe["has_audio"]:
+                audio_path = render_audio(
+                    video_path, os.path.join(tmp, "audio.m4a"), keep, profile
+                )
+            with span("concat"):
+                concat_copy(segment_paths, output_path, audio_path)
+            count_file("written", "render", output_path)
+        print(
+            f"Incremental render: encoded {encoded} of {len(segments)} segments "
+            f"for {output_path}"
+        )
+    finally:
+        if full is not None:
+            full.close()
+    return output_path
@@ -0,0 +1,459 @@
+"""
+Background jobs for the heavy routes (transcription and rendering).
+
+Submitting a job returns an id immediately. The work runs in a bounded pool
+of worker processes per job type, so a long render never ties up a request
+thread, and each type has its own concurrency limit so parallel encodes
+don't oversubscribe CPU-only machines. Workers report progress back through
+a shared queue, fed by MoviePy's proglog logger and Whisper's segment loop.
+The same queue carries each job's stage timings and counters back to the
+server's metrics registry when the job ends, and the transcript segments a
+transcription job has decoded so far (streamed by /jobs/<id>/events).
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import proglog
+
+import metrics
+from generate_captions import generate_captions, generate_captions_batch
+from overlay_captions import overlay_captions
+from incremental_render import render_incremental
+from parallel_render import RENDER_WORKERS, render_parallel
+from trim_video import get_video_duration, trim_video
+
+
+def parse_job_limits(spec):
+    """Parse "process=1,render=2" into {"process": 1, "render": 2}."""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+# Max concurrent jobs per type. Whisper and libx264 both use several threads
+# on their own, so the defaults stay well below the core count.
+JOB_LIMITS = {
+    "process": 1,
+    "render": max(1, (os.cpu_count() or 2) // 4),
+    "trim": 2,
+}
+JOB_LIMITS.update(parse_job_limits(os.environ.get("AUTOCAPTION_JOB_LIMITS", "")))
+# Chunk workers per parallel export: render jobs run side by side, so each
+# gets its share of RENDER_WORKERS rather than all of them
+EXPORT_WORKERS = max(1, RENDER_WORKERS // JOB_LIMITS["render"])
+
+MAX_FINISHED_JOBS = 500
+# Streamed segments of a finished job are dropped after this long
+SEGMENT_RETENTION_SECONDS = 600
+# Segment batches kept per job for /jobs/<id>/events; older ones are dropped
+# (the transcript written so far has them), so memory doesn't grow with input length
+MAX_SEGMENT_EVENTS = 256
+
+# "spawn" so workers don't inherit Flask's threads or torch state via fork
+_ctx = multiprocessing.get_context("spawn")
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executors = {}
+_executors_lock = threading.Lock()
+_manager = None
+_progress_queue = None
+
+
+# --- Worker side -------------------------------------------------------------
+
+_worker_queue = None
+_worker_job_id = None
+
+
+def report_progress(stage, fraction=None):
+    """Report the current stage (and 0..1 progress within it) of the running job."""
+    if _worker_queue is None:
+        return
+    _worker_queue.put((_worker_job_id, stage, fraction))
+
+
+def report_segments(video_path, segments):
+    """Send edit-transcript segments of video_path decoded by the running job."""
+    if _worker_queue is None or not segments:
+        return
+    _worker_queue.put(
+        (_worker_job_id, "segments", {"file": os.path.basename(video_path), "segments": segments})
+    )
+
+
+def stage_progress(stage):
+    """Callback for generate_captions(progress_callback=...) that reports under stage."""
+    return lambda fraction: report_progress(stage, fraction)
+
+
+class JobProgressLogger(proglog.ProgressBarLogger):
+    """Forward MoviePy's frame progress bar to the running job."""
+
+    def __init__(self, stage):
+        super().__init__()
+        self.stage = stage
+        self._last_fraction = -1.0
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar != "frame_index" or attr != "index":
+            return
+        total = self.bars[bar].get("total")
+        if not total:
+            return
+        fraction = min(1.0, value / total)
+        if fraction - self._last_fraction >= 0.01 or fraction >= 1.0:
+            self._last_fraction = fraction
+            report_progress(self.stage, fraction)
+
+
+def process_task(
+    video_path, output_path, profile=None, backend=None, language=None, task=None
+):
+    report_progress("transcribe", 0.0)
+    generate_captions(
+        video_path,
+        progress_callback=stage_progress("transcribe"),
+        language=language,
+        task=task,
+        segment_callback=partial(report_segments, video_path),
+    )
+    report_progress("render", 0.0)
+    overlay_captions(
+        video_path,
+        output_path,
+        logger=JobProgressLogger("render"),
+        profile=profile,
+        backend=backend,
+    )
+    return {"output_file": os.path.basename(output_path), "output_path": output_path}
+
+
+def transcribe_batch_task(video_paths, language=None, task=None):
+    report_progress("transcribe", 0.0)
+    errors = generate_captions_batch(
+        video_paths,
+        language=language,
+        task=task,
+        progress_callback=stage_progress("transcribe"),
+        segment_callback=report_segments,
+    )
+    return {
+        "files": [
+            {"file": os.path.basename(path), "error": error} for path, error in errors.items()
+        ]
+    }
+
+
+def reprocess_task(video_path, output_path, profile=None, backend=None):
+    report_progress("render", 0.0)
+    overlay_captions(
+        video_path,
+        output_path,
+        logger=JobProgressLogger("render"),
+        profile=profile,
+        backend=backend,
+    )
+    return {"output_file": os.path.basename(output_path), "output_path": output_path}
+
+
+def reprocess_edited_task(video_path, output_path, cut_ranges, profile=None, backend=None):
+    report_progress("render", 0.0)
+    render_incremental(
+        video_path,
+        output_path,
+        cut_ranges,
+        logger=JobProgressLogger("render"),
+        profile=profile,
+        backend=backend,
+    )
+    return {
+        "output_file": os.path.basename(output_path),
+        "output_path": output_path,
+        "cut_ranges": cut_ranges,
+    }
+
+
+def export_task(video_path, output_path, cut_ranges, profile="final", backend=None):
+    report_progress("render", 0.0)
+    render_parallel(
+        video_path,
+        output_path,
+        cut_ranges,
+        profile=profile,
+        backend=backend,
+        workers=EXPORT_WORKERS,
+        progress_callback=stage_progress("render"),
+    )
+    return {
+        "output_file": os.path.basename(output_path),
+        "output_path": output_path,
+        "cut_ranges": cut_ranges,
+    }
+
+
+def trim_task(
+    video_path,
+    output_path,
+    start_seconds,
+    end_seconds,
+    mode="exact",
+    profile=None,
+    backend=None,
+):
+    report_progress("trim", 0.0)
+    trim_video(
+        video_path,
+        output_path,
+        start_seconds,
+        end_seconds,
+        logger=JobProgressLogger("trim"),
+        mode=mode,
+        profile=profile,
+        backend=backend,
+    )
+    return {
+        "trimmed_filename": os.path.basename(output_path),
+        "output_path": output_path,
+        "duration": get_video_duration(output_path),
+    }
+
+
+TASKS = {
+    "process": process_task,
+    "transcribe_batch": transcribe_batch_task,
+    "reprocess": reprocess_task,
+    "reprocess_edited": reprocess_edited_task,
+    "export": export_task,
+    "trim": trim_task,
+}
+
+
+def _run_in_worker(job_id, queue, task_name, kwargs, cprofile_path=None):
+    global _worker_queue, _worker_job_id
+    _worker_queue, _worker_job_id = queue, job_id
+    metrics.drain()  # anything left from work outside a job
+    try:
+        report_progress("started", 0.0)
+        if cprofile_path:
+            return metrics.profiled(cprofile_path, TASKS[task_name], **kwargs)
+        return TASKS[task_name](**kwargs)
+    finally:
+        # Sent even when the task failed, so slow failures still show up
+        queue.put((job_id, "metrics", metrics.drain()))
+        _worker_queue = _worker_job_id = None
+
+
+# --- Server side -------------------------------------------------------------
+
+
+def _ensure_started():
+    global _manager, _progress_queue
+    if _progress_queue is None:
+        _manager = _ctx.Manager()
+        _progress_queue = _manager.Queue()
+        threading.Thread(target=_drain_progress, daemon=True).start()
+
+
+def _executor(job_type):
+    with _executors_lock:
+        if job_type not in _executors:
+            _executors[job_type] = ProcessPoolExecutor(
+                max_workers=JOB_LIMITS.get(job_type, 1), mp_context=_ctx
+            )
+        return _executors[job_type]
+
+
+def _drop_executor(job_type, executor):
+    """Forget a pool whose worker died, so the next job of the type starts a new one."""
+    with _executors_lock:
+        if _executors.get(job_type) is not executor:
+            return  # already replaced
+        del _executors[job_type]
+    executor.shutdown(wait=False)
+
+
+def _drain_progress():
+    while True:
+        try:
+            job_id, stage, fraction = _progress_queue.get()
+        except (EOFError, OSError):
+            return
+        if stage == "metrics":
+            metrics.merge(fraction)
+            # The worker's last message: every segment of the job has arrived
+            with _jobs_lock:
+                job = _jobs.get(job_id)
+                if job is not None:
+                    job["reported"] = True
+            continue
+        if stage == "segments":
+            # Kept even when the job already finished (see "reported")
+            with _jobs_lock:
+                job = _jobs.get(job_id)
+                if job is not None and job["segments"] is not None:
+                    job["segments"].append(fraction)
+                    dropped = len(job["segments"]) - MAX_SEGMENT_EVENTS
+                    if dropped > 0:
+                        del job["segments"][:dropped]
+                        job["segments_dropped"] += dropped
+            continue
+        with _jobs_lock:
+            job = _jobs.get(job_id)
+            if job is None or job["status"] not in ("queued", "running"):
+                continue
+            if job["status"] == "queued":
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            if stage != "started":
+                job["stage"] = stage
+                job["progress"] = fraction
+
+
+def _on_done(job_id, job_type, executor, future):
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        _drop_executor(job_type, executor)
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        job["finished_at"] = time.time()
+        # Cancelled futures (pending jobs at executor shutdown) raise from exception()
+        error = "cancelled" if future.cancelled() else future.exception()
+        metrics.observe(
+            "autocaption_job_seconds",
+            job["finished_at"] - (job["started_at"] or job["created_at"]),
+            type=job["type"],
+            status="failed" if error is not None else "done",
+        )
+        if error is not None:
+            job["status"] = "failed"
+            job["error"] = str(error)
+        else:
+            job["status"] = "done"
+            job["progress"] = 1.0
+            job["result"] = future.result()
+
+
+def _prune_finished():
+    """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS. Caller holds _jobs_lock."""
+    finished = [j for j in _jobs.values() if j["status"] in ("done", "failed")]
+    finished.sort(key=lambda j: j["finished_at"])
+    for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job["id"]]
+    cutoff = time.time() - SEGMENT_RETENTION_SECONDS
+    for job in finished:
+        if job["finished_at"] < cutoff:
+            job["segments"] = None
+
+
+def submit(job_type, task_name, cprofile_path=None, **kwargs):
+    """
+    Queue TASKS[task_name](**kwargs) on the job_type pool and return its job id.
+    With cprofile_path the task runs under cProfile and its stats go there.
+    """
+    if task_name not in TASKS:
+        raise ValueError(f"Unknown task: {task_name}")
+    _ensure_started()
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _prune_finished()
+        _jobs[job_id] = {
+            "id": job_id,
+            "type": job_type,
+            "task": task_name,
+            "status": "queued",
+            "stage": None,
+            "progress": 0.0,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "cprofile_path": cprofile_path,
+            "segments": [],
+            "segments_dropped": 0,
+            "reported": False,
+        }
+    args = (_run_in_worker, job_id, _progress_queue, task_name, kwargs, cprofile_path)
+    executor = _executor(job_type)
+    try:
+        try:
+            future = executor.submit(*args)
+        except BrokenProcessPool:
+            # A worker died after the last job was queued
+            _drop_executor(job_type, executor)
+            executor = _executor(job_type)
+            future = executor.submit(*args)
+    except Exception:
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+        raise
+    future.add_done_callback(partial(_on_done, job_id, job_type, executor))
+    return job_id
+
+
+def get_job(job_id):
+    """Return a copy of the job record, or None."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def job_events(job_id, start=0):
+    """
+    (copy of the job record, segment events from index start on, index
+    after them) or (None, [], start). Each event is {"file", "segments"} as
+    sent by report_segments. Events dropped beyond MAX_SEGMENT_EVENTS are
+    skipped.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None, [], start
+        first = job["segments_dropped"]
+        events = list((job["segments"] or [])[max(0, start - first) :])
+        return dict(job), events, max(start, first) + len(events)
+
+
+def job_to_dict(job):
+    """Public view of a job (drops server-side paths from the result)."""
+    data = {
+        k: v
+        for k, v in job.items()
+        if k not in ("result", "cprofile_path", "segments", "segments_dropped", "reported")
+    }
+    if job.get("cprofile_path"):
+        data["cprofile"] = os.path.basename(job["cprofile_path"])
+    if job["result"] is not None:
+        data["result"] = {k: v for k, v in job["result"].items() if k != "output_path"}
+    else:
+        data["result"] = None
+    return data
+
+
+def in_flight_counts():
+    """{(job type, status): count} of queued and running jobs."""
+    counts = {}
+    with _jobs_lock:
+        for job in _jobs.values():
+            if job["status"] in ("queued", "running"):
+                key = (job["type"], job["status"])
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def list_jobs():
+    with _jobs_lock:
+        return sorted(
+            (dict(j) for j in _jobs.values()), key=lambda j: j["created_at"]
+        )
@@ -1,13 +1,24 @@
 import argparse
+import cProfile
+import pstats
+from batch import DEFAULT_ENCODERS, collect_items, run_batch
 from generate_captions import generate_captions
 from overlay_captions import overlay_captions
+from parallel_render import render_parallel
+from streaming_transcribe import WHISPER_TASKS, whisper_options
+from render_profiles import (
+    DEFAULT_BACKEND,
+    DEFAULT_PROFILE,
+    RENDER_BACKENDS,
+    RENDER_PROFILES,
+)
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Short Video Auto-Caption Script | github.com/nafeu/autocaption"
     )
-    parser.add_argument("video", help="Path to the input video file")
+    parser.add_argument("video", nargs="?", help="Path to the input video file")
     parser.add_argument(
         "--output-video", default="output_video.mp4", help="Output video with captions"
     )
@@ -20,19 +31,179 @@ def main():
         "--overlay", action="store_true", help="Overlay captions onto the video"
     )
     parser.add_argument("--title", default="", help="Title header text")
+    parser.add_argument(
+        "--profile",
+        choices=sorted(RENDER_PROFILES),
+        default=DEFAULT_PROFILE,
+        help=f"Render profile (encoder speed/quality and scale; default: {DEFAULT_PROFILE})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=RENDER_BACKENDS,
+        default=DEFAULT_BACKEND,
+        help=(
+            "Render backend (MoviePy compositing or a single ffmpeg pass; "
+            f"default: {DEFAULT_BACKEND})"
+        ),
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        help="Render in chunks on this many worker processes (for long videos)",
+    )
+    parser.add_argument(
+        "--language",
+        help="Spoken language (code or English name, e.g. en or French; default: detect)",
+    )
+    parser.add_argument(
+        "--task",
+        choices=WHISPER_TASKS,
+        default="transcribe",
+        help="transcribe, or translate the speech to English captions",
+    )
+    parser.add_argument(
+        "--chunked",
+        action="store_true",
+        default=None,
+        help="Transcribe in parallel chunks split at silences (default: only for long videos)",
+    )
+    parser.add_argument(
+        "--chunk-seconds", type=float, help="Target chunk length for --chunked"
+    )
+    parser.add_argument(
+        "--chunk-overlap", type=float, help="Seconds of context added around each chunk"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Transcription worker processes for --chunked"
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="PATH",
+        help="Run under cProfile, write the stats to PATH and print the top functions",
+    )
+
+    batch_group = parser.add_argument_group("batch mode")
+    batch_group.add_argument(
+        "--batch",
+        action="append",
+        default=[],
+        metavar="SOURCE",
+        help="Caption every video in a directory or matching a glob (repeatable)",
+    )
+    batch_group.add_argument(
+        "--manifest",
+        help="JSON list of {input, output, title} or CSV lines of input[,output[,title]]",
+    )
+    batch_group.add_argument(
+        "--output-dir", help="Folder for batch outputs (default: next to each input)"
+    )
+    batch_group.add_argument(
+        "--encoders",
+        type=int,
+        default=DEFAULT_ENCODERS,
+        help=f"Parallel caption encoders (default: {DEFAULT_ENCODERS})",
+    )
+    batch_group.add_argument(
+        "--report", default="batch_report.json", help="Where to write the batch report"
+    )
+    batch_group.add_argument(
+        "--force", action="store_true", help="Re-caption files whose output is up to date"
+    )
 
     args = parser.parse_args()
+    if args.video is None and not (args.batch or args.manifest):
+        parser.error("a video path, --batch or --manifest is required")
+    try:
+        whisper_options(args.language, args.task)
+    except ValueError as e:
+        parser.error(str(e))
+
+    items = None
+    if args.batch or args.manifest:
+        try:
+            items = collect_items(
+                args.batch + ([args.video] if args.video else []),
+                manifest=args.manifest,
+                output_dir=args.output_dir,
+                title=args.title,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+
+    if not args.cprofile:
+        run(args, items)
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run, args, items)
+    finally:
+        profiler.dump_stats(args.cprofile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        print(f"Profile written to {args.cprofile}")
+
+
+def run(args, items=None):
+
+    chunk_options = {
+        key: value
+        for key, value in (
+            ("chunk_seconds", args.chunk_seconds),
+            ("overlap_seconds", args.chunk_overlap),
+            ("workers", args.workers),
+        )
+        if value is not None
+    }
+    # One-shot renders read the original anyway; editing proxies are for the app
+    transcribe_options = {
+        "chunked": args.chunked,
+        "chunk_options": chunk_options,
+        "use_proxy": False,
+        "language": args.language,
+        "task": args.task,
+    }
+
+    if items is not None:
+        report = run_batch(
+            items,
+            encoders=args.encoders,
+            force=args.force,
+            report_path=args.report,
+            transcribe_options=transcribe_options,
+            profile=args.profile,
+            backend=args.backend,
+        )
+        raise SystemExit(1 if report["counts"].get("failed") else 0)
 
     if not args.transcribe and not args.overlay:
-        generate_captions(args.video)
-        overlay_captions(args.video, args.output_video, args.title)
+        generate_captions(args.video, **transcribe_options)
+        overlay(args)
     else:
         if args.transcribe:
             print("Running transcription...")
-            generate_captions(args.video)
+            generate_captions(args.video, **transcribe_options)
         if args.overlay:
             print("Overlaying captions...")
-            overlay_captions(args.video, args.output_video, args.title)
+            overlay(args)
+
+
+def overlay(args):
+    if args.render_workers:
+        render_parallel(
+            args.video,
+            args.output_video,
+            title_text=args.title,
+            profile=args.profile,
+            backend=args.backend,
+            workers=args.render_workers,
+        )
+        return
+    overlay_captions(
+        args.video,
+        args.output_video,
+        args.title,
+        profile=args.profile,
+        backend=args.backend,
+    )
 
 
 if __name__ == "__main__":
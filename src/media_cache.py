@@ -0,0 +1,274 @@
+"""
+Media probe and decoded-audio cache shared by transcription, trimming and
+the app routes.
+
+Each input is probed once (duration, fps, resolution) and its audio track is
+decoded once to a 16 kHz mono float32 file that later readers memory-map.
+Entries live under cache/media/<content hash>/. The hash is memoized per
+(path, size, mtime), in memory and in cache/hashes/ so worker processes
+don't re-read the file either; a re-upload under the same name is re-hashed
+and picks up fresh entries.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+
+import numpy as np
+
+from audio_analysis import SAMPLE_RATE
+from ffmpeg_tools import display_size, parse_rate, probe_streams, run_ffmpeg, stream_rotation
+from metrics import count_cache, count_file, inc
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+MEDIA_CACHE_FOLDER = os.path.join(BASE_DIR, "cache", "media")
+HASH_INDEX_FOLDER = os.path.join(BASE_DIR, "cache", "hashes")
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_hashes = {}  # (abspath, size, mtime_ns) -> sha256 hex
+_probes = {}  # content hash -> probe dict
+_lock = threading.Lock()
+_key_locks = {}
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def _hash_index_path(abspath):
+    name = hashlib.sha1(abspath.encode("utf-8")).hexdigest()
+    return os.path.join(HASH_INDEX_FOLDER, f"{name}.json")
+
+
+def _read_hash_index(key):
+    try:
+        with open(_hash_index_path(key[0]), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("size") == key[1] and entry.get("mtime_ns") == key[2]:
+        return entry.get("sha256")
+    return None
+
+
+def file_hash(path):
+    """sha256 of the file's contents, memoized until the file changes."""
+    key = _stat_key(path)
+    with _lock:
+        digest = _hashes.get(key)
+    if digest:
+        return digest
+    digest = _read_hash_index(key)
+    if digest:
+        with _lock:
+            _hashes[key] = digest
+        return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    inc("autocaption_bytes_read_total", key[1], kind="hash")
+    digest = h.hexdigest()
+    remember_hash(path, digest)
+    return digest
+
+
+def remember_hash(path, digest):
+    """Record a hash computed elsewhere (e.g. while the upload was streamed to disk)."""
+    key = _stat_key(path)
+    with _lock:
+        # Forget stale hashes for earlier versions of this path
+        for old in [k for k in _hashes if k[0] == key[0] and k != key]:
+            del _hashes[old]
+        _hashes[key] = digest
+    index_path = _hash_index_path(key[0])
+    try:
+        os.makedirs(HASH_INDEX_FOLDER, exist_ok=True)
+        tmp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"size": key[1], "mtime_ns": key[2], "sha256": digest}, f)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        print(f"Could not record hash for {path}: {e}")
+
+
+def save_upload(file_storage, path):
+    """
+    Stream an uploaded file to path, hashing it on the way so the content
+    hash never needs a second read of the file. Returns the hex digest.
+    """
+    h = hashlib.sha256()
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp_path, "wb") as out:
+            for chunk in iter(lambda: file_storage.stream.read(HASH_CHUNK_BYTES), b""):
+                h.update(chunk)
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    count_file("written", "upload", path)
+    digest = h.hexdigest()
+    remember_hash(path, digest)
+    return digest
+
+
+def entry_dir(path):
+    return os.path.join(MEDIA_CACHE_FOLDER, file_hash(path))
+
+
+def _entry_lock(digest):
+    with _lock:
+        return _key_locks.setdefault(digest, threading.Lock())
+
+
+def probe_file(path):
+    """
+    Probe path directly, bypassing the cache. width and height are display
+    dimensions: ffmpeg autorotates while decoding, so a portrait phone clip
+    stored as 1920x1080 with a 90 degree rotation probes as 1080x1920.
+    """
+    try:
+        info = probe_streams(path)
+    except FileNotFoundError:
+        return _probe_with_moviepy(path)
+
+    video, audio = info["video"] or {}, info["audio"]
+    duration = float(info["format"].get("duration") or video.get("duration") or 0.0)
+    rotation = stream_rotation(video)
+    width, height = display_size(
+        int(video.get("width") or 0), int(video.get("height") or 0), rotation
+    )
+    return {
+        "duration": duration,
+        "fps": parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate")),
+        "width": width,
+        "height": height,
+        "rotation": rotation,
+        "has_audio": audio is not None,
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name") if audio else None,
+    }
+
+
+def _probe_with_moviepy(path):
+    # No ffprobe available: parse ffmpeg's own stream listing via MoviePy
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    infos = ffmpeg_parse_infos(path)
+    rotation = int(infos.get("video_rotation") or 0) % 360
+    for stream in (infos.get("inputs") or [{}])[0].get("streams", []):
+        if stream.get("stream_type") != "video":
+            continue
+        # Display matrix side data, which MoviePy itself doesn't apply
+        displaymatrix = (stream.get("metadata") or {}).get("displaymatrix", "")
+        match = re.search(r"rotation of (-?[\d.]+) degrees", displaymatrix)
+        if match:
+            rotation = int(round(float(match.group(1)))) % 360
+        break
+    width, height = display_size(*infos.get("video_size", (0, 0)), rotation)
+    return {
+        "duration": float(infos.get("duration") or infos.get("video_duration") or 0.0),
+        "fps": float(infos.get("video_fps") or 0.0),
+        "width": int(width),
+        "height": int(height),
+        "rotation": rotation,
+        "has_audio": bool(infos.get("audio_found")),
+        "video_codec": None,
+        "audio_codec": None,
+    }
+
+
+def probe_media(path):
+    """Duration/fps/resolution/codecs for path, probed once per content hash."""
+    digest = file_hash(path)
+    with _lock:
+        if digest in _probes:
+            return dict(_probes[digest])
+
+    probe_path = os.path.join(MEDIA_CACHE_FOLDER, digest, "probe.json")
+    with _entry_lock(digest):
+        probe = None
+        if os.path.exists(probe_path):
+            with open(probe_path, "r", encoding="utf-8") as f:
+                probe = json.load(f)
+            if "rotation" not in probe:
+                # Written before probes reported display dimensions
+                probe = None
+        count_cache("probe", probe is not None)
+        if probe is None:
+            probe = probe_file(path)
+            os.makedirs(os.path.dirname(probe_path), exist_ok=True)
+            with open(probe_path, "w", encoding="utf-8") as f:
+                json.dump(probe, f)
+
+    with _lock:
+        _probes[digest] = probe
+    return dict(probe)
+
+
+def remember_probe(path, probe):
+    """Record a probe made elsewhere (e.g. of an upload while it was arriving)."""
+    digest = file_hash(path)
+    probe_path = os.path.join(MEDIA_CACHE_FOLDER, digest, "probe.json")
+    with _entry_lock(digest):
+        os.makedirs(os.path.dirname(probe_path), exist_ok=True)
+        with open(probe_path, "w", encoding="utf-8") as f:
+            json.dump(probe, f)
+    with _lock:
+        _probes[digest] = dict(probe)
+
+
+def get_duration(path):
+    return probe_media(path)["duration"]
+
+
+def audio_cache_path(path):
+    """Where the decoded 16 kHz audio of path is (or will be) cached."""
+    return os.path.join(entry_dir(path), "audio_16k_f32.raw")
+
+
+def load_audio(path, source=None):
+    """
+    16 kHz mono float32 audio for path, decoded once and memory-mapped
+    afterwards. Copy-on-write, so callers (Whisper) may treat it as writable.
+    source is a file with the same audio to decode instead (e.g. a proxy).
+    """
+    digest = file_hash(path)
+    audio_path = audio_cache_path(path)
+    probe = probe_media(path)
+    with _entry_lock(digest):
+        count_cache("audio", os.path.exists(audio_path))
+        if not os.path.exists(audio_path):
+            os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+            tmp_path = f"{audio_path}.{os.getpid()}.tmp"
+            if probe["has_audio"]:
+                run_ffmpeg(
+                    [
+                        "-i", source or path,
+                        "-vn",
+                        "-ac", "1",
+                        "-ar", str(SAMPLE_RATE),
+                        "-f", "f32le",
+                        tmp_path,
+                    ]
+                )
+                count_file("read", "original" if source is None else "proxy", source or path)
+            else:
+                np.zeros(int(probe["duration"] * SAMPLE_RATE), dtype=np.float32).tofile(
+                    tmp_path
+                )
+            os.replace(tmp_path, audio_path)
+        else:
+            # Mark the entry as recently used for LRU eviction
+            os.utime(os.path.dirname(audio_path))
+
+    if os.path.getsize(audio_path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(audio_path, dtype=np.float32, mode="c")
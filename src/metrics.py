@@ -0,0 +1,171 @@
+"""
+Process-wide timing spans and counters, exposed in Prometheus text format.
+
+Stages are timed with span() (or observe() for durations summed elsewhere,
+e.g. per-frame compositing) into one histogram per stage. Worker processes
+record into their own registry; jobs sends it back with drain() and the
+server folds it in with merge(), so /metrics covers work done anywhere.
+
+With AUTOCAPTION_PROFILING=1, profiled() wraps a call in cProfile and dumps
+a pstats file under cache/profiles (open with snakeviz, or convert with
+flameprof/gprof2dot for flame graphs).
+"""
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+PROFILE_FOLDER = os.path.join(BASE_DIR, "cache", "profiles")
+PROFILING_ENABLED = os.environ.get("AUTOCAPTION_PROFILING", "").lower() in ("1", "true", "yes")
+
+STAGE_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800
+)
+
+METRIC_HELP = {
+    "autocaption_stage_seconds": ("histogram", "Time spent per pipeline stage"),
+    "autocaption_job_seconds": ("histogram", "Background job run time, by job type"),
+    "autocaption_cache_requests_total": ("counter", "Cache lookups, by cache and hit/miss"),
+    "autocaption_bytes_read_total": ("counter", "Bytes read from media files, by kind"),
+    "autocaption_bytes_written_total": ("counter", "Bytes written to media files, by kind"),
+    "autocaption_jobs_in_flight": ("gauge", "Queued and running background jobs"),
+}
+
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_counters = {}  # (name, labels) -> value
+_lock = threading.Lock()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """Add one observation to histogram name."""
+    key = (name, _labels(labels))
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [0] * len(STAGE_BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                entry[i] += 1
+        entry[-2] += seconds
+        entry[-1] += 1
+
+
+def inc(name, amount=1, **labels):
+    """Add amount to counter name."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def span(stage):
+    """Time the block into autocaption_stage_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("autocaption_stage_seconds", time.perf_counter() - start, stage=stage)
+
+
+def count_cache(cache, hit):
+    inc("autocaption_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def count_file(direction, kind, path):
+    """Count the size of path as read or written bytes (missing files count as 0)."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    inc(f"autocaption_bytes_{direction}_total", size, kind=kind)
+
+
+def drain():
+    """Snapshot of this process's registry, which is then reset."""
+    with _lock:
+        snapshot = {
+            "histograms": [[n, list(l), list(v)] for (n, l), v in _histograms.items()],
+            "counters": [[n, list(l), v] for (n, l), v in _counters.items()],
+        }
+        _histograms.clear()
+        _counters.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """Fold a drain() snapshot from another process into this registry."""
+    with _lock:
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, tuple(tuple(item) for item in labels))
+            entry = _histograms.setdefault(key, [0] * len(STAGE_BUCKETS) + [0.0, 0])
+            for i, value in enumerate(values):
+                entry[i] += value
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(item) for item in labels))
+            _counters[key] = _counters.get(key, 0) + value
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in items)
+    return "{" + body + "}"
+
+
+def render_prometheus(gauges=()):
+    """
+    Registry in Prometheus text exposition format. gauges is an iterable of
+    (name, labels dict, value) sampled by the caller at scrape time.
+    """
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+
+    samples = {}
+    for (name, labels), entry in sorted(histograms.items()):
+        lines = samples.setdefault(name, [])
+        for bound, count in zip(STAGE_BUCKETS, entry):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {entry[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {entry[-2]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {entry[-1]}")
+    for (name, labels), value in sorted(counters.items()):
+        samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {value}")
+    for name, labels, value in gauges:
+        samples.setdefault(name, []).append(
+            f"{name}{_format_labels(_labels(labels))} {value}"
+        )
+
+    out = []
+    for name, lines in samples.items():
+        kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def profile_path(label):
+    """New pstats file path under PROFILE_FOLDER for label."""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_") or "profile"
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(PROFILE_FOLDER, f"{stamp}-{os.getpid()}-{safe}.prof")
+
+
+def profiled(stats_path, fn, /, *args, **kwargs):
+    """Call fn under cProfile and dump the stats to stats_path (even if it raises)."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.dump_stats(stats_path)
+        print(f"Profile written to {stats_path}")
@@ -0,0 +1,196 @@
+"""
+Process-wide cache of loaded Whisper models.
+
+Loading a model (deserializing weights and moving them to the device) costs
+seconds per call, so models are kept resident and shared across requests.
+Entries are keyed by (model name, device, precision) and evicted least
+recently used once the resident set goes over a memory budget.
+"""
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import torch
+import whisper
+
+from metrics import count_cache
+
+DEFAULT_MODEL = os.environ.get("AUTOCAPTION_WHISPER_MODEL", "base")
+MEMORY_BUDGET_MB = int(os.environ.get("AUTOCAPTION_MODEL_MEMORY_MB", "4096"))
+
+_models = OrderedDict()  # key -> {"model", "bytes", "load_seconds", "hits"}
+_key_locks = {}
+_lock = threading.Lock()
+# Inference lock per model: decode() installs kv-cache hooks on the shared
+# decoder, so two threads must not run the same model at once
+_model_locks = weakref.WeakKeyDictionary()
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "load_seconds_total": 0.0,
+    "hit_seconds_total": 0.0,
+    "loads": [],
+}
+
+
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def model_key(name=DEFAULT_MODEL, device=None, fp16=None):
+    """
+    Normalize a model request into its cache key. fp16 defaults to True on
+    CUDA and is always off on CPU, matching what Whisper itself would use.
+    """
+    device = device or default_device()
+    if fp16 is None:
+        fp16 = device != "cpu"
+    if device == "cpu":
+        fp16 = False
+    return (name, device, "fp16" if fp16 else "fp32")
+
+
+def model_nbytes(model):
+    """Approximate resident size of a model (parameters + buffers)."""
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def is_fp16(model):
+    """Whether a cached model was loaded in half precision (pass as fp16= to transcribe)."""
+    return next(model.parameters()).dtype == torch.float16
+
+
+def model_lock(model):
+    """
+    Lock to hold for the whole of an inference (transcribe, decode, language
+    detection) on a model shared through the cache.
+    """
+    with _lock:
+        return _model_locks.setdefault(model, threading.RLock())
+
+
+def get_model(name=DEFAULT_MODEL, device=None, fp16=None):
+    """
+    Return a loaded Whisper model, loading it on first use. Concurrent
+    requests for the same key wait for a single load instead of racing.
+    Threads sharing the model run it under model_lock(model).
+    """
+    key = model_key(name, device, fp16)
+    t0 = time.perf_counter()
+
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None:
+            _models.move_to_end(key)
+            entry["hits"] += 1
+            _stats["hits"] += 1
+            count_cache("model", True)
+            _stats["hit_seconds_total"] += time.perf_counter() - t0
+            return entry["model"]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        with _lock:
+            entry = _models.get(key)
+            if entry is not None:
+                # Another thread finished loading while we waited.
+                _models.move_to_end(key)
+                entry["hits"] += 1
+                _stats["hits"] += 1
+                count_cache("model", True)
+                _stats["hit_seconds_total"] += time.perf_counter() - t0
+                return entry["model"]
+
+        model_name, model_device, precision = key
+        load_start = time.perf_counter()
+        model = whisper.load_model(model_name, device=model_device)
+        if precision == "fp16":
+            model = model.half()
+        load_seconds = time.perf_counter() - load_start
+
+        with _lock:
+            _models[key] = {
+                "model": model,
+                "bytes": model_nbytes(model),
+                "load_seconds": load_seconds,
+                "hits": 0,
+            }
+            _stats["misses"] += 1
+            count_cache("model", False)
+            _stats["load_seconds_total"] += load_seconds
+            _stats["loads"].append(
+                {"key": list(key), "seconds": round(load_seconds, 3), "at": time.time()}
+            )
+            del _stats["loads"][:-50]
+            _evict_over_budget(keep=key)
+
+    print(f"Loaded Whisper model {key} in {load_seconds:.2f}s")
+    return model
+
+
+def _evict_over_budget(keep=None):
+    """Drop least recently used models until under MEMORY_BUDGET_MB. Caller holds _lock."""
+    budget = MEMORY_BUDGET_MB * 1024 * 1024
+    freed_cuda = False
+    while _models and sum(e["bytes"] for e in _models.values()) > budget:
+        key = next(iter(_models))
+        if key == keep:
+            # Never evict the model we were just asked for, even if it alone is over budget.
+            break
+        _models.pop(key)
+        _stats["evictions"] += 1
+        freed_cuda = freed_cuda or key[1] != "cpu"
+        print(f"Evicted Whisper model {key} from cache")
+    if freed_cuda:
+        torch.cuda.empty_cache()
+
+
+def preload_models(names, device=None, fp16=None):
+    """Warm the cache with a list of model names (e.g. from AUTOCAPTION_PRELOAD_MODELS)."""
+    for name in names:
+        try:
+            get_model(name, device=device, fp16=fp16)
+        except Exception as e:
+            print(f"Could not preload Whisper model {name!r}: {e}")
+
+
+def clear_cache():
+    with _lock:
+        _models.clear()
+
+
+def cache_stats():
+    """Snapshot of cache contents and hit/miss/load timings, for /model_cache_stats."""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            "models": [
+                {
+                    "name": key[0],
+                    "device": key[1],
+                    "precision": key[2],
+                    "megabytes": round(entry["bytes"] / (1024 * 1024), 1),
+                    "load_seconds": round(entry["load_seconds"], 3),
+                    "hits": entry["hits"],
+                }
+                for key, entry in _models.items()
+            ],
+            "memory_budget_mb": MEMORY_BUDGET_MB,
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else None,
+            "evictions": _stats["evictions"],
+            "load_seconds_total": round(_stats["load_seconds_total"], 3),
+            "avg_hit_ms": (
+                round(_stats["hit_seconds_total"] / _stats["hits"] * 1000, 4)
+                if _stats["hits"]
+                else None
+            ),
+            "recent_loads": list(_stats["loads"]),
+        }
@@ -1,6 +1,19 @@
 import os
-from moviepy import VideoFileClip, TextClip, CompositeVideoClip
-import re
+import time
+from moviepy import TextClip, CompositeVideoClip
+from artifact_store import artifact_key, cached_output, text_hash
+from caption_render import CaptionRenderer
+from ffmpeg_render import ffmpeg_render
+from media_cache import file_hash
+from metrics import count_file, span
+from render_profiles import (
+    get_backend,
+    get_profile,
+    open_video,
+    render_source,
+    write_options,
+)
+from vtt import load_captions
 
 
 def get_vtt_path(video_path):
@@ -14,70 +27,6 @@ def get_vtt_path(video_path):
     return f"{base_path}.vtt"
 
 
-def parse_vtt_with_highlights(vtt_path):
-    captions = []
-
-    with open(vtt_path, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-
-    current_caption = {
-        "start": None,
-        "end": None,
-        "full_line": "",
-        "highlighted_word_line": "",
-    }
-    for line in lines:
-        line = line.strip()
-
-        if "-->" in line:
-            start, end = line.split(" --> ")
-            current_caption["start"] = start
-            current_caption["end"] = end
-
-        elif line == "":
-            if (
-                current_caption["start"]
-                and current_caption["end"]
-                and current_caption["full_line"]
-            ):
-                captions.append(current_caption)
-            current_caption = {
-                "start": None,
-                "end": None,
-                "full_line": "",
-                "highlighted_word_line": "",
-            }
-
-        else:
-            line_with_highlights, highlighted_word_line = process_highlights(line)
-            current_caption["full_line"] += line_with_highlights
-            current_caption["highlighted_word_line"] += highlighted_word_line
-
-    if (
-        current_caption["start"]
-        and current_caption["end"]
-        and current_caption["full_line"]
-    ):
-        captions.append(current_caption)
-
-    return captions
-
-
-def process_highlights(line):
-    line_with_highlights = re.sub(r"</?u>", "", line)
-    words = line.split()
-    highlighted_word_line = ""
-
-    for word in words:
-        if "<u>" in word:
-            clean_word = re.sub(r"</?u>", "", word)
-            highlighted_word_line += clean_word + " "
-        else:
-            highlighted_word_line += " " * len(word) + " "
-
-    return line_with_highlights.strip(), highlighted_word_line[:-1]
-
-
 def create_title_header(
     text,
     video_width,
@@ -119,22 +68,28 @@ def create_title_header(
     return title_clip.with_position(("center", top))
 
 
-def overlay_captions(
-    video_path="input_video.mp4", output_video="output_video.mp4", title_text=""
-):
-    video = VideoFileClip(video_path)
-    video_width, video_height = video.size
+def title_header_clip(title_text, video_width, video_height):
+    """The title header shown over the first seconds of a video_width x video_height render."""
+    text_clip_title_header_params = {
+        "font_size": int(video_width * 0.05925),
+        "text": title_text,
+        "top": int(video_height * 0.156),
+        "video_width": video_width,
+        "padding": int(video_width * 0.01851),
+    }
 
-    video_name = os.path.splitext(os.path.basename(video_path))[0]
-    vtt_file_path = get_vtt_path(video_path)
+    text_clip_title_header_additional_configs = {"duration": 5}
 
-    captions = []
-    text_clips = []
+    return create_title_header(**text_clip_title_header_params).with_duration(
+        text_clip_title_header_additional_configs["duration"]
+    )
 
-    text_clip_defaults = {
-        "method": "label",
-    }
 
+def caption_style(video_width, video_height):
+    """
+    TextClip parameters for the caption line and its word highlight, sized
+    relative to the video so captions look the same at any resolution.
+    """
     text_clip_caption_params = {
         "color": "#F8EFBA",
         "font": "/Users/nafeu/Library/Fonts/JetBrainsMonoNL-ExtraBold.ttf",
@@ -149,74 +104,115 @@ def overlay_captions(
         "color": "#F97F51",
     }
 
-    text_clip_caption_additional_configs = {"top": int(video_height * 0.365)}
-
-    text_clip_title_header_params = {
-        "font_size": int(video_width * 0.05925),
-        "text": title_text,
-        "top": int(video_height * 0.156),
-        "video_width": video_width,
-        "padding": int(video_width * 0.01851),
+    return {
+        "defaults": {"method": "label"},
+        "caption": text_clip_caption_params,
+        "highlight": text_clip_highlight_params,
+        "top": int(video_height * 0.365),
     }
 
-    text_clip_title_header_additional_configs = {"duration": 5}
 
-    for caption in parse_vtt_with_highlights(vtt_file_path):
-        captions.append(
-            {
-                "start": time_to_seconds(caption["start"]),
-                "end": time_to_seconds(caption["end"]),
-                "text": caption["full_line"].strip(),
-                "highlighted_word_line": caption["highlighted_word_line"],
-            }
-        )
-
-    for caption in captions:
-        text_clip = (
-            TextClip(
-                **text_clip_defaults, **text_clip_caption_params, text=caption["text"]
-            )
-            .with_duration(caption["end"] - caption["start"])
-            .with_position(("center", text_clip_caption_additional_configs["top"]))
-            .with_start(caption["start"])
-        )
-        text_clips.append(text_clip)
-        highlighted_word_clip = (
-            TextClip(
-                **text_clip_defaults,
-                **text_clip_highlight_params,
-                text=caption["highlighted_word_line"],
-            )
-            .with_duration(caption["end"] - caption["start"])
-            .with_position(("center", text_clip_caption_additional_configs["top"]))
-            .with_start(caption["start"])
-        )
-        text_clips.append(highlighted_word_clip)
+def render_key(
+    video_path,
+    cut_ranges=(),
+    title_text="",
+    with_captions=True,
+    profile=None,
+    source=None,
+    backend=None,
+):
+    """
+    Artifact key for a render of video_path: source content, the VTT it was
+    captioned from, the cuts and every setting that affects the output.
+    source is the render_source the render decodes (looked up if None).
+    """
+    path, size = source or render_source(video_path, profile)
+    return artifact_key(
+        media=file_hash(video_path),
+        source="original" if path == video_path else "proxy",
+        size=list(size),
+        vtt=text_hash(get_vtt_path(video_path)) if with_captions else None,
+        cut_ranges=[[round(s, 3), round(e, 3)] for s, e in cut_ranges],
+        title=title_text,
+        style=caption_style(*size) if with_captions else None,
+        codec="libx264",
+        audio_codec="aac",
+        profile=get_profile(profile),
+        backend=get_backend(backend),
+    )
 
-    final_video = None
 
-    if len(title_text) > 0:
-        title_header = create_title_header(
-            **text_clip_title_header_params
-        ).with_duration(text_clip_title_header_additional_configs["duration"])
-        final_video = CompositeVideoClip([video, *text_clips, title_header])
-    else:
-        final_video = CompositeVideoClip([video, *text_clips])
+def overlay_captions(
+    video_path="input_video.mp4",
+    output_video="output_video.mp4",
+    title_text="",
+    logger="bar",
+    profile=None,
+    backend=None,
+):
+    """
+    Write video_path with its VTT captions burned in, reusing a cached render
+    if any. profile names a render profile and backend a render backend (see
+    render_profiles).
+    """
+    source = render_source(video_path, profile)
+    render = _render_overlay_ffmpeg if get_backend(backend) == "ffmpeg" else _render_overlay
+    return cached_output(
+        "render",
+        render_key(
+            video_path,
+            title_text=title_text,
+            profile=profile,
+            source=source,
+            backend=backend,
+        ),
+        output_video,
+        lambda: render(video_path, output_video, title_text, logger, profile, source),
+    )
 
-    final_video.write_videofile(output_video, codec="libx264", audio_codec="aac")
 
+def _render_overlay_ffmpeg(video_path, output_video, title_text, logger, profile, source):
+    with span("parse_vtt"):
+        captions = load_captions(get_vtt_path(video_path))
+    ffmpeg_render(
+        video_path,
+        output_video,
+        source,
+        captions=captions,
+        style=caption_style(*source[1]),
+        title_text=title_text,
+        profile=profile,
+    )
+    count_file("written", "render", output_video)
     print(f"Video with captions saved to {output_video}")
 
 
-def time_to_seconds(timestamp):
-    parts = timestamp.split(":")
-    if len(parts) == 3:
-        h, m, s = parts
-    elif len(parts) == 2:
-        h = 0
-        m, s = parts
+def _render_overlay(video_path, output_video, title_text, logger, profile, source):
+    with span("open_video"):
+        video = open_video(video_path, profile, source)
+    video_width, video_height = video.size
+
+    vtt_file_path = get_vtt_path(video_path)
+
+    with span("parse_vtt"):
+        captions = load_captions(vtt_file_path)
+    renderer = CaptionRenderer(
+        captions, caption_style(video_width, video_height), video.size
+    )
+    captioned_video = video.transform(renderer)
+
+    final_video = None
+
+    if len(title_text) > 0:
+        title_header = title_header_clip(title_text, video_width, video_height)
+        final_video = CompositeVideoClip([captioned_video, title_header])
     else:
-        raise ValueError(f"Invalid timestamp format: {timestamp}")
+        final_video = captioned_video
+
+    start = time.perf_counter()
+    final_video.write_videofile(output_video, logger=logger, **write_options(profile))
+    renderer.record_timings(time.perf_counter() - start)
+    count_file("written", "render", output_video)
+
+    print(f"Video with captions saved to {output_video}")
 
-    s, ms = s.split(".")
-    return int(h) * 3600 + int(m) * 60 + int(s) + float(f"0.{ms}")
@@ -0,0 +1,234 @@
+"""
+Parallel render for long exports.
+
+The output timeline (the keep ranges left after the cuts) is split into
+chunks, one per worker at most and none shorter than MIN_CHUNK_SECONDS, with
+every boundary on a frame. Each chunk is rendered with its captions, video
+only, in its own worker process. Every chunk is a separate encode, so it
+starts on a keyframe and the chunks join with a stream-copy concat. The
+audio of all keep ranges is encoded once, in a single ffmpeg run, and muxed
+in during that concat, so there are no AAC priming gaps at the joins.
+"""
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from moviepy import CompositeVideoClip, concatenate_videoclips
+
+import metrics
+from artifact_store import cached_output
+from caption_render import CaptionRenderer
+from ffmpeg_render import TITLE_SECONDS, ffmpeg_render, render_audio
+from ffmpeg_tools import concat_copy
+from incremental_render import snap_to_frame
+from media_cache import probe_media
+from metrics import count_file, span
+from overlay_captions import caption_style, get_vtt_path, render_key, title_header_clip
+from render_profiles import (
+    ENCODER_THREADS,
+    get_backend,
+    open_video,
+    render_source,
+    write_options,
+)
+from transcript_edit import ranges_to_keep, remap_captions
+from vtt import load_captions
+
+RENDER_WORKERS = int(os.environ.get("AUTOCAPTION_RENDER_WORKERS", str(os.cpu_count() or 1)))
+MIN_CHUNK_SECONDS = float(os.environ.get("AUTOCAPTION_MIN_CHUNK_SECONDS", "20"))
+
+
+def plan_chunks(keep, fps, workers=RENDER_WORKERS, min_chunk_seconds=MIN_CHUNK_SECONDS):
+    """
+    Split keep ranges (source time) into chunks of the output: as many as
+    workers, but none shorter than min_chunk_seconds. Each chunk is a list
+    of source (start, end) ranges. Boundaries are whole frames, so the
+    chunks' frame counts add up to the output's.
+    """
+    frame_ranges = []
+    for start, end in keep:
+        first, last = round(start * fps), round(end * fps)
+        if last > first:
+            frame_ranges.append((first, last))
+    total = sum(last - first for first, last in frame_ranges)
+    count = max(1, min(workers, int(total / fps // max(min_chunk_seconds, 1e-3))))
+
+    bounds = [total * i // count for i in range(count + 1)]
+    chunks = [[] for _ in range(count)]
+    position = 0  # output frame where the current keep range starts
+    for first, last in frame_ranges:
+        length = last - first
+        for i in range(count):
+            lo = max(position, bounds[i])
+            hi = min(position + length, bounds[i + 1])
+            if hi > lo:
+                chunks[i].append(
+                    (
+                        snap_to_frame((first + lo - position) / fps, fps),
+                        snap_to_frame((first + hi - position) / fps, fps),
+                    )
+                )
+        position += length
+    return chunks
+
+
+def render_parallel(
+    video_path,
+    output_path,
+    cut_ranges=(),
+    title_text="",
+    profile=None,
+    backend=None,
+    workers=RENDER_WORKERS,
+    progress_callback=None,
+):
+    """
+    Render the captioned video with cut_ranges removed, encoding chunks of
+    it side by side in worker processes (see the module docstring).
+    progress_callback gets the fraction of chunks done.
+    """
+    source = render_source(video_path, profile)
+    backend = get_backend(backend)
+    return cached_output(
+        "render",
+        render_key(
+            video_path,
+            cut_ranges,
+            title_text=title_text,
+            profile=profile,
+            source=source,
+            backend=backend,
+        ),
+        output_path,
+        lambda: _render_chunks(
+            video_path,
+            output_path,
+            cut_ranges,
+            title_text,
+            profile,
+            backend,
+            source,
+            workers,
+            progress_callback,
+        ),
+    )
+
+
+def _render_chunk(
+    video_path, chunk_path, ranges, captions, title_text, profile, backend, source, threads
+):
+    """Encode the video of ranges (source time), with captions on the chunk's timeline."""
+    fps = probe_media(video_path)["fps"]
+    if backend == "ffmpeg":
+        ffmpeg_render(
+            video_path,
+            chunk_path,
+            source,
+            keep=ranges,
+            captions=captions,
+            style=caption_style(*source[1]),
+            title_text=title_text,
+            profile=profile,
+            audio=False,
+            threads=threads,
+        )
+        return
+
+    full = open_video(video_path, profile, source)
+    try:
+        clips = [full.subclipped(start, end) for start, end in ranges]
+        video = concatenate_videoclips(clips) if len(clips) > 1 else clips[0]
+        renderer = CaptionRenderer(captions, caption_style(*full.size), full.size)
+        video = video.transform(renderer)
+        if title_text:
+            video = CompositeVideoClip([video, title_header_clip(title_text, *full.size)])
+        start = time.perf_counter()
+        video.write_videofile(
+            chunk_path, fps=fps, audio=False, logger=None, **write_options(profile, threads)
+        )
+        renderer.record_timings(time.perf_counter() - start)
+    finally:
+        full.close()
+
+
+def _chunk_worker(*args):
+    metrics.drain()  # anything the process recorded before this chunk
+    _render_chunk(*args)
+    # The parent merges the worker's stage timings into its own registry
+    return metrics.drain()
+
+
+def _render_chunks(
+    video_path,
+    output_path,
+    cut_ranges,
+    title_text,
+    profile,
+    backend,
+    source,
+    workers,
+    progress_callback,
+):
+    probe = probe_media(video_path)
+    fps = probe["fps"]
+    # On frames, so the audio covers exactly the frames the chunks encode
+    keep = [
+        (snap_to_frame(start, fps), snap_to_frame(end, fps))
+        for start, end in ranges_to_keep(cut_ranges, probe["duration"])
+    ]
+    keep = [(start, end) for start, end in keep if end > start]
+    if not keep:
+        raise ValueError("All video would be cut; nothing to keep")
+
+    # The title header belongs to the first chunk, so it must fit in it
+    min_chunk_seconds = max(MIN_CHUNK_SECONDS, TITLE_SECONDS if title_text else 0)
+    chunks = plan_chunks(keep, fps, workers, min_chunk_seconds)
+    captions = load_captions(get_vtt_path(video_path))
+    threads = max(1, ENCODER_THREADS // len(chunks))
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp:
+        chunk_paths = [os.path.join(tmp, f"chunk_{i:04d}.mp4") for i in range(len(chunks))]
+        tasks = [
+            (
+                video_path,
+                path,
+                ranges,
+                remap_captions(captions, ranges),
+                title_text if i == 0 else "",
+                profile,
+                backend,
+                source,
+                threads,
+            )
+            for i, (path, ranges) in enumerate(zip(chunk_paths, chunks))
+        ]
+        audio_path = None
+        with span("render_chunks"):
+            if len(tasks) == 1:
+                if probe["has_audio"]:
+                    audio_path = render_audio(
+                        video_path, os.path.join(tmp, "audio.m4a"), keep, profile
+                    )
+                _render_chunk(*tasks[0])
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=len(tasks), mp_context=multiprocessing.get_context("spawn")
+                ) as pool:
+                    futures = [pool.submit(_chunk_worker, *task) for task in tasks]
+                    # The audio is encoded here while the workers encode video
+                    if probe["has_audio"]:
+                        audio_path = render_audio(
+                            video_path, os.path.join(tmp, "audio.m4a"), keep, profile
+                        )
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        metrics.merge(future.result())
+                        if progress_callback:
+                            progress_callback(done / len(futures))
+
+        with span("concat"):
+            concat_copy(chunk_paths, output_path, audio_path)
+        count_file("written", "render", output_path)
+    print(f"Parallel render: {len(chunks)} chunks for {output_path}")
+    return output_path
@@ -0,0 +1,183 @@
+"""
+Low-resolution editing proxies.
+
+Every upload gets a small H.264 copy (short side PROXY_HEIGHT, low bitrate)
+built in the background, stored with its probe and decoded audio in the
+media cache. The same ffmpeg pass writes the 16 kHz transcription audio, so
+after upload the original is read again only by full-resolution exports.
+Draft and preview renders decode the proxy when it is ready (see
+render_profiles.render_source); captions are sized relative to the frame
+width, so they look the same on the proxy as on the export.
+
+A marker file next to the proxy claims its build, so the web process and
+job workers never encode the same proxy twice. The builder touches it while
+ffmpeg runs; a marker left behind by a crashed build goes stale and is taken
+over.
+"""
+import os
+import threading
+import time
+
+from audio_analysis import SAMPLE_RATE
+from ffmpeg_tools import run_ffmpeg
+from media_cache import audio_cache_path, entry_dir, file_hash, probe_media
+from metrics import count_file, span
+
+# Short side of the proxy in pixels; 0 disables proxies
+PROXY_HEIGHT = int(os.environ.get("AUTOCAPTION_PROXY_HEIGHT", "360"))
+PROXY_CRF = 28
+PROXY_AUDIO_BITRATE = "128k"
+# The builder touches its marker this often; markers untouched 4x as long are stale
+BUILD_HEARTBEAT_SECONDS = 15
+
+_building = {}  # content hash -> thread building its proxy
+_lock = threading.Lock()
+
+
+def proxy_size(width, height, short_side=PROXY_HEIGHT):
+    """Proxy size for a width x height source (even numbers; never upscaled)."""
+    if not short_side or min(width, height) <= short_side:
+        return width, height
+    scale = short_side / min(width, height)
+    return (
+        max(2, int(round(width * scale / 2)) * 2),
+        max(2, int(round(height * scale / 2)) * 2),
+    )
+
+
+def _proxy_file(path):
+    probe = probe_media(path)
+    width, height = proxy_size(probe["width"], probe["height"])
+    return os.path.join(entry_dir(path), f"proxy_{width}x{height}.mp4")
+
+
+def proxy_path(path):
+    """Path of the finished proxy for path, or None if there isn't one (yet)."""
+    if not PROXY_HEIGHT:
+        return None
+    target = _proxy_file(path)
+    if not os.path.exists(target):
+        return None
+    os.utime(os.path.dirname(target))
+    return target
+
+
+def _claim(marker):
+    """Create the build marker; False if a live build (any process) holds it."""
+    for _ in range(2):
+        try:
+            fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.path.getmtime(marker)
+            except OSError:
+                continue  # released in the meantime
+            if age < 4 * BUILD_HEARTBEAT_SECONDS:
+                return False
+            try:
+                os.remove(marker)  # left behind by a build that died
+            except OSError:
+                pass
+            continue
+        os.close(fd)
+        return True
+    return False
+
+
+def _heartbeat(marker, done):
+    while not done.wait(BUILD_HEARTBEAT_SECONDS):
+        try:
+            os.utime(marker)
+        except OSError:
+            return
+
+
+def ensure_proxy(path):
+    """
+    Build the proxy for path unless it exists, decoding the original once
+    for both the proxy and the cached transcription audio. Returns the
+    proxy's path, or None when the source is already proxy-sized or another
+    process is building the proxy.
+    """
+    if not PROXY_HEIGHT:
+        return None
+    probe = probe_media(path)
+    size = proxy_size(probe["width"], probe["height"])
+    if size == (probe["width"], probe["height"]):
+        return None
+    target = _proxy_file(path)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    marker = f"{target}.building"
+    if not _claim(marker):
+        return None
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(marker, done), daemon=True).start()
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+    args = [
+        "-i", path,
+        "-map", "0:v:0",
+        "-map", "0:a:0?",
+        # Probe sizes are display sizes, matching the autorotated frames
+        "-vf", f"scale={size[0]}:{size[1]}",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-crf", str(PROXY_CRF),
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-b:a", PROXY_AUDIO_BITRATE,
+        "-movflags", "+faststart",
+        tmp_path,
+    ]
+    audio_path = audio_cache_path(path)
+    audio_tmp = f"{audio_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write_audio = probe["has_audio"] and not os.path.exists(audio_path)
+    if write_audio:
+        args += [
+            "-map", "0:a:0",
+            "-ac", "1",
+            "-ar", str(SAMPLE_RATE),
+            "-f", "f32le",
+            audio_tmp,
+        ]
+    try:
+        with span("proxy_encode"):
+            run_ffmpeg(args)
+        count_file("read", "original", path)
+        count_file("written", "proxy", tmp_path)
+        if write_audio:
+            os.replace(audio_tmp, audio_path)
+        os.replace(tmp_path, target)
+    finally:
+        done.set()
+        for leftover in (tmp_path, audio_tmp, marker):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    print(f"Proxy {size[0]}x{size[1]} written for {path}")
+    return target
+
+
+def _build(path, digest):
+    try:
+        ensure_proxy(path)
+    except Exception as e:
+        print(f"Proxy build failed for {path}: {e}")
+    finally:
+        with _lock:
+            _building.pop(digest, None)
+
+
+def start_proxy(path):
+    """Build the proxy for path in a background thread (once per content hash)."""
+    if not PROXY_HEIGHT:
+        return
+    digest = file_hash(path)
+    with _lock:
+        if digest in _building:
+            return
+        thread = threading.Thread(target=_build, args=(path, digest), daemon=True)
+        _building[digest] = thread
+    thread.start()
+
@@ -0,0 +1,146 @@
+"""
+Encoder settings shared by every MoviePy export.
+
+A render profile fixes the x264 preset, CRF and tune, the output scale and
+the audio bitrate: "draft" is for quick previews in the editor (half
+resolution, ultrafast), "final" for exports. Sources are scaled while they
+are decoded, so a draft also reads and composites fewer pixels. Profiles with
+"proxy" decode the upload's low-resolution proxy instead of the original once
+it has been built (see proxy). Callers that don't pick a profile get
+DEFAULT_PROFILE; editing-time routes default to EDIT_PROFILE.
+
+The render backend picks who composites and encodes: "moviepy" (frames go
+through CaptionRenderer in Python) or "ffmpeg" (one ffmpeg process burns in
+the captions as ASS subtitles, see ffmpeg_render). Both use these profiles.
+"""
+import os
+
+from moviepy import VideoFileClip
+
+from media_cache import probe_media
+from metrics import count_file
+from proxy import proxy_path, proxy_size
+
+RENDER_PROFILES = {
+    "draft": {
+        "scale": 0.5,
+        "preset": "ultrafast",
+        "crf": 30,
+        "tune": "fastdecode",
+        "audio_bitrate": "96k",
+        "proxy": True,
+    },
+    "preview": {
+        "scale": 0.75,
+        "preset": "veryfast",
+        "crf": 25,
+        "tune": None,
+        "audio_bitrate": "128k",
+        "proxy": True,
+    },
+    "final": {
+        "scale": 1.0,
+        "preset": "medium",
+        "crf": 18,
+        "tune": None,
+        "audio_bitrate": "192k",
+        "proxy": False,
+    },
+}
+
+DEFAULT_PROFILE = os.environ.get("AUTOCAPTION_RENDER_PROFILE", "final")
+# Profile of renders made while editing (previews); exports always use "final"
+EDIT_PROFILE = os.environ.get("AUTOCAPTION_EDIT_PROFILE", "preview")
+# ffmpeg/x264 threads per encode; MoviePy leaves this to ffmpeg otherwise
+ENCODER_THREADS = int(os.environ.get("AUTOCAPTION_ENCODER_THREADS", str(os.cpu_count() or 1)))
+
+RENDER_BACKENDS = ("moviepy", "ffmpeg")
+DEFAULT_BACKEND = os.environ.get("AUTOCAPTION_RENDER_BACKEND", "moviepy")
+
+
+def get_profile(name=None):
+    """Settings of the named profile (DEFAULT_PROFILE when name is empty)."""
+    name = name or DEFAULT_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"profile must be one of {', '.join(RENDER_PROFILES)}")
+    return {"name": name, **RENDER_PROFILES[name]}
+
+
+def get_backend(name=None):
+    """The named render backend (DEFAULT_BACKEND when name is empty)."""
+    name = name or DEFAULT_BACKEND
+    if name not in RENDER_BACKENDS:
+        raise ValueError(f"backend must be one of {', '.join(RENDER_BACKENDS)}")
+    return name
+
+
+def scaled_size(width, height, profile=None):
+    """Output size for a width x height source, rounded to even numbers for yuv420p."""
+    scale = get_profile(profile)["scale"]
+    if scale >= 1.0:
+        return width, height
+    return (
+        max(2, int(round(width * scale / 2)) * 2),
+        max(2, int(round(height * scale / 2)) * 2),
+    )
+
+
+def render_source(video_path, profile=None):
+    """
+    (file to decode, output size) for rendering video_path under the profile:
+    the proxy when the profile allows it and one is ready, else the original.
+    A proxy smaller than the profile's size is used at its own size.
+    """
+    probe = probe_media(video_path)
+    size = scaled_size(probe["width"], probe["height"], profile)
+    if get_profile(profile)["proxy"]:
+        proxy = proxy_path(video_path)
+        if proxy:
+            proxy_dims = proxy_size(probe["width"], probe["height"])
+            return proxy, min(size, proxy_dims, key=lambda dims: dims[0] * dims[1])
+    return video_path, size
+
+
+def open_video(video_path, profile=None, source=None):
+    """
+    VideoFileClip for video_path, decoded straight at the profile's size.
+    source is a render_source result to reuse (so it matches the render key).
+    Rotated sources always get an explicit size: ffmpeg hands MoviePy
+    autorotated frames, but MoviePy sizes its reader from the stored
+    dimensions unless told otherwise.
+    """
+    source, size = source or render_source(video_path, profile)
+    count_file("read", "proxy" if source != video_path else "original", source)
+    probe = probe_media(video_path)
+    if (
+        source == video_path
+        and size == (probe["width"], probe["height"])
+        and not probe.get("rotation")
+    ):
+        return VideoFileClip(video_path)
+    return VideoFileClip(source, target_resolution=size)
+
+
+def write_options(profile=None, threads=None):
+    """
+    Keyword arguments for write_videofile under the profile. threads
+    overrides ENCODER_THREADS (e.g. for encodes running side by side).
+    """
+    settings = get_profile(profile)
+    ffmpeg_params = ["-crf", str(settings["crf"]), "-pix_fmt", "yuv420p"]
+    if settings["tune"]:
+        ffmpeg_params += ["-tune", settings["tune"]]
+    return {
+        "codec": "libx264",
+        "audio_codec": "aac",
+        "preset": settings["preset"],
+        "audio_bitrate": settings["audio_bitrate"],
+        "threads": threads or ENCODER_THREADS,
+        "ffmpeg_params": ffmpeg_params,
+    }
+
+
+def output_filename(filename, profile=None):
+    """Final renders keep filename; other profiles get their own file beside it."""
+    name = get_profile(profile)["name"]
+    return filename if name == "final" else f"{name}_{filename}"
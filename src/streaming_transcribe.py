@@ -0,0 +1,124 @@
+"""
+Progress and segments out of Whisper's own transcribe() loop.
+
+transcribe() returns only when the whole input is decoded, but it decodes
+30-second windows one after another. whisper_progress hooks into that loop,
+without changing how anything is decoded: the caller hears about progress
+after each window and, optionally, gets the window's finished segments, so
+it can write and send out partial transcripts. The transcript in the end is
+the one transcribe() would have returned anyway.
+
+Also here: per-job language/task options, validated against Whisper's list.
+"""
+import importlib
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from whisper.audio import FRAMES_PER_SECOND
+from whisper.tokenizer import LANGUAGES, TO_LANGUAGE_CODE
+
+WHISPER_TASKS = ("transcribe", "translate")
+
+
+def whisper_options(language=None, task=None):
+    """
+    Whisper decode options for a language (code or English name; None
+    detects it) and a task ("translate" outputs English). Defaults are left
+    out, so they don't change cache keys. Raises ValueError for unknown values.
+    """
+    options = {}
+    if language:
+        code = language.strip().lower()
+        code = TO_LANGUAGE_CODE.get(code, code)
+        if code not in LANGUAGES:
+            raise ValueError(f"Unknown language: {language}")
+        options["language"] = code
+    if task:
+        if task not in WHISPER_TASKS:
+            raise ValueError(f"task must be one of {', '.join(WHISPER_TASKS)}")
+        if task != "transcribe":
+            options["task"] = task
+    return options
+
+
+_hooks = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+
+def _install_hooks():
+    """
+    Route whisper.transcribe's tqdm and add_word_timestamps through the
+    calling thread's hooks, once per process. Threads without hooks get
+    Whisper's own functions, so concurrent transcriptions don't see each
+    other's callbacks and nothing has to be restored.
+    """
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        transcribe_module = importlib.import_module("whisper.transcribe")
+        original_tqdm = transcribe_module.tqdm
+        original_add_word_timestamps = transcribe_module.add_word_timestamps
+
+        def tqdm(*args, **kwargs):
+            bar = getattr(_hooks, "bar", None)
+            return bar(*args, **kwargs) if bar else original_tqdm.tqdm(*args, **kwargs)
+
+        def add_word_timestamps(*, segments, **kwargs):
+            window = getattr(_hooks, "window", None)
+            if window is not None:
+                window[:] = [segments]
+            return original_add_word_timestamps(segments=segments, **kwargs)
+
+        transcribe_module.tqdm = SimpleNamespace(tqdm=tqdm)
+        transcribe_module.add_word_timestamps = add_word_timestamps
+        _installed = True
+
+
+@contextmanager
+def whisper_progress(callback, window_callback=None):
+    """
+    Report transcription progress (0..1) to callback while inside the block.
+    Whisper's segment loop advances a tqdm bar once per decoded window, so we
+    swap in a bar that forwards those updates instead of drawing them.
+
+    window_callback(seconds covered, segments) gets each window's finished
+    segments (transcribe with word_timestamps). Whisper passes them to
+    add_word_timestamps and then, once they are final, advances the bar, so
+    that call is wrapped to hold on to them until the bar moves. Both hooks
+    apply to transcriptions in the calling thread only.
+    """
+    if callback is None and window_callback is None:
+        yield
+        return
+
+    window = []
+
+    class ProgressBar:
+        def __init__(self, total=None, **kwargs):
+            self.total = total or 0
+            self.n = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def update(self, n=1):
+            self.n += n
+            if callback and self.total:
+                callback(min(1.0, self.n / self.total))
+            if window_callback and window:
+                window_callback(self.n / FRAMES_PER_SECOND, window.pop())
+
+    _install_hooks()
+    outer = getattr(_hooks, "bar", None), getattr(_hooks, "window", None)
+    _hooks.bar = ProgressBar
+    _hooks.window = window if window_callback else None
+    try:
+        yield
+    finally:
+        _hooks.bar, _hooks.window = outer
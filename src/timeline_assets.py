@@ -0,0 +1,120 @@
+"""
+Thumbnail strip and audio waveform for the trim timeline.
+
+Both are built once per upload and stored next to its probe and decoded
+audio in the media cache. Thumbnails are taken from keyframes only: every
+tile is its own input seeked to the keyframe before its timestamp, so a
+strip costs a handful of keyframe decodes even for hour-long inputs.
+"""
+import os
+import uuid
+
+import numpy as np
+
+from ffmpeg_tools import run_ffmpeg
+from media_cache import entry_dir, load_audio, probe_media
+
+THUMB_COUNT = 16
+THUMB_HEIGHT = 90
+WAVEFORM_BINS = 1000
+
+
+def thumbnail_times(duration, count=THUMB_COUNT):
+    """Tile timestamps: the middle of each of count equal slices."""
+    return [(i + 0.5) / count * duration for i in range(count)]
+
+
+def thumbnail_layout(path, count=THUMB_COUNT, height=THUMB_HEIGHT):
+    """Tile size and timestamps of the strip for path (from the probe only)."""
+    probe = probe_media(path)
+    aspect = probe["width"] / probe["height"] if probe["height"] else 16 / 9
+    width = max(2, int(round(height * aspect / 2)) * 2)
+    return {
+        "count": count,
+        "tile_width": width,
+        "tile_height": height,
+        "times": [round(t, 3) for t in thumbnail_times(probe["duration"], count)],
+    }
+
+
+def _atomic_write(target, write):
+    tmp_path = f"{target}.{uuid.uuid4().hex}.tmp{os.path.splitext(target)[1]}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return target
+
+
+def thumbnail_strip(path, count=THUMB_COUNT, height=THUMB_HEIGHT):
+    """
+    JPEG sprite sheet of count tiles laid out left to right; built once per
+    content hash. Returns the path of the sheet.
+    """
+    layout = thumbnail_layout(path, count, height)
+    sheet_path = os.path.join(entry_dir(path), f"thumbs_{count}x{height}.jpg")
+    if os.path.exists(sheet_path):
+        os.utime(os.path.dirname(sheet_path))
+        return sheet_path
+
+    args, filters = [], []
+    for i, t in enumerate(layout["times"]):
+        # Decode keyframes only and take the one at or before t
+        args += ["-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{t:.3f}", "-i", path]
+        filters.append(
+            f"[{i}:v:0]scale={layout['tile_width']}:{height},setsar=1[t{i}]"
+        )
+    if count > 1:
+        stack = "".join(f"[t{i}]" for i in range(count))
+        filters.append(f"{stack}hstack=inputs={count}")
+    else:
+        filters[0] = filters[0].replace("[t0]", "")
+    graph = ";".join(filters)
+
+    os.makedirs(os.path.dirname(sheet_path), exist_ok=True)
+    return _atomic_write(
+        sheet_path,
+        lambda tmp: run_ffmpeg(
+            args + ["-filter_complex", graph, "-frames:v", "1", "-q:v", "5", tmp]
+        ),
+    )
+
+
+def compute_peaks(audio, bins=WAVEFORM_BINS):
+    """
+    Peak absolute amplitude per bin, scaled to 0-255 (uint8). Inputs shorter
+    than bins samples get one bin per sample.
+    """
+    if len(audio) == 0:
+        return np.zeros(bins, dtype=np.uint8)
+    bins = min(bins, len(audio))
+    per_bin = len(audio) // bins
+    usable = np.abs(audio[: per_bin * bins]).reshape(bins, per_bin)
+    peaks = usable.max(axis=1)
+    return (np.clip(peaks, 0.0, 1.0) * 255).round().astype(np.uint8)
+
+
+def waveform_peaks(path, bins=WAVEFORM_BINS):
+    """
+    Path of a file holding the waveform as raw uint8 peaks (one byte per
+    bin), computed from the cached 16 kHz audio and kept with it.
+    """
+    peaks_path = os.path.join(entry_dir(path), f"peaks_{bins}.u8")
+    if os.path.exists(peaks_path):
+        os.utime(os.path.dirname(peaks_path))
+        return peaks_path
+    peaks = compute_peaks(load_audio(path), bins)
+    return _atomic_write(peaks_path, peaks.tofile)
+
+
+def waveform_layout(path, peaks_path):
+    """Bin count and duration per bin of a peaks file built for path."""
+    bins = os.path.getsize(peaks_path)
+    duration = probe_media(path)["duration"]
+    return {
+        "bins": bins,
+        "seconds_per_bin": round(duration / bins, 6) if bins else 0.0,
+        "format": "uint8",
+    }
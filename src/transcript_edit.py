@@ -2,33 +2,44 @@
 Text-based video edit model: compute cut ranges from deleted segment IDs,
 and re-render video by removing those ranges.
 """
-import json
-import os
-from moviepy import VideoFileClip, concatenate_videoclips
+import bisect
+import time
+from moviepy import concatenate_videoclips
+from artifact_store import cached_output
+from audio_analysis import find_pauses, pause_cuts
+from caption_render import CaptionRenderer
+from ffmpeg_render import ffmpeg_render
+from media_cache import load_audio, probe_media
+from metrics import count_file, span
+from overlay_captions import (
+    caption_style,
+    get_vtt_path,
+    overlay_captions,
+    render_key,
+)
+from render_profiles import get_backend, open_video, render_source, write_options
+from transcript_store import SEGMENT_TYPES, Transcript, find_transcript, load_transcript
+from vtt import load_captions
 
 
-def load_transcript(transcript_path):
-    with open(transcript_path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def get_transcript_path(video_path):
-    base, _ = os.path.splitext(video_path)
-    return f"{base}_transcript.json"
-
-
-def compute_cut_ranges(segments, deleted_ids):
+def compute_cut_ranges(segments, deleted_ids, extra_ranges=()):
     """
-    Given the list of segments (each with id, start, end) and a set of
-    deleted segment IDs, return a list of (start, end) ranges to remove
-    from the video. Overlapping or adjacent ranges are merged so we do
-    one contiguous cut per region.
+    Given the segments (a list of dicts with id, start, end, or a
+    transcript_store.Transcript) and a set of deleted segment IDs, return a
+    list of (start, end) ranges to remove from the video. extra_ranges are
+    (start, end) cuts that aren't whole segments (e.g. from suggest_cuts).
+    Overlapping or adjacent ranges are merged so we do one contiguous cut
+    per region.
     """
     deleted_set = set(deleted_ids)
-    to_remove = []
-    for seg in segments:
-        if seg["id"] in deleted_set:
-            to_remove.append((seg["start"], seg["end"]))
+    if isinstance(segments, Transcript):
+        to_remove = segments.ranges_for(deleted_set)
+    else:
+        to_remove = []
+        for seg in segments:
+            if seg["id"] in deleted_set:
+                to_remove.append((seg["start"], seg["end"]))
+    to_remove += [(start, end) for start, end in extra_ranges if end > start]
 
     if not to_remove:
         return []
@@ -44,6 +55,37 @@ def compute_cut_ranges(segments, deleted_ids):
     return [tuple(r) for r in merged]
 
 
+def suggest_cuts(
+    video_path,
+    max_pause_seconds=0.6,
+    keep_pause_seconds=0.2,
+    padding_seconds=0.05,
+):
+    """
+    Cut ranges that shorten the long pauses of video_path (see
+    audio_analysis.pause_cuts), plus the pauses they came from. Pauses are
+    found in the cached 16 kHz audio; the words of the edit transcript, when
+    there is one, are never cut into.
+    """
+    word_starts = word_ends = ()
+    transcript_path = find_transcript(video_path)
+    if transcript_path is not None:
+        transcript = load_transcript(transcript_path)
+        words = transcript.types == SEGMENT_TYPES.index("word")
+        word_starts, word_ends = transcript.starts[words], transcript.ends[words]
+
+    with span("cut_suggestions"):
+        pause_starts, pause_ends = find_pauses(load_audio(video_path), word_starts, word_ends)
+        cuts = pause_cuts(
+            pause_starts, pause_ends, max_pause_seconds, keep_pause_seconds, padding_seconds
+        )
+    pauses = [
+        (round(start, 3), round(end, 3))
+        for start, end in zip(pause_starts.tolist(), pause_ends.tolist())
+    ]
+    return cuts, pauses
+
+
 def ranges_to_keep(cut_ranges, duration):
     """
     Invert cut ranges into keep ranges: [(0, duration)] minus cut_ranges.
@@ -62,12 +104,47 @@ def ranges_to_keep(cut_ranges, duration):
     return keep
 
 
-def render_video_with_cuts(video_path, output_path, cut_ranges):
+def render_video_with_cuts(
+    video_path, output_path, cut_ranges, logger="bar", profile=None, backend=None
+):
     """
     Write a new video that has the given ranges removed (audio and video).
     Keep the source clip open until we finish writing, so subclips stay valid.
     """
-    full = VideoFileClip(video_path)
+    source = render_source(video_path, profile)
+    render = _render_cuts_ffmpeg if get_backend(backend) == "ffmpeg" else _render_cuts
+    return cached_output(
+        "render",
+        render_key(
+            video_path,
+            cut_ranges,
+            with_captions=False,
+            profile=profile,
+            source=source,
+            backend=backend,
+        ),
+        output_path,
+        lambda: render(video_path, output_path, cut_ranges, logger, profile, source),
+    )
+
+
+def _keep_ranges(video_path, cut_ranges):
+    keep = ranges_to_keep(cut_ranges, float(probe_media(video_path)["duration"]))
+    if not keep:
+        raise ValueError("All video would be cut; nothing to keep")
+    return keep
+
+
+def _render_cuts_ffmpeg(video_path, output_path, cut_ranges, logger, profile, source):
+    keep = _keep_ranges(video_path, cut_ranges)
+    with span("render_cuts"):
+        ffmpeg_render(video_path, output_path, source, keep=keep, profile=profile)
+    count_file("written", "render", output_path)
+    return output_path
+
+
+def _render_cuts(video_path, output_path, cut_ranges, logger, profile, source):
+    full = open_video(video_path, profile, source)
     try:
         duration = float(full.duration)
         keep = ranges_to_keep(cut_ranges, duration)
@@ -77,7 +154,9 @@ def render_video_with_cuts(video_path, output_path, cut_ranges):
         clips = [full.subclipped(start, end) for start, end in keep]
         concat = concatenate_videoclips(clips)
         try:
-            concat.write_videofile(output_path, codec="libx264", audio_codec="aac")
+            with span("render_cuts"):
+                concat.write_videofile(output_path, logger=logger, **write_options(profile))
+            count_file("written", "render", output_path)
         finally:
             concat.close()
             for c in clips:
@@ -85,3 +164,127 @@ def render_video_with_cuts(video_path, output_path, cut_ranges):
     finally:
         full.close()
     return output_path
+
+
+def remap_captions(captions, keep):
+    """
+    Map captions from source time onto the output timeline formed by
+    concatenating the keep ranges. A caption overlapping a cut is clipped to
+    the kept parts; pieces that end up back to back are joined again.
+    """
+    keep_starts = [start for start, _ in keep]
+    out_offsets = []
+    t = 0.0
+    for start, end in keep:
+        out_offsets.append(t)
+        t += end - start
+
+    remapped = []
+    for caption in captions:
+        i = max(0, bisect.bisect_right(keep_starts, caption["start"]) - 1)
+        while i < len(keep) and keep[i][0] < caption["end"]:
+            keep_start, keep_end = keep[i]
+            start = max(caption["start"], keep_start)
+            end = min(caption["end"], keep_end)
+            if end - start > 0.001:
+                out_start = out_offsets[i] + (start - keep_start)
+                out_end = out_offsets[i] + (end - keep_start)
+                prev = remapped[-1] if remapped else None
+                if (
+                    prev is not None
+                    and prev["text"] == caption["text"]
+                    and prev["highlighted_word_line"] == caption["highlighted_word_line"]
+                    and abs(prev["end"] - out_start) < 0.001
+                ):
+                    prev["end"] = out_end
+                else:
+                    remapped.append({**caption, "start": out_start, "end": out_end})
+            i += 1
+    return remapped
+
+
+def render_captioned_video_with_cuts(
+    video_path, output_path, cut_ranges, logger="bar", profile=None, backend=None
+):
+    """
+    Single-pass edit render: cut the source down to its keep ranges, lay the
+    (remapped) captions over the result and encode once.
+    """
+    source = render_source(video_path, profile)
+    if get_backend(backend) == "ffmpeg":
+        render = _render_captioned_cuts_ffmpeg
+    else:
+        render = _render_captioned_cuts
+    return cached_output(
+        "render",
+        render_key(video_path, cut_ranges, profile=profile, source=source, backend=backend),
+        output_path,
+        lambda: render(video_path, output_path, cut_ranges, logger, profile, source),
+    )
+
+
+def _render_captioned_cuts_ffmpeg(video_path, output_path, cut_ranges, logger, profile, source):
+    keep = _keep_ranges(video_path, cut_ranges)
+    ffmpeg_render(
+        video_path,
+        output_path,
+        source,
+        keep=keep,
+        captions=remap_captions(load_captions(get_vtt_path(video_path)), keep),
+        style=caption_style(*source[1]),
+        profile=profile,
+    )
+    count_file("written", "render", output_path)
+    return output_path
+
+
+def _render_captioned_cuts(video_path, output_path, cut_ranges, logger, profile, source):
+    full = open_video(video_path, profile, source)
+    try:
+        duration = float(full.duration)
+        keep = ranges_to_keep(cut_ranges, duration)
+        if not keep:
+            raise ValueError("All video would be cut; nothing to keep")
+
+        video_width, video_height = full.size
+        captions = remap_captions(load_captions(get_vtt_path(video_path)), keep)
+        renderer = CaptionRenderer(
+            captions, caption_style(video_width, video_height), full.size
+        )
+
+        clips = [full.subclipped(start, end) for start, end in keep]
+        concat = concatenate_videoclips(clips)
+        final_video = concat.transform(renderer)
+        try:
+            start = time.perf_counter()
+            final_video.write_videofile(
+                output_path, logger=logger, **write_options(profile)
+            )
+            renderer.record_timings(time.perf_counter() - start)
+            count_file("written", "render", output_path)
+        finally:
+            final_video.close()
+            concat.close()
+            for c in clips:
+                c.close()
+    finally:
+        full.close()
+    return output_path
+
+
+def render_edited_video(
+    video_path, output_path, cut_ranges, logger="bar", profile=None, backend=None
+):
+    """
+    Render the captioned video with cut_ranges removed, in a single encode.
+    """
+    if not cut_ranges:
+        # No deletions: output full captioned video (same as reprocess)
+        overlay_captions(
+            video_path, output_path, logger=logger, profile=profile, backend=backend
+        )
+        return output_path
+
+    return render_captioned_video_with_cuts(
+        video_path, output_path, cut_ranges, logger=logger, profile=profile, backend=backend
+    )
@@ -0,0 +1,281 @@
+"""
+Columnar storage for the word-level edit transcript.
+
+A transcript (words and silences, each with id, type, text, start, end) is
+written as parallel arrays instead of a JSON list of dicts: a magic line,
+a small JSON header, then the id, type, start, end and text-offset columns
+and the UTF-8 text of all segments back to back. Columns are memory-mapped
+when loaded, so opening a multi-hour transcript is cheap and a time-window
+query only touches the pages it returns.
+
+Loaded transcripts are cached per file, keyed by mtime and size. Uploads
+captioned before this format still have a <name>_transcript.json, which is
+read the same way.
+
+The segments the user marked for removal are kept next to the transcript in
+<name>_edits.json, so the client can send changes to that set rather than
+the whole list. The same file holds cut ranges that aren't whole segments,
+such as pauses shortened by the cut suggestions.
+"""
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import count_cache
+
+MAGIC = b"AUTOCAPTION-TRANSCRIPT 1\n"
+ALIGN = 8
+SEGMENT_TYPES = ("word", "silence")
+COLUMNS = (
+    ("ids", "<i8"),
+    ("types", "u1"),
+    ("starts", "<f8"),
+    ("ends", "<f8"),
+    ("text_offsets", "<i8"),
+    ("text", "u1"),
+)
+
+CACHED_FILES = 16
+
+_loaded = OrderedDict()  # abs path -> ((mtime_ns, size), Transcript)
+_lock = threading.Lock()
+_edits_lock = threading.Lock()
+
+
+def transcript_path(video_path, output_dir=None):
+    """Where the columnar transcript of video_path is (or will be) written."""
+    base = os.path.splitext(video_path)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return f"{base}_transcript.bin"
+
+
+def legacy_transcript_path(video_path):
+    return f"{os.path.splitext(video_path)[0]}_transcript.json"
+
+
+def edits_path(video_path, output_dir=None):
+    base = os.path.splitext(video_path)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return f"{base}_edits.json"
+
+
+def find_transcript(video_path):
+    """Path of video_path's transcript in either format, or None."""
+    for path in (transcript_path(video_path), legacy_transcript_path(video_path)):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class Transcript:
+    """An edit transcript as parallel numpy columns (see the module docstring)."""
+
+    def __init__(self, duration, ids, types, starts, ends, text_offsets, text):
+        self.duration = duration
+        self.ids = ids
+        self.types = types
+        self.starts = starts
+        self.ends = ends
+        self.text_offsets = text_offsets
+        self.text = text
+        self._max_ends = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_segments(cls, segments, duration):
+        encoded = [seg["text"].encode("utf-8") for seg in segments]
+        text_offsets = np.zeros(len(segments) + 1, dtype="<i8")
+        np.cumsum([len(text) for text in encoded], out=text_offsets[1:])
+        return cls(
+            float(duration),
+            np.array([seg["id"] for seg in segments], dtype="<i8"),
+            np.array([SEGMENT_TYPES.index(seg["type"]) for seg in segments], dtype="u1"),
+            np.array([seg["start"] for seg in segments], dtype="<f8"),
+            np.array([seg["end"] for seg in segments], dtype="<f8"),
+            text_offsets,
+            np.frombuffer(b"".join(encoded), dtype="u1"),
+        )
+
+    def segments(self, lo=0, hi=None):
+        """Segment dicts for rows lo..hi, as in the JSON transcript."""
+        hi = len(self) if hi is None else hi
+        if hi <= lo:
+            return []
+        offsets = self.text_offsets[lo:hi + 1].tolist()
+        blob = self.text[offsets[0]:offsets[-1]].tobytes()
+        base = offsets[0]
+        return [
+            {
+                "id": seg_id,
+                "type": SEGMENT_TYPES[seg_type],
+                "text": blob[offsets[i] - base:offsets[i + 1] - base].decode("utf-8"),
+                "start": start,
+                "end": end,
+            }
+            for i, (seg_id, seg_type, start, end) in enumerate(
+                zip(
+                    self.ids[lo:hi].tolist(),
+                    self.types[lo:hi].tolist(),
+                    self.starts[lo:hi].tolist(),
+                    self.ends[lo:hi].tolist(),
+                )
+            )
+        ]
+
+    def window(self, start=None, end=None):
+        """(lo, hi) rows of the segments overlapping start..end seconds."""
+        lo, hi = 0, len(self)
+        if start is not None:
+            if self._max_ends is None:
+                self._max_ends = np.maximum.accumulate(self.ends) if len(self) else self.ends
+            lo = int(np.searchsorted(self._max_ends, start, side="right"))
+        if end is not None:
+            hi = int(np.searchsorted(self.starts, end, side="left"))
+        return lo, max(lo, hi)
+
+    def ranges_for(self, deleted_ids):
+        """(start, end) of every segment whose id is in deleted_ids."""
+        if not len(deleted_ids) or not len(self):
+            return []
+        mask = np.isin(self.ids, np.fromiter(deleted_ids, dtype="<i8"))
+        return list(zip(self.starts[mask].tolist(), self.ends[mask].tolist()))
+
+
+def write_transcript(path, segments, duration):
+    """Write segment dicts to path in the columnar format."""
+    transcript = Transcript.from_segments(segments, duration)
+    columns = {name: getattr(transcript, name) for name, _ in COLUMNS}
+
+    layout = {}
+    offset = 0
+    for name, dtype in COLUMNS:
+        layout[name] = [offset, dtype, len(columns[name])]
+        offset += -(-columns[name].nbytes // ALIGN) * ALIGN
+    header = json.dumps({"duration": transcript.duration, "columns": layout}).encode()
+    data_start = len(MAGIC) + 8 + len(header)
+    data_start += -data_start % ALIGN
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", data_start))
+        f.write(header)
+        for name, _ in COLUMNS:
+            f.seek(data_start + layout[name][0])
+            f.write(columns[name].tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_columnar(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a transcript file: {path}")
+        (data_start,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(data_start - len(MAGIC) - 8).rstrip(b"\0"))
+    columns = {}
+    for name, (offset, dtype, length) in header["columns"].items():
+        if length:
+            columns[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=data_start + offset, shape=(length,)
+            )
+        else:
+            columns[name] = np.zeros(0, dtype=dtype)
+    return Transcript(header["duration"], **columns)
+
+
+def _read_legacy(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return Transcript.from_segments(data.get("segments", []), data.get("duration", 0.0))
+
+
+def load_transcript(path):
+    """Transcript stored at path (columnar or legacy JSON), cached per file version."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        entry = _loaded.get(path)
+        if entry is not None and entry[0] == version:
+            _loaded.move_to_end(path)
+            count_cache("transcript_file", True)
+            return entry[1]
+
+    count_cache("transcript_file", False)
+    if path.endswith(".json"):
+        transcript = _read_legacy(path)
+    else:
+        transcript = _read_columnar(path)
+    with _lock:
+        _loaded[path] = (version, transcript)
+        _loaded.move_to_end(path)
+        while len(_loaded) > CACHED_FILES:
+            _loaded.popitem(last=False)
+    return transcript
+
+
+def _read_edits(video_path):
+    try:
+        with open(edits_path(video_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_edits(video_path, edits):
+    path = edits_path(video_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(edits, f)
+    os.replace(tmp_path, path)
+
+
+def read_deleted_ids(video_path):
+    """Segment ids marked for removal in video_path's transcript (sorted)."""
+    return _read_edits(video_path).get("deleted_ids", [])
+
+
+def update_deleted_ids(video_path, add=(), remove=(), replace=None):
+    """
+    Apply a change to the stored deleted ids: replace the whole set, or add
+    and remove ids. Returns the new sorted list.
+    """
+    with _edits_lock:
+        edits = _read_edits(video_path)
+        deleted = set(edits.get("deleted_ids", []) if replace is None else replace)
+        deleted.update(add)
+        deleted.difference_update(remove)
+        edits["deleted_ids"] = sorted(deleted)
+        _write_edits(video_path, edits)
+    return edits["deleted_ids"]
+
+
+def read_cut_ranges(video_path):
+    """Stored [start, end] ranges to cut besides the deleted segments."""
+    return _read_edits(video_path).get("cut_ranges", [])
+
+
+def write_cut_ranges(video_path, cut_ranges):
+    """Replace the stored extra cut ranges (an empty list clears them)."""
+    with _edits_lock:
+        edits = _read_edits(video_path)
+        edits["cut_ranges"] = [[float(start), float(end)] for start, end in cut_ranges]
+        _write_edits(video_path, edits)
+    return edits["cut_ranges"]
+
+
+def clear_edits(video_path, output_dir=None):
+    """Forget the deleted ids (the transcript they referred to was replaced)."""
+    path = edits_path(video_path, output_dir)
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,20 +1,212 @@
 """
 Trim a video to a start and end time (in seconds). Used for the Trim stage.
+
+H.264 sources are trimmed without a full re-encode: the bulk of the range is
+stream-copied and only the partial GOPs at the edges are re-encoded
+("exact"), or the start is snapped back to the previous keyframe so nothing
+is re-encoded at all ("keyframe"). Anything else is re-encoded with the
+render backend (MoviePy or ffmpeg_render).
 """
-from moviepy import VideoFileClip
+import os
+import tempfile
+from ffmpeg_render import ffmpeg_render
+from ffmpeg_tools import parse_rate, probe_keyframes, probe_streams, run_ffmpeg
+from media_cache import get_duration, probe_media
+from metrics import count_file, span
+from render_profiles import get_backend, open_video, write_options
+
+TRIM_MODES = ("exact", "keyframe", "reencode")
+
+# ffprobe profile name -> libx264 -profile:v, so re-encoded edges match copied GOPs
+H264_PROFILES = {
+    "constrained baseline": "baseline",
+    "baseline": "baseline",
+    "main": "main",
+    "high": "high",
+}
+
+EPSILON = 0.001
 
 
 def get_video_duration(video_path):
-    with VideoFileClip(video_path) as clip:
-        return float(clip.duration)
+    return get_duration(video_path)
+
+
+def _seek_args(video_path, start, end):
+    return ["-ss", f"{start:.6f}", "-i", video_path, "-t", f"{end - start:.6f}"]
+
+
+def _stream_maps(audio):
+    return ["-map", "0:v:0"] + (["-map", "0:a:0"] if audio else [])
+
+
+def _encode_part(video_path, part_path, start, end, video, audio):
+    """Re-encode [start, end) with settings matching the source's copied GOPs."""
+    args = _seek_args(video_path, start, end) + _stream_maps(audio)
+    args += [
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-crf", "18",
+        "-pix_fmt", video.get("pix_fmt") or "yuv420p",
+    ]
+    profile = H264_PROFILES.get((video.get("profile") or "").lower())
+    if profile:
+        args += ["-profile:v", profile]
+    fps = parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate"))
+    if fps:
+        args += ["-r", f"{fps:.6f}"]
+    if audio:
+        args += ["-c:a", "aac", "-ar", str(audio.get("sample_rate", 48000))]
+        if audio.get("channels"):
+            args += ["-ac", str(audio["channels"])]
+    run_ffmpeg(args + ["-f", "mpegts", part_path])
+
+
+def _copy_part(video_path, part_path, start, end, audio):
+    """Stream-copy [start, end); start must be a keyframe."""
+    args = _seek_args(video_path, start, end) + _stream_maps(audio)
+    args += ["-c", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", part_path]
+    run_ffmpeg(args)
+
+
+def plan_exact_trim(keyframes, start_seconds, end_seconds, has_b_frames=False):
+    """
+    Split [start, end] into ("encode" | "copy", start, end) parts: the head up
+    to the first keyframe is re-encoded, keyframe-aligned GOPs are copied,
+    and with B-frames the tail after the last keyframe is re-encoded too
+    (a copied tail could reference frames past the cut).
+    """
+    body_start = next((k for k in keyframes if k >= start_seconds - EPSILON), None)
+    if body_start is None or body_start >= end_seconds - EPSILON:
+        # The whole range sits inside one GOP
+        return [("encode", start_seconds, end_seconds)]
+
+    body_end = end_seconds
+    if has_b_frames:
+        body_end = max(
+            (k for k in keyframes if body_start < k <= end_seconds), default=end_seconds
+        )
 
+    parts = []
+    if body_start - start_seconds > EPSILON:
+        parts.append(("encode", start_seconds, body_start))
+    parts.append(("copy", body_start, body_end))
+    if end_seconds - body_end > EPSILON:
+        parts.append(("encode", body_end, end_seconds))
+    return parts
 
-def trim_video(video_path, output_path, start_seconds, end_seconds):
+
+def stream_copy_trim(video_path, output_path, start_seconds, end_seconds, exact=True):
+    """
+    Trim without decoding the bulk of the range. Raises ValueError when the
+    source can't be stream-copied (not H.264, non-AAC audio, no keyframes).
+    """
+    info = probe_streams(video_path)
+    video, audio = info["video"], info["audio"]
+    if video is None or video.get("codec_name") != "h264":
+        raise ValueError("stream-copy trim needs an H.264 video stream")
+    if audio is not None and audio.get("codec_name") != "aac":
+        raise ValueError("stream-copy trim needs AAC audio")
+
+    keyframes = probe_keyframes(video_path, start_seconds, end_seconds)
+    if not keyframes:
+        raise ValueError("no keyframes found in range")
+
+    if not exact:
+        # Snap the start back to the previous keyframe and copy everything
+        snapped = max((k for k in keyframes if k <= start_seconds + EPSILON), default=None)
+        if snapped is None:
+            raise ValueError("no keyframe at or before start")
+        run_ffmpeg(
+            _seek_args(video_path, snapped, end_seconds)
+            + _stream_maps(audio)
+            + [
+                "-c", "copy",
+                "-avoid_negative_ts", "make_zero",
+                "-movflags", "+faststart",
+                output_path,
+            ]
+        )
+        return output_path
+
+    parts = plan_exact_trim(
+        keyframes,
+        start_seconds,
+        end_seconds,
+        has_b_frames=int(video.get("has_b_frames") or 0) > 0,
+    )
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+        # MPEG-TS parts carry SPS/PPS in-band, so re-encoded and copied GOPs
+        # can be joined even though their encoder settings differ.
+        part_paths = []
+        for i, (kind, start, end) in enumerate(parts):
+            part_path = os.path.join(tmp, f"part{i}.ts")
+            if kind == "copy":
+                _copy_part(video_path, part_path, start, end, audio)
+            else:
+                _encode_part(video_path, part_path, start, end, video, audio)
+            part_paths.append(part_path)
+
+        args = ["-i", "concat:" + "|".join(part_paths), "-map", "0", "-c", "copy"]
+        if audio:
+            args += ["-bsf:a", "aac_adtstoasc"]
+        run_ffmpeg(args + ["-movflags", "+faststart", output_path])
+    return output_path
+
+
+def trim_video(
+    video_path,
+    output_path,
+    start_seconds,
+    end_seconds,
+    logger="bar",
+    mode="exact",
+    profile=None,
+    backend=None,
+):
     """
     Write a new video containing only the segment from start_seconds to end_seconds.
+    mode is one of TRIM_MODES; the stream-copy modes fall back to a full
+    re-encode when the source can't be copied. A re-encode uses the render
+    profile's encoder settings but keeps the source resolution, since the
+    trimmed file is the source for every later stage.
     """
-    with VideoFileClip(video_path) as clip:
+    if mode not in TRIM_MODES:
+        raise ValueError(f"mode must be one of {TRIM_MODES}")
+
+    if mode != "reencode":
+        try:
+            with span(f"trim_{mode}"):
+                stream_copy_trim(
+                    video_path,
+                    output_path,
+                    start_seconds,
+                    end_seconds,
+                    exact=(mode == "exact"),
+                )
+            count_file("written", "trim", output_path)
+            return output_path
+        except (ValueError, RuntimeError, FileNotFoundError) as e:
+            print(f"Stream-copy trim not possible ({e}); re-encoding")
+
+    probe = probe_media(video_path)
+    source = (video_path, (probe["width"], probe["height"]))
+    if get_backend(backend) == "ffmpeg":
+        with span("trim_reencode"):
+            ffmpeg_render(
+                video_path,
+                output_path,
+                source,
+                keep=[(start_seconds, end_seconds)],
+                profile=profile,
+            )
+        count_file("written", "trim", output_path)
+        return output_path
+
+    with span("trim_reencode"), open_video(video_path, source=source) as clip:
         sub = clip.subclipped(start_seconds, end_seconds)
-        sub.write_videofile(output_path, codec="libx264", audio_codec="aac")
+        sub.write_videofile(output_path, logger=logger, **write_options(profile))
         sub.close()
+    count_file("written", "trim", output_path)
     return output_path
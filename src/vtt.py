@@ -0,0 +1,167 @@
+"""
+Streaming WebVTT parser.
+
+Cues are read block by block (blank-line separated) straight from the file
+and turned into compact Cue records with numeric start/end times, the plain
+caption text and its word-highlight line: the text with everything outside
+<u>...</u> blanked to spaces, so both lines line up character for character
+when drawn centered in a monospace font. The WEBVTT header, NOTE, STYLE and
+REGION blocks and cue identifiers are skipped rather than read as text.
+
+parse_vtt keeps the parsed cues per file, keyed by mtime and size, so
+re-rendering after an unrelated change does not parse the VTT again.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from metrics import count_cache
+
+TIMESTAMP = r"(?:(\d+):)?(\d+):(\d+)(?:[.,](\d+))?"
+TIMESTAMP_RE = re.compile(f"^{TIMESTAMP}$")
+TIMING_RE = re.compile(f"^{TIMESTAMP}\\s+-->\\s+{TIMESTAMP}")
+TAG_RE = re.compile(r"<(/?)([^>\s]*)[^>]*>")
+SKIPPED_BLOCKS = ("WEBVTT", "NOTE", "STYLE", "REGION")
+
+CACHED_FILES = 64
+
+_parsed = OrderedDict()  # abs path -> ((mtime_ns, size), cues)
+_lock = threading.Lock()
+
+
+class Cue:
+    """One caption: start/end in seconds, text and its highlight line."""
+
+    __slots__ = ("start", "end", "text", "highlighted_word_line")
+
+    def __init__(self, start, end, text, highlighted_word_line):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.highlighted_word_line = highlighted_word_line
+
+    def as_dict(self):
+        return {
+            "start": self.start,
+            "end": self.end,
+            "text": self.text,
+            "highlighted_word_line": self.highlighted_word_line,
+        }
+
+
+def time_to_seconds(timestamp):
+    """Seconds for an hh:mm:ss.ttt or mm:ss.ttt timestamp."""
+    match = TIMESTAMP_RE.match(timestamp)
+    if match is None:
+        raise ValueError(f"Invalid timestamp format: {timestamp}")
+    return _seconds(*match.groups())
+
+
+def _seconds(h, m, s, fraction):
+    seconds = int(h or 0) * 3600 + int(m) * 60 + int(s)
+    if fraction:
+        seconds += int(fraction) / 10 ** len(fraction)
+    return seconds
+
+
+def split_highlights(line):
+    """
+    (text, highlight) for one line of cue payload: the text without markup,
+    and the same text with every character outside <u> tags turned into a
+    space.
+    """
+    if "<" not in line:
+        text = line.strip()
+        return text, " " * len(text)
+
+    # split() gives [run, slash, tag name, run, slash, tag name, run, ...]
+    parts = TAG_RE.split(line)
+    highlight = [" " * len(parts[0])]
+    underlined = False
+    for i in range(1, len(parts), 3):
+        if parts[i + 1].lower() == "u":
+            underlined = not parts[i]
+        run = parts[i + 2]
+        highlight.append(run if underlined else " " * len(run))
+
+    text = "".join(parts[0::3])
+    highlight = "".join(highlight)
+    # Strip both by the text's own padding so they stay the same length
+    left = len(text) - len(text.lstrip())
+    right = len(text.rstrip())
+    return text[left:right], highlight[left:right]
+
+
+def _cue_from_block(block):
+    """Cue for one block of stripped lines, or None if it isn't a cue."""
+    first = block[0]
+    if first.startswith(SKIPPED_BLOCKS) and first.split(None, 1)[0] in SKIPPED_BLOCKS:
+        return None
+    # Anything before the timing line is the cue identifier
+    for i, line in enumerate(block):
+        timing = TIMING_RE.match(line)
+        if timing is not None:
+            break
+    else:
+        return None
+
+    payload = block[i + 1:]
+    if len(payload) == 1:
+        text, highlight = split_highlights(payload[0])
+    else:
+        lines = [split_highlights(line) for line in payload]
+        lines = [pair for pair in lines if pair[0]]
+        text = " ".join(text for text, _ in lines)
+        highlight = " ".join(highlight for _, highlight in lines)
+    if not text:
+        return None
+    times = timing.groups()
+    return Cue(_seconds(*times[:4]), _seconds(*times[4:]), text, highlight)
+
+
+def iter_cues(vtt_path):
+    """Yield the Cues of vtt_path in file order, reading it line by line."""
+    with open(vtt_path, "r", encoding="utf-8-sig") as file:
+        block = []
+        for line in file:
+            line = line.strip()
+            if line:
+                block.append(line)
+                continue
+            if block:
+                cue = _cue_from_block(block)
+                if cue is not None:
+                    yield cue
+                block = []
+        if block:
+            cue = _cue_from_block(block)
+            if cue is not None:
+                yield cue
+
+
+def parse_vtt(vtt_path):
+    """All Cues of vtt_path, parsed once per version of the file."""
+    path = os.path.abspath(vtt_path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        entry = _parsed.get(path)
+        if entry is not None and entry[0] == version:
+            _parsed.move_to_end(path)
+            count_cache("vtt", True)
+            return entry[1]
+
+    count_cache("vtt", False)
+    cues = tuple(iter_cues(path))
+    with _lock:
+        _parsed[path] = (version, cues)
+        _parsed.move_to_end(path)
+        while len(_parsed) > CACHED_FILES:
+            _parsed.popitem(last=False)
+    return cues
+
+
+def load_captions(vtt_file_path):
+    """Parse a VTT file into caption dicts with start/end in seconds."""
+    return [cue.as_dict() for cue in parse_vtt(vtt_file_path)]